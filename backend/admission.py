@@ -0,0 +1,432 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import itertools
+import contextvars
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+# 是否启用准入控制（各阶段并发预算、按客户端限流、优先级排队）
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+# 同时处理的HTTP请求数上限（不含WebSocket会话和音频下载），0为不限制
+ADMISSION_MAX_REQUESTS = int(os.environ.get("ADMISSION_MAX_REQUESTS", "64"))
+# 各阶段的并发预算，格式 "stage:数量"，0为不限制
+ADMISSION_STAGE_LIMITS = os.environ.get("ADMISSION_STAGE_LIMITS", "stt:8,llm:32,tts:16")
+# 各优先级可以使用的预算比例，低优先级留出余量给交互式请求
+ADMISSION_SHARES = os.environ.get("ADMISSION_SHARES", "interactive:1.0,standard:0.8,batch:0.5")
+# 各优先级等待阶段预算的最长时间（毫秒），超时返回503
+ADMISSION_QUEUE_TIMEOUT_MS = os.environ.get(
+    "ADMISSION_QUEUE_TIMEOUT_MS", "interactive:2000,standard:1000,batch:30000")
+# 每个阶段最多排队的请求数（相对并发预算的倍数），排满后直接拒绝
+ADMISSION_QUEUE_FACTOR = float(os.environ.get("ADMISSION_QUEUE_FACTOR", "2"))
+# 每个客户端（API key或IP）每秒补充的令牌数和令牌桶容量，RATE_LIMIT_RPS为0时不限流
+RATE_LIMIT_RPS = float(os.environ.get("RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "20"))
+# 是否信任 X-Forwarded-For（部署在反向代理之后时开启）
+ADMISSION_TRUST_FORWARDED = os.environ.get("ADMISSION_TRUST_FORWARDED", "false").lower() == "true"
+# 最多保留多少个客户端的令牌桶
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "10000"))
+
+# 优先级从高到低
+PRIORITIES = ("interactive", "standard", "batch")
+_PRIORITY_RANK = {name: rank for rank, name in enumerate(PRIORITIES)}
+
+# 需要准入控制的接口及其优先级，其余接口（音频下载、取消、统计等）不受限制
+ROUTE_PRIORITIES = {
+    "/ws/voice": "interactive",
+    "/api/chat": "interactive",
+    "/api/chat/audio/stream": "interactive",
+    "/api/chat/stream": "standard",
+    "/api/chat/text": "standard",
+    "/api/tts/stream": "standard",
+    # 只有提交批量任务的接口受限；查询进度、下载结果和取消任务不消耗限流令牌，轮询不会被429
+    "/api/batch/transcribe": "batch",
+    "/api/batch/synthesize": "batch",
+}
+
+# 当前请求的优先级，由中间件设置，回复生成和后台合成任务继承
+current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "admission_priority", default="standard")
+
+ADMISSION_REJECTED = counter(
+    "voicebot_admission_rejected_total", "Requests rejected by admission control", ("stage", "reason"))
+
+
+def _parse_map(text: str, cast: Callable[[str], Any]) -> Dict[str, Any]:
+    """解析 "name:value,name:value" 格式的配置"""
+    result = {}
+    for item in text.split(","):
+        if ":" in item:
+            name, value = item.split(":", 1)
+            result[name.strip()] = cast(value.strip())
+    return result
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝，调用方应返回 status_code 并带上 Retry-After"""
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 1,
+                 reason: str = "overload", stage: str = "request"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+        self.stage = stage
+
+    def to_response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=self.status_code,
+            content={"success": False, "error": str(self), "reason": self.reason, "stage": self.stage},
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class StageBudget:
+    """
+    一个阶段（识别、LLM、合成）的并发预算
+
+    低优先级只能使用预算的一部分；没有空闲名额时按优先级排队，名额释放后交给优先级最高、
+    最早到达的等待者。排队已满或等待超时直接拒绝，不让请求在过载时一直排队直到超时。
+    """
+
+    def __init__(self, name: str, limit: int, shares: Dict[str, float], queue_factor: float = ADMISSION_QUEUE_FACTOR):
+        self.name = name
+        self.limit = limit
+        self.shares = shares
+        self.max_queue = max(1, int(math.ceil(limit * queue_factor))) if limit > 0 else 0
+        self.in_use = 0
+        # (优先级序号, 到达顺序, future, 优先级)
+        self._waiters: List[Tuple[int, int, asyncio.Future, str]] = []
+        self._order = itertools.count()
+        self.admitted: Counter = Counter()
+        self.rejected: Counter = Counter()
+        # 占用时长的EWMA（秒），用于估算Retry-After
+        self.avg_hold = 0.0
+
+    def capacity(self, priority: str) -> int:
+        return max(1, int(self.limit * self.shares.get(priority, 1.0)))
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[2].done())
+
+    def retry_after(self) -> int:
+        """按平均占用时长和排队长度估算多久后可能有空闲名额"""
+        if self.limit <= 0:
+            return 1
+        return max(1, math.ceil(self.avg_hold * (self.queued + 1) / self.limit))
+
+    def _prune(self):
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+    def _reject(self, priority: str, reason: str, message: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(self.name, reason)
+        return AdmissionRejected(message, 503, self.retry_after(), reason, self.name)
+
+    async def acquire(self, priority: str, timeout: float):
+        """
+        获取一个名额
+
+        Raises:
+            AdmissionRejected: 排队已满或等待超时
+        """
+        rank = _PRIORITY_RANK.get(priority, len(PRIORITIES))
+        self._prune()
+        # 同等或更高优先级已有人排队时不插队
+        ahead = self._waiters and self._waiters[0][0] <= rank
+        if self.limit <= 0 or (not ahead and self.in_use < self.capacity(priority)):
+            self.in_use += 1
+            self.admitted[priority] += 1
+            return
+        if timeout <= 0 or self.queued >= self.max_queue:
+            raise self._reject(priority, "queue_full", f"{self.name}服务繁忙，请稍后重试")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (rank, next(self._order), future, priority))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时刚好拿到了名额
+                self.release()
+            raise self._reject(priority, "timeout", f"{self.name}服务繁忙，排队超时，请稍后重试")
+        except asyncio.CancelledError:
+            # 名额已经交给了这个等待者，但调用方放弃了
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self.admitted[priority] += 1
+
+    def release(self, held: Optional[float] = None):
+        self.in_use -= 1
+        if held is not None:
+            self.avg_hold = held if self.avg_hold == 0 else 0.8 * self.avg_hold + 0.2 * held
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            _, _, future, priority = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            # 队首无法获得名额时，优先级更低的等待者可用的预算更少，也无法获得
+            if self.in_use >= self.capacity(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.in_use += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "avg_hold_ms": round(self.avg_hold * 1000, 1),
+        }
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """取出令牌，成功返回0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    准入控制
+
+    - 入口：按客户端（API key或IP）的令牌桶限流（429），按优先级限制同时处理的请求数（503）
+    - 阶段：识别、LLM、合成各自的并发预算，交互式语音优先于批量请求
+    过载时尽早拒绝并返回 Retry-After，已接受的请求可以在正常的延迟内完成。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = ADMISSION_ENABLED,
+        max_requests: int = ADMISSION_MAX_REQUESTS,
+        stage_limits: Optional[Dict[str, int]] = None,
+        shares: Optional[Dict[str, float]] = None,
+        queue_timeouts: Optional[Dict[str, float]] = None,
+        rate: float = RATE_LIMIT_RPS,
+        burst: int = RATE_LIMIT_BURST,
+    ):
+        """
+        Args:
+            enabled (bool): 是否启用
+            max_requests (int): 同时处理的HTTP请求数上限，0为不限制
+            stage_limits (Dict[str, int]): 各阶段的并发预算
+            shares (Dict[str, float]): 各优先级可以使用的预算比例
+            queue_timeouts (Dict[str, float]): 各优先级等待阶段预算的最长时间（毫秒）
+            rate (float): 每个客户端每秒补充的令牌数，0为不限流
+            burst (int): 令牌桶容量
+        """
+        self.enabled = enabled
+        self.max_requests = max_requests
+        self.shares = shares if shares is not None else _parse_map(ADMISSION_SHARES, float)
+        limits = stage_limits if stage_limits is not None else _parse_map(ADMISSION_STAGE_LIMITS, int)
+        self.stages = {name: StageBudget(name, limit, self.shares) for name, limit in limits.items()}
+        self.queue_timeouts = queue_timeouts if queue_timeouts is not None else _parse_map(
+            ADMISSION_QUEUE_TIMEOUT_MS, float)
+        self.rate = rate
+        self.burst = burst
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.in_flight: Counter = Counter()
+        self.admitted: Counter = Counter()
+        self.rejected: Counter = Counter()
+
+    @staticmethod
+    def classify(path: str, headers: Dict[str, str]) -> Optional[str]:
+        """
+        请求的优先级，不需要准入控制的接口返回None
+
+        客户端可以通过 X-Priority 请求头降低（不能提高）优先级，如批量调用文本接口时声明 batch。
+        """
+        priority = ROUTE_PRIORITIES.get(path)
+        if priority is None:
+            return None
+        requested = headers.get("x-priority", "").strip().lower()
+        if requested in _PRIORITY_RANK and _PRIORITY_RANK[requested] > _PRIORITY_RANK[priority]:
+            return requested
+        return priority
+
+    @staticmethod
+    def client_key(scope: Dict[str, Any], headers: Dict[str, str]) -> str:
+        """限流使用的客户端标识：API key（只保存摘要）或客户端IP"""
+        api_key = headers.get("x-api-key")
+        authorization = headers.get("authorization", "")
+        if not api_key and authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        if ADMISSION_TRUST_FORWARDED and headers.get("x-forwarded-for"):
+            return "ip:" + headers["x-forwarded-for"].split(",")[0].strip()
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    def check_rate(self, client: str, priority: str):
+        """
+        按客户端令牌桶限流
+
+        Raises:
+            AdmissionRejected: 超过限流（429）
+        """
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > ADMISSION_MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take()
+        if wait > 0:
+            self.rejected["rate_limited"] += 1
+            ADMISSION_REJECTED.inc("request", "rate_limited")
+            raise AdmissionRejected(
+                "请求过于频繁，请稍后重试", 429, max(1, math.ceil(wait)), "rate_limited")
+
+    def enter(self, priority: str) -> Callable[[], None]:
+        """
+        登记一个进行中的HTTP请求，返回请求结束时调用的释放函数
+
+        Raises:
+            AdmissionRejected: 该优先级可用的请求名额已满（503）
+        """
+        if self.max_requests > 0:
+            total = sum(self.in_flight.values())
+            if total >= max(1, int(self.max_requests * self.shares.get(priority, 1.0))):
+                self.rejected["overload"] += 1
+                ADMISSION_REJECTED.inc("request", "overload")
+                raise AdmissionRejected("服务繁忙，请稍后重试", 503, 1, "overload")
+        self.in_flight[priority] += 1
+        self.admitted[priority] += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight[priority] -= 1
+
+        return release
+
+    async def acquire(self, stage: str, priority: Optional[str] = None) -> Callable[[], None]:
+        """
+        获取阶段名额，返回释放函数（可以重复调用）
+
+        Raises:
+            AdmissionRejected: 阶段排队已满或等待超时（503）
+        """
+        budget = self.stages.get(stage)
+        if not self.enabled or budget is None:
+            return lambda: None
+        priority = priority or current_priority.get()
+        await budget.acquire(priority, self.queue_timeouts.get(priority, 0) / 1000)
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                budget.release(time.monotonic() - started)
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self, stage: str, priority: Optional[str] = None):
+        """在阶段名额内执行代码块"""
+        release = await self.acquire(stage, priority)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_requests": self.max_requests,
+            "in_flight": {k: v for k, v in self.in_flight.items() if v},
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "rate_limit": {"rps": self.rate, "burst": self.burst, "clients": len(self._buckets)},
+            "stages": {name: budget.stats() for name, budget in self.stages.items()},
+        }
+
+
+class AdmissionMiddleware:
+    """
+    入口准入控制（ASGI中间件）
+
+    在请求进入接口之前完成限流和请求数检查，拒绝时直接返回429/503，不读取请求体、不占用识别和LLM资源；
+    通过后把优先级写入 current_priority，供各阶段的名额排队使用。WebSocket只在连接时限流，
+    被拒绝时以1013（稍后重试）关闭。
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] not in ("http", "websocket")
+            or not self.controller.enabled
+            or scope.get("method") == "OPTIONS"
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        priority = self.controller.classify(scope["path"], headers)
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        release = None
+        try:
+            self.controller.check_rate(self.controller.client_key(scope, headers), priority)
+            if scope["type"] == "http":
+                release = self.controller.enter(priority)
+        except AdmissionRejected as e:
+            logger.info(f"拒绝请求 {scope['path']}({priority}): {e.reason}")
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1013})
+            else:
+                await e.to_response()(scope, receive, send)
+            return
+
+        token = current_priority.set(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_priority.reset(token)
+            if release is not None:
+                release()
@@ -0,0 +1,291 @@
+import io
+import os
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Any, AsyncIterator, Dict, Optional
+
+from audio_utils import av, decode_stats
+
+logger = logging.getLogger(__name__)
+
+# 回复音频的默认格式（请求中的audioFormat参数优先）：
+# "mp3" 直接使用语音合成服务的输出；"opus" 为Ogg封装的Opus；"webm" 为WebM封装的Opus
+TTS_AUDIO_FORMAT = os.environ.get("TTS_AUDIO_FORMAT", "mp3")
+# Opus编码码率（bit/s），语音使用16-32kbps即可
+TTS_OPUS_BITRATE = int(os.environ.get("TTS_OPUS_BITRATE", "24000"))
+
+# Opus回复格式 -> 封装格式
+OPUS_CONTAINERS = {"opus": "ogg", "webm": "webm"}
+# Opus编码器只支持48kHz等固定采样率
+OPUS_SAMPLE_RATE = 48000
+
+# 可以逐块解析的合成服务输出格式 -> 解码器
+_STREAM_DECODERS = {"mp3": "mp3"}
+
+_stats_lock = threading.Lock()
+# buffered_streams: 无法逐块转码、缓冲整段音频后才输出的次数；ffmpeg_transcodes: 回退到ffmpeg子进程的次数
+_stats = {
+    "streams": 0, "input_bytes": 0, "output_bytes": 0, "errors": 0,
+    "buffered_streams": 0, "ffmpeg_transcodes": 0,
+}
+
+
+def encoder_backend() -> str:
+    """Opus编码方式：pyav（进程内，可逐块转码）、ffmpeg（子进程，备用，需缓冲整段音频）或 unavailable"""
+    if av is not None:
+        return "pyav" if "libopus" in av.codecs_available else "unavailable"
+    return "ffmpeg" if shutil.which("ffmpeg") is not None else "unavailable"
+
+
+def opus_encoder_available() -> bool:
+    """是否可以编码Opus"""
+    return encoder_backend() != "unavailable"
+
+
+def negotiate_audio_format(requested: Optional[str], source_format: str) -> str:
+    """
+    确定回复音频的格式
+
+    Args:
+        requested (str, optional): 客户端请求的格式，可以是逗号分隔的候选列表（如 "opus,webm,mp3"），
+            按顺序选择第一个可用的格式；为空时使用TTS_AUDIO_FORMAT
+        source_format (str): 语音合成服务输出的格式
+
+    Returns:
+        str: 回复音频格式；无法编码Opus或请求的格式都不支持时使用合成服务的输出格式
+    """
+    candidates = [f.strip().lower() for f in (requested or TTS_AUDIO_FORMAT).split(",") if f.strip()]
+    for candidate in candidates:
+        if candidate == source_format:
+            return candidate
+        if candidate in OPUS_CONTAINERS and opus_encoder_available():
+            return candidate
+    return source_format
+
+
+class _Sink:
+    """PyAV输出用的只写文件对象，编码好的数据在每次取出后清空（不可seek，封装器按流式方式写入）"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class OpusTranscoder:
+    """
+    把语音合成服务返回的音频增量转码为Opus
+
+    安装了PyAV且输入为MP3时在进程内逐块解码、重采样并编码，每次 feed 返回已经封装好的Opus数据，
+    边合成边播放时不需要等待整段音频；否则缓冲全部输入，在 finish 时一次性转码（PyAV或ffmpeg）。
+    """
+
+    def __init__(self, fmt: str, source_format: str = "mp3", bitrate: int = TTS_OPUS_BITRATE):
+        """
+        Args:
+            fmt (str): 输出格式，"opus" 或 "webm"
+            source_format (str): 输入的音频格式
+            bitrate (int): Opus编码码率（bit/s）
+        """
+        self.container_format = OPUS_CONTAINERS[fmt]
+        self.bitrate = bitrate
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self._pending = bytearray()
+        self._decoder = None
+        self._output = None
+        if av is not None and source_format in _STREAM_DECODERS:
+            self._decoder = av.CodecContext.create(_STREAM_DECODERS[source_format], "r")
+            self._open_output()
+
+    def _open_output(self):
+        self._resampler = av.AudioResampler(format="s16", layout="mono", rate=OPUS_SAMPLE_RATE)
+        self._sink = _Sink()
+        self._output = av.open(self._sink, mode="w", format=self.container_format)
+        self._stream = self._output.add_stream("libopus", rate=OPUS_SAMPLE_RATE)
+        self._stream.bit_rate = self.bitrate
+        self._stream.layout = "mono"
+
+    def _encode(self, frame):
+        """frame为None时冲刷重采样器和编码器"""
+        frames = self._resampler.resample(frame)
+        if frame is None:
+            frames = list(frames) + [None]
+        for resampled in frames:
+            for packet in self._stream.encode(resampled):
+                self._output.mux(packet)
+
+    def _decode_packets(self, packets):
+        for packet in packets:
+            try:
+                frames = self._decoder.decode(packet)
+            except av.error.InvalidDataError:
+                # MP3开头的Xing/Info帧等无法解码的数据直接跳过
+                continue
+            for frame in frames:
+                self._encode(frame)
+
+    def _output_bytes(self, data: bytes) -> bytes:
+        self.output_bytes += len(data)
+        return data
+
+    def feed(self, data: bytes) -> bytes:
+        """输入一块音频，返回已经可以发送的Opus数据（可能为空）"""
+        self.input_bytes += len(data)
+        if self._decoder is None:
+            self._pending.extend(data)
+            return b""
+        self._decode_packets(self._decoder.parse(data))
+        return self._output_bytes(self._sink.take())
+
+    def finish(self) -> bytes:
+        """输入结束，返回剩余的Opus数据"""
+        if self._decoder is None:
+            return self._output_bytes(self._transcode_whole(bytes(self._pending)))
+        self._decode_packets(self._decoder.parse(b""))
+        self._decode_packets([None])
+        self._encode(None)
+        self._output.close()
+        self._output = None
+        return self._output_bytes(self._sink.take())
+
+    def close(self):
+        """放弃转码（合成被取消时），释放编码器"""
+        if self._output is not None:
+            try:
+                self._output.close()
+            except Exception:
+                pass
+            self._output = None
+
+    def _transcode_whole(self, data: bytes) -> bytes:
+        with _stats_lock:
+            _stats["buffered_streams"] += 1
+            if av is None:
+                _stats["ffmpeg_transcodes"] += 1
+        if av is not None:
+            self._open_output()
+            with av.open(io.BytesIO(data), mode="r") as source:
+                for frame in source.decode(audio=0):
+                    self._encode(frame)
+            self._encode(None)
+            self._output.close()
+            self._output = None
+            return self._sink.take()
+        cmd = [
+            "ffmpeg",
+            "-nostdin",
+            "-i", "pipe:0",
+            "-vn",
+            "-ac", "1",
+            "-ar", str(OPUS_SAMPLE_RATE),
+            "-c:a", "libopus",
+            "-b:a", str(self.bitrate),
+            "-f", self.container_format,
+            "pipe:1",
+        ]
+        try:
+            return subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"音频转码失败: {e.stderr.decode(errors='ignore')}") from e
+
+
+def _record(transcoder: OpusTranscoder, failed: bool = False):
+    with _stats_lock:
+        _stats["streams"] += 1
+        _stats["input_bytes"] += transcoder.input_bytes
+        _stats["output_bytes"] += transcoder.output_bytes
+        if failed:
+            _stats["errors"] += 1
+
+
+def transcode_audio(data: bytes, fmt: str, source_format: str = "mp3") -> bytes:
+    """
+    把完整的音频转码为Opus（在线程中调用）
+
+    Args:
+        data (bytes): 语音合成服务输出的音频
+        fmt (str): 输出格式，"opus" 或 "webm"
+        source_format (str): 输入的音频格式
+
+    Returns:
+        bytes: Ogg/WebM封装的Opus音频
+    """
+    transcoder = OpusTranscoder(fmt, source_format)
+    try:
+        output = transcoder.feed(data) + transcoder.finish()
+    except Exception:
+        transcoder.close()
+        _record(transcoder, failed=True)
+        raise
+    _record(transcoder)
+    return output
+
+
+async def transcode_stream(
+    chunks: AsyncIterator[bytes], fmt: str, source_format: str = "mp3"
+) -> AsyncIterator[bytes]:
+    """
+    边接收合成的音频边转码为Opus，编码在线程中执行，不阻塞事件循环
+
+    Args:
+        chunks: 语音合成服务输出的音频数据块
+        fmt (str): 输出格式，"opus" 或 "webm"
+        source_format (str): 输入的音频格式
+
+    Yields:
+        bytes: Ogg/WebM封装的Opus数据块
+    """
+    transcoder = OpusTranscoder(fmt, source_format)
+    failed = False
+    try:
+        async for chunk in chunks:
+            output = await asyncio.to_thread(transcoder.feed, chunk)
+            if output:
+                yield output
+        output = await asyncio.to_thread(transcoder.finish)
+        if output:
+            yield output
+    except Exception:
+        failed = True
+        transcoder.close()
+        raise
+    finally:
+        # 被取消时线程中的转码可能仍在进行，不在这里关闭编码器，由垃圾回收释放
+        _record(transcoder, failed)
+
+
+def codec_stats() -> Dict[str, Any]:
+    """
+    回复音频格式配置和Opus转码统计（输出/输入字节比即节省的下行带宽）
+
+    fallback_active 为true时说明没有安装PyAV（或PyAV不带libopus），解码和转码正在使用ffmpeg子进程或不可用。
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    decoding = decode_stats()
+    encoder = encoder_backend()
+    stats.update({
+        "decoder": decoding["decoder"],
+        "encoder": encoder,
+        "fallback_active": decoding["decoder"] != "pyav" or encoder != "pyav",
+        "ffmpeg_decodes": decoding["ffmpeg_decodes"],
+    })
+    stats.update({
+        "default_format": TTS_AUDIO_FORMAT,
+        "opus_bitrate": TTS_OPUS_BITRATE,
+        "opus_available": opus_encoder_available(),
+        "in_process": av is not None,
+        "ratio": round(stats["output_bytes"] / stats["input_bytes"], 4) if stats["input_bytes"] else None,
+    })
+    return stats
@@ -0,0 +1,153 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
+
+# 音频保留时间（秒），客户端需要在此时间内取回
+AUDIO_STORE_TTL = float(os.environ.get("AUDIO_STORE_TTL", "300"))
+# 暂存音频的总大小上限（字节）
+AUDIO_STORE_MAX_BYTES = int(os.environ.get("AUDIO_STORE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+
+class AudioEntry:
+    """
+    暂存的音频
+
+    流式合成时音频边生成边写入（complete为False），读取方可以通过 iter_chunks 跟随写入进度读取。
+    """
+
+    __slots__ = ("data", "media_type", "created_at", "complete", "error", "_changed")
+
+    def __init__(self, data: bytes, media_type: str, complete: bool = True):
+        self.data = data
+        self.media_type = media_type
+        self.created_at = time.monotonic()
+        self.complete = complete
+        self.error: Optional[str] = None
+        self._changed: Optional[asyncio.Event] = None if complete else asyncio.Event()
+
+    def _notify(self):
+        # 唤醒所有等待者后换一个新的事件，供下一次等待使用
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None if self.complete else asyncio.Event()
+
+    async def wait_complete(self):
+        """等待音频写入完成"""
+        while not self.complete:
+            await self._changed.wait()
+
+    async def iter_chunks(self, chunk_size: int, start: int = 0) -> AsyncIterator[bytes]:
+        """
+        从start开始按块读取音频，尚在写入时等待新数据，直到写入完成
+
+        写入失败时在已写入的数据之后结束，不抛出异常（响应已经开始发送）。
+        """
+        offset = start
+        while True:
+            changed = self._changed
+            while offset < len(self.data):
+                chunk = bytes(self.data[offset:offset + chunk_size])
+                offset += len(chunk)
+                yield chunk
+            if self.complete:
+                return
+            await changed.wait()
+
+
+class AudioStore:
+    """
+    生成音频的短期暂存区
+
+    流式响应中只返回音频ID，客户端再通过 /api/audio/{audio_id} 获取二进制音频，
+    避免base64编码带来的体积膨胀和编解码开销。按TTL和总大小淘汰。
+    """
+
+    def __init__(self, ttl: float = AUDIO_STORE_TTL, max_bytes: int = AUDIO_STORE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, AudioEntry]" = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._items:
+            audio_id, entry = next(iter(self._items.items()))
+            if self.size <= self.max_bytes and now - entry.created_at < self.ttl:
+                break
+            self._items.popitem(last=False)
+            self.size -= len(entry.data)
+
+    def put(self, data: bytes, media_type: str = "audio/mpeg") -> str:
+        """保存音频，返回音频ID"""
+        audio_id = uuid.uuid4().hex
+        self._items[audio_id] = AudioEntry(data, media_type)
+        self.size += len(data)
+        self._evict()
+        return audio_id
+
+    def open(self, media_type: str = "audio/mpeg") -> Tuple[str, AudioEntry]:
+        """创建一个尚在写入的音频，返回 (音频ID, 音频)，之后用 append / finish 写入"""
+        audio_id = uuid.uuid4().hex
+        entry = AudioEntry(bytearray(), media_type, complete=False)
+        self._items[audio_id] = entry
+        self._evict()
+        return audio_id, entry
+
+    def append(self, audio_id: str, entry: AudioEntry, chunk: bytes):
+        """向尚在写入的音频追加数据"""
+        entry.data.extend(chunk)
+        if self._items.get(audio_id) is entry:
+            self.size += len(chunk)
+        entry._notify()
+        self._evict()
+
+    def finish(self, entry: AudioEntry, error: Optional[str] = None):
+        """结束写入，error不为空表示合成中途失败"""
+        entry.complete = True
+        entry.error = error
+        entry._notify()
+
+    def get(self, audio_id: str) -> Optional[AudioEntry]:
+        self._evict()
+        return self._items.get(audio_id)
+
+    def pop(self, audio_id: str) -> Optional[AudioEntry]:
+        """取出并删除音频（音频已经通过其他方式送达时使用）"""
+        entry = self._items.pop(audio_id, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+        return entry
+
+    def __len__(self):
+        return len(self._items)
+
+
+def parse_range(range_header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段Range请求头
+
+    Returns:
+        Optional[Tuple[int, int]]: (起始位置, 结束位置)，包含两端；无Range头时返回None
+
+    Raises:
+        ValueError: 范围无法满足
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].split(",")[0].strip()
+    start_text, _, end_text = spec.partition("-")
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else total - 1
+    else:
+        # "bytes=-500" 表示最后500字节
+        length = int(end_text)
+        start = max(0, total - length)
+        end = total - 1
+    end = min(end, total - 1)
+    if start > end or start >= total:
+        raise ValueError("请求的范围无效")
+    return start, end
@@ -0,0 +1,202 @@
+import io
+import wave
+import shutil
+import logging
+import threading
+import subprocess
+from typing import Any, Dict, Union
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+
+if av is None:
+    logger.warning(
+        "未安装PyAV（pip install av），压缩格式的上传音频将通过ffmpeg子进程解码，Opus回复无法边合成边编码"
+    )
+
+# Whisper要求的采样率
+SAMPLE_RATE = 16000
+
+AudioBytes = Union[bytes, bytearray, memoryview]
+
+# 上传音频格式对应的MIME类型
+AUDIO_MIME_TYPES = {
+    "wav": "audio/wav",
+    "webm": "audio/webm",
+    "ogg": "audio/ogg",
+    "mp3": "audio/mpeg",
+    "mp4": "audio/mp4",
+    "flac": "audio/flac",
+}
+
+
+_fallback_lock = threading.Lock()
+# 回退到ffmpeg子进程解码的次数
+_ffmpeg_decodes = 0
+
+
+def decoder_backend() -> str:
+    """压缩格式的解码方式：pyav（进程内）、ffmpeg（子进程，备用）或 unavailable"""
+    if av is not None:
+        return "pyav"
+    return "ffmpeg" if shutil.which("ffmpeg") is not None else "unavailable"
+
+
+def decode_stats() -> Dict[str, Any]:
+    with _fallback_lock:
+        return {"decoder": decoder_backend(), "ffmpeg_decodes": _ffmpeg_decodes}
+
+
+def is_wav(data: AudioBytes) -> bool:
+    """根据文件头判断是否是WAV格式"""
+    header = bytes(data[:12])
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def sniff_audio_format(data: AudioBytes) -> str:
+    """
+    根据文件头判断音频的容器格式（浏览器上传时声明的类型不可靠，如把WebM/Opus标为audio/wav）
+
+    Returns:
+        str: AUDIO_MIME_TYPES 中的格式名，无法识别时返回空字符串
+    """
+    header = bytes(data[:12])
+    if is_wav(header):
+        return "wav"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML头：WebM（MediaRecorder在Chrome/Firefox下的默认输出）
+        return "webm"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[4:8] == b"ftyp":
+        # Safari的MediaRecorder输出MP4/AAC
+        return "mp4"
+    if header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return ""
+
+
+def _pcm_to_float32(frames: bytes, sample_width: int) -> np.ndarray:
+    """把PCM字节转换为[-1, 1]范围的float32数组"""
+    if sample_width == 1:
+        return (np.frombuffer(frames, np.uint8).astype(np.float32) - 128) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(frames, np.int16).astype(np.float32) / 32768.0
+    if sample_width == 4:
+        return np.frombuffer(frames, np.int32).astype(np.float32) / 2147483648.0
+    raise ValueError(f"不支持的WAV采样位宽: {sample_width * 8}bit")
+
+
+def resample(samples: np.ndarray, orig_rate: int, target_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """线性插值重采样（语音识别场景下精度足够）"""
+    if orig_rate == target_rate or len(samples) == 0:
+        return samples
+    target_length = int(round(len(samples) * target_rate / orig_rate))
+    positions = np.arange(target_length, dtype=np.float64) * orig_rate / target_rate
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _decode_wav(data: AudioBytes) -> np.ndarray:
+    with wave.open(io.BytesIO(data), "rb") as wave_file:
+        channels = wave_file.getnchannels()
+        sample_width = wave_file.getsampwidth()
+        rate = wave_file.getframerate()
+        frames = wave_file.readframes(wave_file.getnframes())
+
+    samples = _pcm_to_float32(frames, sample_width)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, rate)
+
+
+def _decode_with_av(data: AudioBytes) -> np.ndarray:
+    """使用PyAV在进程内解码WebM/Opus、Ogg、MP3等压缩格式，不启动ffmpeg子进程"""
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(io.BytesIO(bytes(data)), mode="r") as container:
+        if not container.streams.audio:
+            raise ValueError("文件中没有音频流")
+        try:
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+        except av.error.FFmpegError:
+            # 录音中的WebM最后一个簇可能不完整（边录边识别），保留已经解码的部分
+            if not chunks:
+                raise
+    for resampled in resampler.resample(None):
+        chunks.append(resampled.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+def _decode_with_ffmpeg(data: AudioBytes) -> np.ndarray:
+    """通过管道交给ffmpeg解码（不落盘），没有安装PyAV时用于WebM/Opus、MP3等压缩格式"""
+    global _ffmpeg_decodes
+    with _fallback_lock:
+        _ffmpeg_decodes += 1
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    try:
+        out = subprocess.run(cmd, input=bytes(data), capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"音频解码失败: {e.stderr.decode(errors='ignore')}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(data: AudioBytes) -> np.ndarray:
+    """
+    在内存中把上传的音频解码为16kHz单声道float32数组
+
+    WAV直接解析；压缩格式优先使用PyAV在进程内解码，PyAV解码失败或未安装时交给ffmpeg。
+
+    Args:
+        data: 音频文件的原始字节（bytes或memoryview）
+
+    Returns:
+        np.ndarray: 可以直接传给Whisper的float32音频数组
+    """
+    if is_wav(data):
+        try:
+            return _decode_wav(data)
+        except (wave.Error, ValueError, EOFError):
+            # 非PCM编码的WAV交给PyAV/ffmpeg处理
+            pass
+    if av is not None:
+        try:
+            return _decode_with_av(data)
+        except (av.error.FFmpegError, ValueError) as e:
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError(f"音频解码失败: {str(e)}") from e
+    return _decode_with_ffmpeg(data)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """把float32音频数组编码为16bit PCM的WAV字节"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wave_file:
+        wave_file.setnchannels(1)
+        wave_file.setsampwidth(2)
+        wave_file.setframerate(sample_rate)
+        wave_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
@@ -0,0 +1,675 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from admission import AdmissionRejected, current_priority
+from stt_executor import STTQueueFullError, STTTimeoutError
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+# 批量任务目录：每个任务一个子目录，保存任务参数、结果JSONL和合成的音频，重启后从检查点继续
+BATCH_DIR = os.environ.get("BATCH_DIR", "batch_jobs")
+# 同时执行的任务数
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "1"))
+# 每个任务内同时处理的条目数（识别请求并发提交，启用STT_BATCH_SIZE时可以凑满batch）
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+# 单个任务最多的条目数
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "10000"))
+# 条目因排队已满、等待超时被拒绝时的重试次数
+BATCH_RETRIES = int(os.environ.get("BATCH_RETRIES", "3"))
+# 允许按服务器上的路径提交识别任务的目录，逗号分隔；为空时只能上传文件
+BATCH_INPUT_DIRS = os.environ.get("BATCH_INPUT_DIRS", "")
+
+# 扫描目录时识别为音频的文件扩展名
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".ogg", ".opus", ".webm", ".flac", ".m4a", ".mp4", ".aac")
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 暂时性的拒绝，等待后重试；其他错误直接记为失败
+_RETRYABLE_ERRORS = (AdmissionRejected, STTQueueFullError, STTTimeoutError)
+# 任务详情中最多返回的失败条目数
+_MAX_FAILURES_SHOWN = 50
+
+BATCH_ITEMS = counter("voicebot_batch_items_total", "Batch job items processed", ("kind", "outcome"))
+
+
+class BatchUnavailable(Exception):
+    """任务目录由另一个进程持有（多进程部署），本进程不执行也不接受批量任务，调用方应返回503"""
+
+    def __init__(self, retry_after: int = 5):
+        super().__init__("批量任务由其他API进程处理，本进程不可用")
+        self.retry_after = retry_after
+
+
+def _safe_name(name: str) -> str:
+    """把条目ID转换为可以作为文件名的字符串"""
+    name = re.sub(r"[^\w.-]+", "_", name).strip("._")
+    return name[:100] or "item"
+
+
+def _unique(name: str, used: set) -> str:
+    candidate = name
+    suffix = 1
+    while candidate in used:
+        suffix += 1
+        candidate = f"{name}_{suffix}"
+    used.add(candidate)
+    return candidate
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    """
+    读取JSONL文件
+
+    进程在写入一行的过程中退出时，文件末尾会留下不完整的一行：截断到最后一个换行符，
+    之后追加的记录不会和它拼在一起。
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    records = []
+    for line in data[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_atomic(path: str, data: bytes):
+    """先写临时文件再重命名，中途退出不会留下不完整的文件"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class BatchJob:
+    """
+    一个批量识别或合成任务
+
+    任务目录中 job.json 保存任务参数和条目列表；results.jsonl 每完成一个条目追加一行，同时作为检查点，
+    恢复执行时跳过其中已有的条目；errors.jsonl 记录最近一次执行中失败的条目；合成的音频保存在 audio/ 下。
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        items: List[Dict[str, Any]],
+        directory: str,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            job_id (str): 任务ID
+            kind (str): "transcribe" 或 "synthesize"
+            items (List[Dict]): 条目列表，识别条目为 {"id", "path"}，合成条目为 {"id", "name", "text", "voice"}
+            directory (str): 任务目录
+            options (Dict, optional): 任务参数（合成任务的音色和音频格式）
+        """
+        self.id = job_id
+        self.kind = kind
+        self.items = items
+        self.directory = directory
+        self.options = options or {}
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 已完成的条目ID和本轮失败的条目（ID -> 错误信息）
+        self.completed: set = set()
+        self.failed: Dict[str, str] = {}
+        # 本轮执行的开始时间和完成数，用于估算速度和剩余时间
+        self._run_started: Optional[float] = None
+        self._run_completed = 0
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "job.json")
+
+    @property
+    def results_path(self) -> str:
+        return os.path.join(self.directory, "results.jsonl")
+
+    @property
+    def errors_path(self) -> str:
+        return os.path.join(self.directory, "errors.jsonl")
+
+    @property
+    def audio_dir(self) -> str:
+        return os.path.join(self.directory, "audio")
+
+    @property
+    def pending(self) -> int:
+        return len(self.items) - len(self.completed) - len(self.failed)
+
+    def save(self):
+        """保存任务参数和状态（条目进度保存在results.jsonl中）"""
+        manifest = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "options": self.options,
+            "items": self.items,
+        }
+        _write_atomic(self.manifest_path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+    @classmethod
+    def load(cls, directory: str) -> "BatchJob":
+        """从任务目录加载任务和检查点"""
+        with open(os.path.join(directory, "job.json"), "rb") as f:
+            manifest = json.loads(f.read())
+        job = cls(manifest["id"], manifest["kind"], manifest["items"], directory, manifest.get("options"))
+        job.status = manifest["status"]
+        job.error = manifest.get("error")
+        job.created_at = manifest["created_at"]
+        job.started_at = manifest.get("started_at")
+        job.finished_at = manifest.get("finished_at")
+        item_ids = {item["id"] for item in job.items}
+        job.completed = {r["id"] for r in _read_jsonl(job.results_path) if r.get("id") in item_ids}
+        job.failed = {
+            r["id"]: r.get("error", "")
+            for r in _read_jsonl(job.errors_path)
+            if r.get("id") in item_ids and r["id"] not in job.completed
+        }
+        return job
+
+    def _append(self, path: str, record: Dict[str, Any]):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_result(self, record: Dict[str, Any]):
+        self._append(self.results_path, record)
+        self.completed.add(record["id"])
+        self._run_completed += 1
+
+    def record_failure(self, item_id: str, error: str):
+        self._append(self.errors_path, {"id": item_id, "error": error})
+        self.failed[item_id] = error
+
+    def begin_run(self):
+        """开始（或恢复）执行：清空上一轮的失败记录，失败的条目重新处理"""
+        self.status = RUNNING
+        self.error = None
+        self.finished_at = None
+        if self.started_at is None:
+            self.started_at = time.time()
+        self.failed.clear()
+        if os.path.exists(self.errors_path):
+            os.remove(self.errors_path)
+        self._run_started = time.monotonic()
+        self._run_completed = 0
+
+    def progress(self) -> Dict[str, Any]:
+        """任务进度：完成/失败/剩余条目数，以及按本轮速度估算的剩余时间"""
+        total = len(self.items)
+        speed = None
+        eta = None
+        if self.status == RUNNING and self._run_started is not None and self._run_completed:
+            speed = self._run_completed / max(time.monotonic() - self._run_started, 1e-6)
+            eta = round(self.pending / speed, 1)
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": total,
+            "completed": len(self.completed),
+            "failed": len(self.failed),
+            "pending": self.pending,
+            "percent": round(len(self.completed) / total * 100, 1) if total else 100.0,
+            "itemsPerSecond": round(speed, 3) if speed is not None else None,
+            "etaSeconds": eta,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "results": f"/api/batch/jobs/{self.id}/results",
+        }
+
+    def failures(self, limit: int = _MAX_FAILURES_SHOWN) -> List[Dict[str, str]]:
+        return [{"id": item_id, "error": error} for item_id, error in list(self.failed.items())[:limit]]
+
+
+class BatchJobManager:
+    """
+    批量识别/合成任务队列
+
+    任务提交后立即返回任务ID，由后台工作任务按提交顺序执行，每个任务内并发处理多个条目。
+    识别复用 transcribe_audio（语音活动检测、识别执行器和动态批处理），合成复用 generate_voice_bytes
+    （语音合成缓存、长文本并行合成和Opus转码）；各阶段都以 batch 优先级申请准入名额，
+    只使用预算中留给低优先级的部分，不影响交互式请求。
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[bytes], Awaitable[Dict[str, Any]]],
+        synthesize: Callable[[str, Optional[str], str], Awaitable[bytes]],
+        resolve_format: Callable[[Optional[str]], str],
+        directory: str = BATCH_DIR,
+        workers: int = BATCH_WORKERS,
+        concurrency: int = BATCH_CONCURRENCY,
+    ):
+        """
+        Args:
+            transcribe: 语音识别函数（含语音活动检测），参数为音频字节
+            synthesize: 语音合成函数，参数为 (文本, 音色, 音频格式)，返回音频字节
+            resolve_format: 按请求的audioFormat确定实际音频格式的函数
+            directory (str): 任务目录
+            workers (int): 同时执行的任务数
+            concurrency (int): 每个任务内同时处理的条目数
+        """
+        self.transcribe = transcribe
+        self.synthesize = synthesize
+        self.resolve_format = resolve_format
+        self.directory = directory
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.jobs: Dict[str, BatchJob] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self.retries = 0
+        # 多个API进程共用任务目录时，只有持有目录锁的进程加载和执行任务，避免重复执行、并发写结果文件
+        self._lock_file = None
+        self.owner = False
+
+    def start(self):
+        """
+        加载任务目录中的任务，未完成的任务（含上次退出时正在执行的）从检查点继续，并启动工作任务
+
+        任务目录已被其他进程锁定时不加载任务，本进程的批量接口抛出 BatchUnavailable。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, ".lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            logger.info(f"批量任务目录 {self.directory} 已由其他进程处理，本进程不执行批量任务")
+            return
+        self.owner = True
+        loaded = []
+        for name in os.listdir(self.directory):
+            job_dir = os.path.join(self.directory, name)
+            if not os.path.exists(os.path.join(job_dir, "job.json")):
+                continue
+            try:
+                loaded.append(BatchJob.load(job_dir))
+            except Exception as e:
+                logger.warning(f"加载批量任务 {name} 失败: {str(e)}")
+        resumed = 0
+        for job in sorted(loaded, key=lambda j: j.created_at):
+            self.jobs[job.id] = job
+            if job.status in (QUEUED, RUNNING):
+                job.status = QUEUED
+                self._queue.put_nowait(job.id)
+                resumed += 1
+        if loaded:
+            logger.info(f"已加载批量任务: {len(loaded)} 个, 继续执行 {resumed} 个")
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        """停止工作任务；正在执行的任务保持排队状态，下次启动时从检查点继续"""
+        for task in self._worker_tasks:
+            task.cancel()
+        if self._worker_tasks:
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.owner = False
+
+    def _check_owner(self):
+        if not self.owner:
+            raise BatchUnavailable()
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._check_owner()
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """所有任务的进度，最新提交的在前"""
+        self._check_owner()
+        jobs = sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)
+        return [job.progress() for job in jobs]
+
+    def _new_job(self, kind: str, options: Optional[Dict[str, Any]] = None) -> BatchJob:
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir)
+        return BatchJob(job_id, kind, [], job_dir, options)
+
+    def _enqueue(self, job: BatchJob):
+        job.save()
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        logger.info(f"已提交批量任务 {job.id}: {job.kind}, {len(job.items)} 个条目")
+
+    @staticmethod
+    def _allowed_path(path: str) -> str:
+        """检查服务器上的路径是否位于 BATCH_INPUT_DIRS 中，返回规范化后的路径"""
+        roots = [os.path.realpath(d.strip()) for d in BATCH_INPUT_DIRS.split(",") if d.strip()]
+        if not roots:
+            raise ValueError("未配置BATCH_INPUT_DIRS，只能上传音频文件")
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, root]) == root for root in roots):
+            raise ValueError(f"路径不在允许的目录中: {path}")
+        return real
+
+    @classmethod
+    def _scan_inputs(cls, paths: List[str], folder: Optional[str], recursive: bool) -> List[Tuple[str, str]]:
+        """展开服务器上的文件列表和目录，返回 [(条目ID, 文件路径)]"""
+        found = []
+        for path in paths:
+            real = cls._allowed_path(path)
+            if not os.path.isfile(real):
+                raise ValueError(f"文件不存在: {path}")
+            found.append((path, real))
+        if folder:
+            root = cls._allowed_path(folder)
+            if not os.path.isdir(root):
+                raise ValueError(f"目录不存在: {folder}")
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                if not recursive:
+                    dirnames.clear()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(AUDIO_EXTENSIONS):
+                        full = os.path.join(dirpath, filename)
+                        found.append((os.path.relpath(full, root), full))
+        return found
+
+    async def submit_transcription(
+        self,
+        uploads: List[Tuple[str, BinaryIO]],
+        paths: Optional[List[str]] = None,
+        folder: Optional[str] = None,
+        recursive: bool = True,
+    ) -> BatchJob:
+        """
+        提交批量识别任务
+
+        Args:
+            uploads (List[Tuple[str, BinaryIO]]): 上传的文件 (文件名, 文件对象)，保存到任务目录
+            paths (List[str], optional): 服务器上的音频文件路径，必须位于 BATCH_INPUT_DIRS 中
+            folder (str, optional): 服务器上的目录，识别其中所有音频文件
+            recursive (bool): 是否包含子目录
+
+        Returns:
+            BatchJob: 已排队的任务
+
+        Raises:
+            ValueError: 没有音频文件、条目过多或路径不允许
+            BatchUnavailable: 任务目录由其他进程处理
+        """
+        self._check_owner()
+        if isinstance(paths, str):
+            paths = [paths]
+        inputs = await asyncio.to_thread(self._scan_inputs, paths or [], folder, recursive)
+        if not uploads and not inputs:
+            raise ValueError("没有需要识别的音频文件")
+        if len(uploads) + len(inputs) > BATCH_MAX_ITEMS:
+            raise ValueError(f"条目数超过上限 {BATCH_MAX_ITEMS}")
+
+        job = self._new_job("transcribe")
+        used_ids: set = set()
+        if uploads:
+            input_dir = os.path.join(job.directory, "inputs")
+            os.makedirs(input_dir)
+            used_names: set = set()
+            for filename, fileobj in uploads:
+                item_id = _unique(filename or "upload", used_ids)
+                path = os.path.join(input_dir, _unique(_safe_name(item_id), used_names))
+                with open(path, "wb") as out:
+                    await asyncio.to_thread(shutil.copyfileobj, fileobj, out)
+                job.items.append({"id": item_id, "path": path})
+        for item_id, path in inputs:
+            job.items.append({"id": _unique(item_id, used_ids), "path": path})
+        self._enqueue(job)
+        return job
+
+    def submit_synthesis(
+        self,
+        items: List[Dict[str, Any]],
+        voice: Optional[str] = None,
+        audio_format: Optional[str] = None,
+    ) -> BatchJob:
+        """
+        提交批量合成任务
+
+        Args:
+            items (List[Dict]): {"text", "id"（可选，默认为序号）, "voice"（可选）}
+            voice (str, optional): 默认音色
+            audio_format (str, optional): 音频格式（与audioFormat参数相同，提交时确定，恢复执行时不变）
+
+        Returns:
+            BatchJob: 已排队的任务
+
+        Raises:
+            ValueError: 没有文本、文本为空、ID重复或条目过多
+            BatchUnavailable: 任务目录由其他进程处理
+        """
+        self._check_owner()
+        if not items:
+            raise ValueError("没有需要合成的文本")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"条目数超过上限 {BATCH_MAX_ITEMS}")
+        jobs_items = []
+        used_ids: set = set()
+        used_names: set = set()
+        for index, item in enumerate(items):
+            text = (item.get("text") or "").strip()
+            if not text:
+                raise ValueError(f"第{index + 1}条文本为空")
+            item_id = str(item.get("id") or f"{index + 1:06d}")
+            if item_id in used_ids:
+                raise ValueError(f"条目ID重复: {item_id}")
+            used_ids.add(item_id)
+            jobs_items.append({
+                "id": item_id,
+                "name": _unique(_safe_name(item_id), used_names),
+                "text": text,
+                "voice": item.get("voice") or voice,
+            })
+        job = self._new_job("synthesize", {"voice": voice, "audio_format": self.resolve_format(audio_format)})
+        job.items = jobs_items
+        os.makedirs(job.audio_dir)
+        self._enqueue(job)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排队中或执行中的任务，已完成的条目保留，之后可以通过 resume 继续"""
+        self._check_owner()
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return False
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        job.save()
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return True
+
+    def resume(self, job_id: str) -> bool:
+        """重新执行已取消、失败或有失败条目的任务，跳过已完成的条目"""
+        self._check_owner()
+        job = self.jobs.get(job_id)
+        if job is None or job.status in (QUEUED, RUNNING) or len(job.completed) == len(job.items):
+            return False
+        job.status = QUEUED
+        job.save()
+        self._queue.put_nowait(job.id)
+        return True
+
+    async def delete(self, job_id: str) -> bool:
+        """删除任务及其结果文件，执行中的任务先取消"""
+        self._check_owner()
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            job.status = CANCELLED
+            task.cancel()
+            await asyncio.wait({task})
+        await asyncio.to_thread(shutil.rmtree, job.directory, True)
+        return True
+
+    def audio_path(self, job_id: str, name: str) -> Optional[str]:
+        """合成任务输出的音频文件路径，不存在时返回None"""
+        self._check_owner()
+        job = self.jobs.get(job_id)
+        if job is None or os.path.basename(name) != name or name.startswith("."):
+            return None
+        path = os.path.join(job.audio_dir, name)
+        return path if os.path.isfile(path) else None
+
+    async def _worker(self):
+        # 工作任务及其创建的条目任务都以batch优先级申请阶段名额
+        current_priority.set("batch")
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            task = asyncio.ensure_future(self._run_job(job))
+            self._running[job_id] = task
+            try:
+                # 不直接await任务：取消任务（用户取消）不会结束工作任务本身
+                await asyncio.wait({task})
+            finally:
+                if not task.done():
+                    task.cancel()
+                    await asyncio.wait({task})
+                self._running.pop(job_id, None)
+
+    async def _run_job(self, job: BatchJob):
+        job.begin_run()
+        job.save()
+        remaining = iter([item for item in job.items if item["id"] not in job.completed])
+        logger.info(f"开始执行批量任务 {job.id}: {job.pending} 个条目待处理")
+
+        async def run():
+            # 多个协程共享同一个迭代器，每个条目只会被取出一次
+            for item in remaining:
+                await self._process(job, item)
+
+        try:
+            await asyncio.gather(*[run() for _ in range(min(self.concurrency, job.pending) or 1)])
+        except asyncio.CancelledError:
+            if job.status != CANCELLED:
+                # 服务关闭：保持排队状态，下次启动时从检查点继续
+                job.status = QUEUED
+            job.save()
+            raise
+        except Exception as e:
+            logger.error(f"批量任务 {job.id} 执行出错: {str(e)}")
+            job.status = FAILED
+            job.error = str(e)
+        else:
+            job.status = COMPLETED
+        job.finished_at = time.time()
+        job.save()
+        logger.info(
+            f"批量任务 {job.id} 结束: {job.status}, 完成 {len(job.completed)}, 失败 {len(job.failed)}")
+
+    async def _process(self, job: BatchJob, item: Dict[str, Any]):
+        """处理一个条目，排队已满或等待超时时按建议的时间等待后重试"""
+        handler = self._transcribe_item if job.kind == "transcribe" else self._synthesize_item
+        for attempt in range(BATCH_RETRIES + 1):
+            try:
+                record = await handler(job, item)
+            except _RETRYABLE_ERRORS as e:
+                if attempt < BATCH_RETRIES:
+                    self.retries += 1
+                    await asyncio.sleep(getattr(e, "retry_after", 1) * (attempt + 1))
+                    continue
+                error = str(e)
+            except Exception as e:
+                error = str(e)
+            else:
+                job.record_result(record)
+                BATCH_ITEMS.inc(job.kind, "completed")
+                return
+            logger.warning(f"批量任务 {job.id} 的条目 {item['id']} 失败: {error}")
+            job.record_failure(item["id"], error)
+            BATCH_ITEMS.inc(job.kind, "failed")
+            return
+
+    async def _transcribe_item(self, job: BatchJob, item: Dict[str, Any]) -> Dict[str, Any]:
+        content = await asyncio.to_thread(_read_file, item["path"])
+        started = time.perf_counter()
+        result = await self.transcribe(content)
+        if not result or result.get("error"):
+            raise RuntimeError((result or {}).get("text") or "语音识别失败")
+        return {
+            "id": item["id"],
+            "text": result.get("text", ""),
+            "no_speech": bool(result.get("no_speech")),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    async def _synthesize_item(self, job: BatchJob, item: Dict[str, Any]) -> Dict[str, Any]:
+        audio_format = job.options["audio_format"]
+        started = time.perf_counter()
+        audio = await self.synthesize(item["text"], item.get("voice"), audio_format)
+        name = f"{item['name']}.{audio_format}"
+        await asyncio.to_thread(_write_atomic, os.path.join(job.audio_dir, name), audio)
+        return {
+            "id": item["id"],
+            "text": item["text"],
+            "voice": item.get("voice"),
+            "audio": f"audio/{name}",
+            "url": f"/api/batch/jobs/{job.id}/audio/{name}",
+            "format": audio_format,
+            "bytes": len(audio),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    @property
+    def pending_items(self) -> int:
+        return sum(job.pending for job in self.jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "owner": self.owner,
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "jobs": dict(Counter(job.status for job in self.jobs.values())),
+            "queued_jobs": self._queue.qsize(),
+            "pending_items": self.pending_items,
+            "retries": self.retries,
+        }
@@ -0,0 +1,119 @@
+"""
+音频临时文件与内存处理的基准测试
+
+对比两种方式下每个请求的额外耗时：
+- 上传音频：写临时文件 + fsync + wave 校验 + 读取解码 + 删除，与直接在内存中解码
+- Edge TTS 输出：写临时MP3文件再读回，与在内存中拼接音频流
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_audio_io.py --seconds 5 --runs 200
+"""
+import os
+import sys
+import time
+import wave
+import json
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_utils import decode_audio, encode_wav  # noqa: E402
+
+
+def upload_with_temp_file(content: bytes, temp_dir: str) -> np.ndarray:
+    """原来的上传处理流程"""
+    file_path = os.path.join(temp_dir, f"audio_{time.time_ns()}.wav")
+    with open(file_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.path.getsize(file_path)
+    with wave.open(file_path, "rb") as wave_file:
+        wave_file.getnframes()
+        wave_file.getframerate()
+    with open(file_path, "rb") as f:
+        samples = decode_audio(f.read())
+    os.remove(file_path)
+    return samples
+
+
+def upload_in_memory(content: bytes) -> np.ndarray:
+    """内存中的上传处理流程"""
+    return decode_audio(memoryview(content))
+
+
+async def tts_with_temp_file(chunks):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_speech:
+        temp_speech_path = temp_speech.name
+        for chunk in chunks:
+            temp_speech.write(chunk)
+    with open(temp_speech_path, "rb") as audio_file:
+        audio_content = audio_file.read()
+    os.unlink(temp_speech_path)
+    return audio_content
+
+
+async def tts_in_memory(chunks):
+    audio_buffer = bytearray()
+    for chunk in chunks:
+        audio_buffer.extend(chunk)
+    return bytes(audio_buffer)
+
+
+def measure(fn, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mean_ms": round(sum(timings) / runs * 1000, 3),
+        "p50_ms": round(timings[runs // 2] * 1000, 3),
+        "p99_ms": round(timings[int(runs * 0.99) - 1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="临时文件与内存音频处理对比")
+    parser.add_argument("--seconds", type=float, default=5, help="上传音频时长")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    upload = encode_wav(rng.uniform(-0.3, 0.3, int(args.seconds * 48000)).astype(np.float32), 48000)
+    # Edge TTS 默认输出 48kbps MP3，按约4KB一块模拟音频流
+    mp3_size = int(args.seconds * 48000 / 8)
+    tts_chunks = [rng.bytes(4096) for _ in range(mp3_size // 4096 + 1)]
+
+    temp_dir = tempfile.mkdtemp()
+    loop = asyncio.new_event_loop()
+    results = {
+        "upload_temp_file": measure(lambda: upload_with_temp_file(upload, temp_dir), args.runs),
+        "upload_in_memory": measure(lambda: upload_in_memory(upload), args.runs),
+        "tts_temp_file": measure(
+            lambda: loop.run_until_complete(tts_with_temp_file(tts_chunks)), args.runs),
+        "tts_in_memory": measure(
+            lambda: loop.run_until_complete(tts_in_memory(tts_chunks)), args.runs),
+    }
+    loop.close()
+    os.rmdir(temp_dir)
+
+    results["saved_per_request_ms"] = round(
+        results["upload_temp_file"]["mean_ms"] - results["upload_in_memory"]["mean_ms"]
+        + results["tts_temp_file"]["mean_ms"] - results["tts_in_memory"]["mean_ms"],
+        3,
+    )
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
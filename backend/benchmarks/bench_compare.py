@@ -0,0 +1,122 @@
+"""
+对比两次 bench_e2e.py 的结果，找出性能回退
+
+延迟类指标（p50/p95/p99）增加、吞吐量下降超过阈值时视为回退，存在回退时以退出码1结束，
+可以直接用于CI。
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_compare.py results/base.json results/head.json --threshold 0.1
+"""
+import sys
+import json
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+LATENCY_GROUPS = ("time_to_first_text", "time_to_first_audio", "total_time")
+PERCENTILES = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if old is None or new is None or old == 0:
+        return None
+    return (new - old) / old
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> Tuple[List[List[str]], List[str]]:
+    """
+    逐个接口对比指标
+
+    Returns:
+        Tuple: (表格行, 回退说明列表)
+    """
+    rows: List[List[str]] = []
+    regressions: List[str] = []
+    base_results = {r["endpoint"]: r for r in base["results"]}
+    for result in head["results"]:
+        endpoint = result["endpoint"]
+        old = base_results.get(endpoint)
+        if old is None:
+            continue
+        metrics = [("throughput_rps", old.get("throughput_rps"), result.get("throughput_rps"), True)]
+        for group in LATENCY_GROUPS:
+            for p in PERCENTILES:
+                metrics.append((
+                    f"{group}.{p}",
+                    (old.get(group) or {}).get(p),
+                    (result.get(group) or {}).get(p),
+                    False,
+                ))
+        metrics.append(("errors", old.get("errors"), result.get("errors"), False))
+        metrics.append((
+            "memory_per_connection_kb",
+            old.get("memory_per_connection_kb"),
+            result.get("memory_per_connection_kb"),
+            False,
+        ))
+
+        for name, old_value, new_value, higher_is_better in metrics:
+            if old_value is None and new_value is None:
+                continue
+            change = _change(old_value, new_value)
+            mark = ""
+            if name == "errors":
+                if (new_value or 0) > (old_value or 0):
+                    mark = "REGRESSION"
+            elif change is not None and name != "memory_per_connection_kb":
+                # 内存采样受GC时机影响较大，只展示不判定
+                worse = -change if higher_is_better else change
+                if worse > threshold:
+                    mark = "REGRESSION"
+                elif worse < -threshold:
+                    mark = "improved"
+            if mark == "REGRESSION":
+                regressions.append(f"{endpoint} {name}: {old_value} -> {new_value}")
+            rows.append([
+                endpoint,
+                name,
+                "-" if old_value is None else str(old_value),
+                "-" if new_value is None else str(new_value),
+                "-" if change is None else f"{change * 100:+.1f}%",
+                mark,
+            ])
+    return rows, regressions
+
+
+def _print_table(rows: List[List[str]]):
+    header = ["endpoint", "metric", "base", "head", "change", ""]
+    widths = [max(len(r[i]) for r in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次端到端压测结果")
+    parser.add_argument("base", help="基准结果JSON")
+    parser.add_argument("head", help="新结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为回退的相对变化（默认10%%）")
+    args = parser.parse_args()
+
+    base = _load(args.base)
+    head = _load(args.head)
+    if base.get("config") != head.get("config"):
+        print("警告: 两次压测的配置不同，结果可能不可比")
+    print(f"base: {base.get('commit')} ({base.get('timestamp')})  head: {head.get('commit')} ({head.get('timestamp')})")
+
+    rows, regressions = compare(base, head, args.threshold)
+    if rows:
+        _print_table(rows)
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项回退（阈值 {args.threshold * 100:.0f}%）:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n未发现回退")
+
+
+if __name__ == "__main__":
+    main()
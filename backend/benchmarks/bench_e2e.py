@@ -0,0 +1,375 @@
+"""
+端到端压测：在本地桩服务上完整跑通 识别 -> LLM -> 语音合成 流程，可以完全离线运行
+
+OpenAI兼容对话接口、SiliconFlow语音识别/合成由本地桩服务模拟（可配置首token延迟和token间隔），
+edge-tts 在后端进程内替换为按固定延迟返回音频的桩实现。后端在单独的子进程中运行，
+以便统计服务端进程的内存占用。
+
+对每个接口按指定并发发送请求，统计：
+- 吞吐量（请求/秒）和错误数
+- 首个文本的时间（非流式接口为完整响应时间）的 p50/p95/p99
+- 首个音频的时间（非流式接口为完整响应时间）的 p50/p95/p99
+- 后端进程常驻内存的基线、峰值以及每个并发连接的平均增量
+
+结果保存为JSON，可以用 bench_compare.py 对比两次提交的结果。
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_e2e.py --requests 200 --concurrency 20 --output results/e2e.json
+    python benchmarks/bench_e2e.py --endpoints stream,audio_stream --stream-audio --token-interval-ms 20
+"""
+import os
+import sys
+import json
+import time
+import wave
+import signal
+import asyncio
+import argparse
+import datetime
+import platform
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubServer, create_stub_app, create_stub_communicate  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 接口名 -> (路径, 是否上传音频, 是否为SSE流)
+ENDPOINTS = {
+    "chat": ("/api/chat", True, False),
+    "text": ("/api/chat/text", False, False),
+    "stream": ("/api/chat/stream", False, True),
+    "audio_stream": ("/api/chat/audio/stream", True, True),
+    # 流式语音合成，首个音频的时间为收到第一个音频字节的时间
+    "tts": ("/api/tts/stream", False, False),
+}
+
+
+def make_speech_wav(seconds: float = 2.0, sample_rate: int = 16000) -> bytes:
+    """生成首尾带静音、中间为类语音信号的WAV，能够通过语音活动检测"""
+    import io
+
+    rng = np.random.default_rng(0)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    envelope = np.zeros(n, dtype=np.float32)
+    envelope[int(0.15 * n):int(0.85 * n)] = 1.0
+    # 基频加谐波，并用4Hz包络模拟音节起伏
+    voiced = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in (1, 2, 3))
+    voiced *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 4 * t))
+    signal_ = 0.25 * envelope * voiced + 0.002 * rng.standard_normal(n)
+    pcm = (np.clip(signal_, -1, 1) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wave_file:
+        wave_file.setnchannels(1)
+        wave_file.setsampwidth(2)
+        wave_file.setframerate(sample_rate)
+        wave_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(values, p)) * 1000, 2)
+
+
+def _latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50_ms": _percentile(values, 50),
+        "p95_ms": _percentile(values, 95),
+        "p99_ms": _percentile(values, 99),
+    }
+
+
+def _rss_bytes(pid: int) -> int:
+    """读取进程常驻内存（仅Linux）"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class MemorySampler:
+    """在后台线程中定期采样后端进程的常驻内存，记录峰值"""
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = _rss_bytes(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def _one_request(client: httpx.AsyncClient, endpoint: str, args, wav: bytes) -> Dict[str, Any]:
+    """
+    发送一个请求
+
+    Returns:
+        Dict: {"ok", "total", "first_text", "first_audio"}，时间单位为秒
+    """
+    path, upload, is_stream = ENDPOINTS[endpoint]
+    fields = {
+        "systemPrompt": "你是一个友好的AI助手。",
+        "model": "DeepSeek-V3",
+        "enableVoiceResponse": "true" if args.voice else "false",
+        "audioDelivery": args.audio_delivery,
+    }
+    if args.stream_audio:
+        fields["streamAudio"] = "true"
+    if upload:
+        request = {"files": {"audio": ("speech.wav", wav, "audio/wav")}, "data": fields}
+    else:
+        body = {**fields, "text": "请用几句话介绍一下你自己", "history": []}
+        body["enableVoiceResponse"] = args.voice
+        if args.stream_audio:
+            body["streamAudio"] = True
+        request = {"json": body}
+
+    start = time.perf_counter()
+    result = {"ok": False, "total": None, "first_text": None, "first_audio": None}
+    if endpoint == "tts":
+        body = {"text": "这是一段用于测试流式语音合成的文本。", "voice": None}
+        async with client.stream("POST", path, json=body) as response:
+            async for chunk in response.aiter_bytes():
+                if chunk and result["first_audio"] is None:
+                    result["first_audio"] = time.perf_counter() - start
+        result["total"] = result["first_text"] = time.perf_counter() - start
+        result["ok"] = response.status_code == 200 and result["first_audio"] is not None
+        return result
+    if not is_stream:
+        response = await client.post(path, **request)
+        elapsed = time.perf_counter() - start
+        data = response.json() if response.status_code == 200 else {}
+        result["ok"] = bool(data.get("success"))
+        result["total"] = result["first_text"] = elapsed
+        if data.get("audio_response") or data.get("audio_url"):
+            result["first_audio"] = elapsed
+        return result
+
+    async with client.stream("POST", path, **request) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return result
+        error = False
+        async for line in response.aiter_lines():
+            if line.startswith("event:") and line[6:].strip() == "error":
+                error = True
+            if not line.startswith("data:"):
+                continue
+            try:
+                event = json.loads(line[5:])
+            except json.JSONDecodeError:
+                continue
+            event_type = event.get("type") if isinstance(event, dict) else None
+            now = time.perf_counter() - start
+            if event_type == "text" and result["first_text"] is None:
+                result["first_text"] = now
+            elif event_type in ("audio", "audio_chunk") and result["first_audio"] is None:
+                result["first_audio"] = now
+    result["total"] = time.perf_counter() - start
+    result["ok"] = not error and result["first_text"] is not None
+    return result
+
+
+async def run_endpoint(base_url: str, endpoint: str, args, wav: bytes, server_pid: int) -> Dict[str, Any]:
+    """对一个接口按指定并发发送请求并汇总结果"""
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # 预热：建立连接、触发各模块的惰性初始化
+        for _ in range(args.warmup):
+            await _one_request(client, endpoint, args, wav)
+
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    results.append(await _one_request(client, endpoint, args, wav))
+                except httpx.HTTPError:
+                    results.append({"ok": False})
+
+        with MemorySampler(server_pid) as memory:
+            start = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+            elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r.get("ok")]
+    first_text = [r["first_text"] for r in ok if r.get("first_text") is not None]
+    first_audio = [r["first_audio"] for r in ok if r.get("first_audio") is not None]
+    total = [r["total"] for r in ok]
+    growth = max(0, memory.peak - memory.baseline)
+    return {
+        "endpoint": endpoint,
+        "path": ENDPOINTS[endpoint][0],
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0,
+        "time_to_first_text": _latency_summary(first_text),
+        "time_to_first_audio": _latency_summary(first_audio),
+        "total_time": _latency_summary(total),
+        "rss_baseline_mb": round(memory.baseline / 1024 / 1024, 1),
+        "rss_peak_mb": round(memory.peak / 1024 / 1024, 1),
+        "memory_per_connection_kb": round(growth / 1024 / args.concurrency, 1),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("后端进程启动失败")
+        try:
+            if httpx.get(f"{base_url}/api/stats", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("等待后端启动超时")
+
+
+def serve(args):
+    """子进程入口：替换edge-tts后启动后端"""
+    import edge_tts
+    import uvicorn
+
+    edge_tts.Communicate = create_stub_communicate(args.tts_latency_ms, args.audio_bytes)
+    import main
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测（本地桩服务，离线运行）")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="逗号分隔: " + ",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=200, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--first-token-ms", type=float, default=100, help="对话桩服务的首token延迟")
+    parser.add_argument("--token-interval-ms", type=float, default=10, help="对话桩服务的token间隔")
+    parser.add_argument("--tokens", type=int, default=40, help="每次回复的token数")
+    parser.add_argument("--stt-latency-ms", type=float, default=100, help="识别/SiliconFlow合成桩服务的延迟")
+    parser.add_argument("--tts-latency-ms", type=float, default=80, help="edge-tts桩的首块音频延迟")
+    parser.add_argument("--audio-bytes", type=int, default=30000, help="每段合成音频的大小")
+    parser.add_argument("--audio-seconds", type=float, default=2.0, help="上传音频的时长")
+    parser.add_argument("--tts-service", default="edge_tts", choices=["edge_tts", "cosyvoice"])
+    parser.add_argument("--no-voice", dest="voice", action="store_false", help="不生成语音回复")
+    parser.add_argument("--stream-audio", action="store_true", help="流式接口按句子增量合成语音")
+    parser.add_argument("--audio-delivery", default="base64", choices=["base64", "url"])
+    parser.add_argument("--tts-cache", action="store_true", help="启用语音合成缓存（默认关闭，避免相同回复全部命中缓存）")
+    parser.add_argument("--stub-port", type=int, default=18090)
+    parser.add_argument("--port", type=int, default=18000, help="后端端口")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知的接口: {', '.join(unknown)}")
+
+    stub_app = create_stub_app(
+        latency_ms=args.stt_latency_ms,
+        audio_bytes=args.audio_bytes,
+        first_token_ms=args.first_token_ms,
+        token_interval_ms=args.token_interval_ms,
+        tokens=args.tokens,
+    )
+    with StubServer(stub_app, port=args.stub_port) as stub:
+        env = {
+            **os.environ,
+            "PYTHONPATH": BACKEND_DIR,
+            "MODEL_SERVICE": "openai",
+            "OPENAI_API_BASIC": f"{stub.base_url}/v1",
+            "OPENAI_API_KEY": "benchmark",
+            "LLM_BACKENDS": "",
+            "STT_SERVICE": "siliconflow",
+            "SILICONFLOW_API_BASE": f"{stub.base_url}/v1",
+            "TTS_SERVICE": args.tts_service,
+            "TTS_CACHE_ENABLED": "true" if args.tts_cache else "false",
+            "TTS_CACHE_DIR": "",
+            "RESPONSE_CACHE_ENABLED": "false",
+            # 压测时只保留警告日志
+            "LOG_LEVEL": "WARNING",
+            "STT_QUEUE_SIZE": str(max(args.concurrency * 2, 64)),
+        }
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--serve"]
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            _wait_ready(base_url, process)
+            wav = make_speech_wav(args.audio_seconds)
+            results = []
+            for endpoint in endpoints:
+                result = asyncio.run(run_endpoint(base_url, endpoint, args, wav, process.pid))
+                print(json.dumps(result, ensure_ascii=False))
+                results.append(result)
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "benchmark": "e2e",
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "serve")},
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
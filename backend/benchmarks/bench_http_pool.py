@@ -0,0 +1,81 @@
+"""
+共享HTTP连接池基准测试
+
+对比每次请求新建 httpx.AsyncClient 与使用共享连接池时，语音合成请求的 p50/p99 延迟。
+外部API由本地桩服务模拟（明文HTTP，未包含TLS握手开销，真实环境下差距更大）。
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_http_pool.py --requests 500 --concurrency 20
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubServer, create_stub_app  # noqa: E402
+
+
+async def run(url: str, total: int, concurrency: int, pooled: bool):
+    from http_client import close_http_client, request_with_retry
+
+    payload = {"model": "FunAudioLLM/CosyVoice2-0.5B", "input": "你好", "voice": "anna"}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            if pooled:
+                response = await request_with_retry("POST", url, json=payload)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(url, json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+    await close_http_client()
+
+    latencies.sort()
+    return {
+        "pooled": pooled,
+        "requests": total,
+        "concurrency": concurrency,
+        "requests_per_s": round(total / elapsed, 1),
+        "p50_ms": round(latencies[total // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(total * 0.99) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享HTTP连接池基准测试")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20, help="桩服务处理延迟")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    results = []
+    with StubServer(create_stub_app(args.latency_ms), port=args.port) as server:
+        url = f"{server.base_url}/v1/audio/speech"
+        for pooled in (False, True):
+            result = asyncio.run(run(url, args.requests, args.concurrency, pooled))
+            print(json.dumps(result))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+流式回复事件序列化开销的基准测试
+
+模拟一轮回复的文本增量，对比每轮在事件序列化上花费的CPU时间：
+- dict_events: 原来的方式，每个增量 json.dumps 成字典事件，combined_stream 再 json.loads 判断类型，
+  最后由 sse_starlette 编码为SSE帧
+- stream_events: StreamEvent 直接按类型判断，每个事件只序列化一次（安装了orjson时使用orjson）
+- coalesced: 在 stream_events 的基础上按时间窗口合并文本增量（增量之间的间隔用 --token-interval-ms 模拟），
+  与相同输入下不合并（uncoalesced）的CPU时间、帧数和字节数对比
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_sse_events.py --tokens 300 --runs 200
+    python benchmarks/bench_sse_events.py --coalesce-ms 30 --token-interval-ms 5 --coalesce-runs 5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from sse_starlette.sse import ServerSentEvent
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse_events import StreamEvent, coalesce_text, orjson  # noqa: E402
+
+PIECES = ["你好", "，", "这是", "一段", "测试", "回复", "。", "Hello", " world", "!"]
+
+
+def dict_events(tokens: int) -> int:
+    """原来的流程，返回发送的字节数"""
+    sent = 0
+    for i in range(tokens):
+        event = {"event": "message", "data": json.dumps({"type": "text", "content": PIECES[i % len(PIECES)]})}
+        event_data = json.loads(event["data"]) if "data" in event else {}
+        if event_data.get("type") in ("audio", "audio_chunk"):
+            continue
+        sent += len(ServerSentEvent(**event, sep="\r\n").encode())
+    return sent
+
+
+def stream_events(tokens: int) -> int:
+    sent = 0
+    for i in range(tokens):
+        event = StreamEvent.text(PIECES[i % len(PIECES)])
+        if event.type in ("audio", "audio_chunk"):
+            continue
+        sent += len(event.encode())
+    return sent
+
+
+async def coalesced(tokens: int, window_ms: float, max_bytes: int, interval_ms: float):
+    """返回 (CPU耗时, 帧数, 字节数)；等待增量到达的时间不计入CPU耗时"""
+    async def source():
+        for i in range(tokens):
+            if interval_ms > 0:
+                await asyncio.sleep(interval_ms / 1000)
+            yield StreamEvent.text(PIECES[i % len(PIECES)])
+
+    cpu_started = time.process_time()
+    frames = 0
+    sent = 0
+    async for event in coalesce_text(source(), window_ms, max_bytes):
+        frames += 1
+        sent += len(event.encode())
+    return time.process_time() - cpu_started, frames, sent
+
+
+def measure(fn, runs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式回复事件序列化开销基准测试")
+    parser.add_argument("--tokens", type=int, default=300, help="每轮回复的文本增量数")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--coalesce-ms", type=float, default=30)
+    parser.add_argument("--coalesce-bytes", type=int, default=0)
+    parser.add_argument("--token-interval-ms", type=float, default=5)
+    parser.add_argument("--coalesce-runs", type=int, default=3)
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    results = {
+        "orjson": orjson is not None,
+        "tokens": args.tokens,
+        "dict_events_ms_per_turn": round(measure(lambda: dict_events(args.tokens), args.runs), 4),
+        "stream_events_ms_per_turn": round(measure(lambda: stream_events(args.tokens), args.runs), 4),
+        "dict_events_bytes": dict_events(args.tokens),
+        "stream_events_bytes": stream_events(args.tokens),
+    }
+    for name, window_ms in (("uncoalesced", 0), ("coalesced", args.coalesce_ms)):
+        cpu, frames, sent = 0.0, 0, 0
+        for _ in range(args.coalesce_runs):
+            run_cpu, frames, sent = asyncio.run(coalesced(
+                args.tokens, window_ms, args.coalesce_bytes, args.token_interval_ms))
+            cpu += run_cpu
+        results.update({
+            f"{name}_cpu_ms_per_turn": round(cpu / args.coalesce_runs * 1000, 4),
+            f"{name}_frames": frames,
+            f"{name}_bytes": sent,
+        })
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+冷启动基准测试
+
+分别统计不同模型加载方式（STT_LOAD_MODE）下：
+- import_s: 导入 main 模块的耗时
+- listen_s: 从启动进程到开始接受HTTP请求的耗时
+- ready_s: 从启动进程到 /api/ready 返回200的耗时（模型加载和预热完成）
+- first_request_ms: 就绪后第一个 /api/chat 请求的耗时
+
+对话和语音接口由本地桩服务模拟，使用本地Whisper时需要提前下载好模型。
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_startup.py --runs 3
+    STT_SERVICE=whisper WHISPER_MODEL_SIZE=base python benchmarks/bench_startup.py --load-modes background,eager,lazy
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubServer, create_stub_app  # noqa: E402
+from benchmarks.bench_e2e import BACKEND_DIR, make_speech_wav  # noqa: E402
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """在新进程中测量导入main模块的耗时"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL, text=True
+    )
+    return float(output.strip().splitlines()[-1])
+
+
+def _poll(url: str, process: subprocess.Popen, deadline: float) -> Optional[httpx.Response]:
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("后端进程已退出")
+        try:
+            return httpx.get(url, timeout=1)
+        except httpx.HTTPError:
+            time.sleep(0.02)
+    return None
+
+
+def measure_startup(env: Dict[str, str], port: int, wav: bytes, timeout: float) -> Dict[str, Any]:
+    """启动一次后端进程，测量开始监听、就绪和第一个请求的耗时"""
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    deadline = time.time() + timeout
+    result: Dict[str, Any] = {"listen_s": None, "ready_s": None, "first_request_ms": None}
+    try:
+        if _poll(f"{base_url}/api/stats", process, deadline) is None:
+            return result
+        result["listen_s"] = round(time.perf_counter() - started, 3)
+
+        while time.time() < deadline:
+            response = _poll(f"{base_url}/api/ready", process, deadline)
+            if response is not None and response.status_code == 200:
+                result["ready_s"] = round(time.perf_counter() - started, 3)
+                result["stt"] = response.json().get("stt")
+                break
+            if response is not None and response.json().get("stt", {}).get("state") == "failed":
+                result["stt"] = response.json().get("stt")
+                return result
+            time.sleep(0.02)
+        if result["ready_s"] is None:
+            return result
+
+        request_started = time.perf_counter()
+        response = httpx.post(
+            f"{base_url}/api/chat",
+            files={"audio": ("speech.wav", wav, "audio/wav")},
+            timeout=timeout,
+        )
+        if response.status_code == 200 and response.json().get("success"):
+            result["first_request_ms"] = round((time.perf_counter() - request_started) * 1000, 1)
+        return result
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--load-modes", default="background,eager,lazy")
+    parser.add_argument("--runs", type=int, default=3, help="每种加载方式的启动次数，结果取中位数")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="关闭模型预热")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--stub-port", type=int, default=18090)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    wav = make_speech_wav()
+    results = []
+    with StubServer(create_stub_app(latency_ms=20), port=args.stub_port) as stub:
+        base_env = {
+            **os.environ,
+            "PYTHONPATH": BACKEND_DIR,
+            "MODEL_SERVICE": "openai",
+            "OPENAI_API_BASIC": f"{stub.base_url}/v1",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+            "STT_SERVICE": os.environ.get("STT_SERVICE", "siliconflow"),
+            "SILICONFLOW_API_BASE": f"{stub.base_url}/v1",
+            "TTS_SERVICE": "cosyvoice",
+            "TTS_CACHE_DIR": "",
+            "STT_WARMUP": "true" if args.warmup else "false",
+            "LOG_LEVEL": "WARNING",
+        }
+        for load_mode in [m.strip() for m in args.load_modes.split(",") if m.strip()]:
+            env = {**base_env, "STT_LOAD_MODE": load_mode}
+            imports = [measure_import(env) for _ in range(args.runs)]
+            runs = [measure_startup(env, args.port, wav, args.timeout) for _ in range(args.runs)]
+            result = {
+                "stt_service": env["STT_SERVICE"],
+                "load_mode": load_mode,
+                "warmup": args.warmup,
+                "runs": args.runs,
+                "import_s": _median(imports),
+                "listen_s": _median([r["listen_s"] for r in runs]),
+                "ready_s": _median([r["ready_s"] for r in runs]),
+                "first_request_ms": _median([r["first_request_ms"] for r in runs]),
+                "stt": runs[-1].get("stt"),
+            }
+            print(json.dumps(result, ensure_ascii=False))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
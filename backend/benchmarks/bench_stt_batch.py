@@ -0,0 +1,118 @@
+"""
+本地Whisper动态批处理基准测试
+
+比较不同batch大小下的吞吐量（条/秒）和单条延迟。
+
+用法（在 backend 目录下运行）:
+    STT_SERVICE=whisper python benchmarks/bench_stt_batch.py --audio-dir ./samples --batch-sizes 1,2,4,8
+不指定 --audio-dir 时会生成若干段合成的WAV音频（只用于衡量计算量，识别内容没有意义）。
+"""
+import os
+import sys
+import time
+import wave
+import json
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stt import STT  # noqa: E402
+from stt_executor import STTExecutor  # noqa: E402
+
+
+def generate_clips(directory: str, count: int, sample_rate: int = 16000):
+    """生成时长在1~8秒之间的合成音频"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        duration = rng.uniform(1, 8)
+        t = np.arange(int(duration * sample_rate)) / sample_rate
+        signal = 0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t)
+        signal += 0.05 * rng.standard_normal(len(t))
+        pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+        path = os.path.join(directory, f"clip_{i}.wav")
+        with wave.open(path, "wb") as wave_file:
+            wave_file.setnchannels(1)
+            wave_file.setsampwidth(2)
+            wave_file.setframerate(sample_rate)
+            wave_file.writeframes(pcm.tobytes())
+        paths.append(path)
+    return paths
+
+
+async def run_once(stt, paths, batch_size: int, wait_ms: float):
+    executor = STTExecutor(
+        lambda: stt,
+        batch_size=batch_size,
+        queue_size=len(paths),
+        length_fn=STT.audio_duration,
+    )
+    if executor.batcher:
+        executor.batcher.max_wait = wait_ms / 1000
+
+    latencies = []
+
+    async def one(path):
+        start = time.perf_counter()
+        await executor.transcribe(path)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(path) for path in paths])
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    latencies.sort()
+    return {
+        "batch_size": batch_size,
+        "utterances": len(paths),
+        "elapsed_s": round(elapsed, 3),
+        "utterances_per_s": round(len(paths) / elapsed, 2),
+        "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper动态批处理基准测试")
+    parser.add_argument("--audio-dir", help="测试音频目录，默认生成合成音频")
+    parser.add_argument("--count", type=int, default=32, help="合成音频数量")
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--wait-ms", type=float, default=20)
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    if args.audio_dir:
+        paths = sorted(
+            os.path.join(args.audio_dir, name)
+            for name in os.listdir(args.audio_dir)
+            if name.lower().endswith((".wav", ".mp3", ".webm", ".ogg", ".m4a"))
+        )
+        temp_dir = None
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        paths = generate_clips(temp_dir.name, args.count)
+
+    stt = STT()
+    # 预热，避免第一次推理的初始化开销计入结果
+    stt.transcribe(paths[0])
+
+    results = []
+    for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+        result = asyncio.run(run_once(stt, paths, batch_size, args.wait_ms))
+        print(json.dumps(result, ensure_ascii=False))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if temp_dir:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+本地识别引擎对比：实时率（RTF）与词错误率（WER）
+
+在同一组样例音频上依次运行各个引擎/精度组合，报告：
+- rtf: 识别耗时 / 音频时长，越小越快
+- wer: 与参考文本相比的错误率（中文按字、英文按词计算，忽略大小写和标点）
+- wer_delta: 与第一个引擎相比的错误率变化，用于确认量化后的准确率没有明显下降
+- agreement_error: 与第一个引擎识别结果之间的差异率
+
+样例清单为 benchmarks/samples/manifest.jsonl（每行包含 id、text、voice、audio），音频不随代码提交，
+首次运行时加 --prepare 用 edge-tts 按清单生成（需要联网和ffmpeg）；也可以用 --manifest 指定自己录制的数据集。
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_stt_engines.py --prepare
+    python benchmarks/bench_stt_engines.py --engines whisper:float32,whisper:int8,faster_whisper:int8 --threads 4
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import unicodedata
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_utils import SAMPLE_RATE, decode_audio, encode_wav  # noqa: E402
+from stt_engines import create_engine  # noqa: E402
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples", "manifest.jsonl")
+
+# 中文按单字、其他语言按单词切分
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff]|[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower())
+
+
+def edit_distance(reference: List[str], hypothesis: List[str]) -> int:
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_token in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_token in enumerate(hypothesis, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_token != hyp_token),
+            )
+        previous = current
+    return previous[-1]
+
+
+def error_rate(references: List[str], hypotheses: List[str]) -> float:
+    """整个数据集的错误率：总编辑距离 / 参考文本总长度"""
+    errors = 0
+    total = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        ref_tokens = tokenize(reference)
+        errors += edit_distance(ref_tokens, tokenize(hypothesis))
+        total += len(ref_tokens)
+    return round(errors / total, 4) if total else 0.0
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    base_dir = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                item["path"] = os.path.join(base_dir, item["audio"])
+                items.append(item)
+    return items
+
+
+async def prepare_clips(items: List[Dict[str, Any]]):
+    """用edge-tts合成清单中缺少的音频，转换为16kHz单声道WAV"""
+    import edge_tts
+
+    for item in items:
+        if os.path.exists(item["path"]):
+            continue
+        os.makedirs(os.path.dirname(item["path"]), exist_ok=True)
+        audio = bytearray()
+        async for chunk in edge_tts.Communicate(item["text"], item.get("voice", "zh-CN-XiaoxiaoNeural")).stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        with open(item["path"], "wb") as f:
+            f.write(encode_wav(decode_audio(bytes(audio))))
+        print(f"已生成 {item['path']}")
+
+
+def run_engine(spec: str, model_size: str, threads: int, clips: List[Dict[str, Any]]) -> Dict[str, Any]:
+    name, _, compute_type = spec.partition(":")
+    engine = create_engine(name, model_size, compute_type or "default", threads)
+    started = time.perf_counter()
+    engine.load()
+    load_seconds = time.perf_counter() - started
+    # 预热一次，不计入结果
+    engine.transcribe(clips[0]["samples"])
+
+    hypotheses = []
+    elapsed = 0.0
+    for clip in clips:
+        started = time.perf_counter()
+        result = engine.transcribe(clip["samples"])
+        elapsed += time.perf_counter() - started
+        hypotheses.append(result.get("text", ""))
+
+    audio_seconds = sum(len(clip["samples"]) for clip in clips) / SAMPLE_RATE
+    return {
+        **engine.describe(),
+        "spec": spec,
+        "model": model_size,
+        "load_s": round(load_seconds, 2),
+        "audio_s": round(audio_seconds, 2),
+        "transcribe_s": round(elapsed, 3),
+        "rtf": round(elapsed / audio_seconds, 4),
+        "wer": error_rate([clip["text"] for clip in clips], hypotheses),
+        "hypotheses": hypotheses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地识别引擎RTF/WER对比")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--prepare", action="store_true", help="用edge-tts生成清单中缺少的音频")
+    parser.add_argument("--engines", default="whisper:float32,whisper:int8,faster_whisper:int8",
+                        help="逗号分隔的 引擎:精度，第一个作为对比基准")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL_SIZE", "base"))
+    parser.add_argument("--threads", type=int, default=0, help="每个引擎的CPU线程数，0为默认")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    items = load_manifest(args.manifest)
+    if args.prepare:
+        asyncio.run(prepare_clips(items))
+    missing = [item["id"] for item in items if not os.path.exists(item["path"])]
+    if missing:
+        parser.error(f"缺少样例音频: {', '.join(missing)}（使用 --prepare 生成）")
+    for item in items:
+        with open(item["path"], "rb") as f:
+            item["samples"] = decode_audio(f.read())
+
+    results = []
+    for spec in [s.strip() for s in args.engines.split(",") if s.strip()]:
+        result = run_engine(spec, args.model, args.threads, items)
+        if results:
+            baseline = results[0]
+            result["wer_delta"] = round(result["wer"] - baseline["wer"], 4)
+            result["speedup"] = round(baseline["rtf"] / result["rtf"], 2) if result["rtf"] else None
+            result["agreement_error"] = error_rate(baseline["hypotheses"], result["hypotheses"])
+        print(json.dumps({k: v for k, v in result.items() if k != "hypotheses"}, ensure_ascii=False))
+        results.append(result)
+
+    if args.output:
+        for result in results:
+            result["clips"] = [
+                {"id": item["id"], "reference": item["text"], "hypothesis": hypothesis}
+                for item, hypothesis in zip(items, result.pop("hypotheses"))
+            ]
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+基准测试用的本地桩服务，模拟外部API，使测试可以完全离线运行
+"""
+import json
+import time
+import asyncio
+import threading
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def create_stub_app(
+    latency_ms: float = 20,
+    audio_bytes: int = 30000,
+    first_token_ms: float = None,
+    token_interval_ms: float = 5,
+    tokens: int = 40,
+) -> FastAPI:
+    """
+    创建模拟 SiliconFlow 语音合成/识别接口和OpenAI兼容对话接口的应用
+
+    Args:
+        latency_ms (float): 每个请求的服务端处理延迟（毫秒）
+        audio_bytes (int): 语音合成返回的音频大小
+        first_token_ms (float): 对话接口的首token延迟（毫秒），默认与latency_ms相同
+        token_interval_ms (float): 对话接口相邻token的间隔（毫秒）
+        tokens (int): 对话接口每次回复的token数
+    """
+    app = FastAPI()
+    fake_audio = b"\xff\xfb\x90\x64" + b"\x00" * (audio_bytes - 4)
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        await request.body()
+
+        # 与真实服务一样分块返回音频，第一块在latency_ms之后到达
+        async def chunks():
+            await asyncio.sleep(latency_ms / 1000)
+            for offset in range(0, len(fake_audio), 4096):
+                yield fake_audio[offset:offset + 4096]
+
+        return StreamingResponse(chunks(), media_type="audio/mpeg")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        await request.body()
+        await asyncio.sleep(latency_ms / 1000)
+        return {"text": "这是一段测试识别结果"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        first_delay = (latency_ms if first_token_ms is None else first_token_ms) / 1000
+        pieces = ["这是第{}句测试回复。".format(i // 8) if i % 8 == 7 else "测试" for i in range(tokens)]
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_delay + token_interval_ms * tokens / 1000)
+            return {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop",
+                }],
+            }
+
+        async def events():
+            await asyncio.sleep(first_delay)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(token_interval_ms / 1000)
+                chunk = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def create_stub_communicate(latency_ms: float = 50, audio_bytes: int = 30000, chunk_bytes: int = 4096):
+    """
+    创建替代 edge_tts.Communicate 的类，按固定延迟分块返回音频，不访问网络
+
+    Args:
+        latency_ms (float): 第一块音频到达前的延迟（毫秒）
+        audio_bytes (int): 每次合成返回的音频大小
+        chunk_bytes (int): 每块音频的大小
+    """
+    fake_audio = b"\xff\xfb\x90\x64" + b"\x00" * (audio_bytes - 4)
+
+    class StubCommunicate:
+        def __init__(self, text: str, voice: str = None, **kwargs):
+            self.text = text
+            self.voice = voice
+
+        async def stream(self):
+            await asyncio.sleep(latency_ms / 1000)
+            for offset in range(0, len(fake_audio), chunk_bytes):
+                yield {"type": "audio", "data": fake_audio[offset:offset + chunk_bytes]}
+            yield {"type": "WordBoundary", "offset": 0, "duration": 0, "text": self.text}
+
+    return StubCommunicate
+
+
+class StubServer:
+    """在后台线程中运行桩服务"""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 18080):
+        self.host = host
+        self.port = port
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host=host, port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
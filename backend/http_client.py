@@ -0,0 +1,133 @@
+import logging
+import os
+import random
+import asyncio
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 连接池配置
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+# 超时配置（秒）
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+# 失败重试次数和退避基数（秒）
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.2"))
+# 单次重试等待的上限（秒），上游返回很大的Retry-After时也不会等待更久
+HTTP_RETRY_MAX_BACKOFF = float(os.environ.get("HTTP_RETRY_MAX_BACKOFF", "5"))
+# 包含所有重试在内的总时限（秒），剩余时间不够等待时直接放弃重试
+HTTP_RETRY_DEADLINE = float(os.environ.get("HTTP_RETRY_DEADLINE", "30"))
+# 是否启用HTTP/2（需要安装h2）
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() == "true"
+
+# 这些状态码通常是暂时性的，可以重试
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取应用共享的异步HTTP客户端
+
+    所有TTS/STT等外部服务都复用同一个连接池，避免每次请求重新建立TCP和TLS连接。
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = HTTP2_ENABLED and _http2_available()
+        if HTTP2_ENABLED and not http2:
+            logger.info("未安装h2，共享HTTP客户端使用HTTP/1.1")
+        _client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client():
+    """关闭共享客户端（应用关闭时调用）"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """计算重试等待时间：优先使用Retry-After，否则为带随机抖动的指数退避，不超过HTTP_RETRY_MAX_BACKOFF"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_RETRY_MAX_BACKOFF)
+    return min(random.uniform(0, HTTP_RETRY_BACKOFF * (2 ** attempt)), HTTP_RETRY_MAX_BACKOFF)
+
+
+async def request_with_retry(
+    method: str,
+    url: str,
+    retries: int = HTTP_RETRIES,
+    stream: bool = False,
+    deadline: float = HTTP_RETRY_DEADLINE,
+    **kwargs,
+) -> httpx.Response:
+    """
+    使用共享客户端发送请求，连接错误、超时和暂时性状态码会自动重试
+
+    Args:
+        method (str): HTTP方法
+        url (str): 请求地址
+        retries (int): 最多重试次数
+        stream (bool): 是否以流式读取响应体。为True时只在收到响应头之前重试，
+            返回的响应体尚未读取，调用方读取完后需要调用 aclose()
+        deadline (float): 包含所有重试在内的总时限（秒），等待后会超过时限时不再重试
+        **kwargs: 透传给 httpx.AsyncClient.request 的参数
+
+    Returns:
+        httpx.Response: 最后一次请求的响应
+    """
+    client = get_http_client()
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    for attempt in range(retries + 1):
+        try:
+            if stream:
+                response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+            else:
+                response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            delay = _backoff_delay(attempt)
+            if attempt >= retries or loop.time() + delay >= expires_at:
+                raise
+            logger.warning(f"请求 {url} 失败: {str(e)}，{delay:.2f}秒后重试")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+            delay = _backoff_delay(attempt, response)
+            if loop.time() + delay >= expires_at:
+                # 剩余时间不够等待，直接返回上游的响应，由调用方按失败处理
+                logger.warning(f"请求 {url} 返回 {response.status_code}，剩余时间不足以等待{delay:.2f}秒，不再重试")
+                return response
+            if stream:
+                await response.aclose()
+            logger.warning(f"请求 {url} 返回 {response.status_code}，{delay:.2f}秒后重试")
+            await asyncio.sleep(delay)
+            continue
+        return response
@@ -0,0 +1,346 @@
+import logging
+import os
+import json
+import time
+import random
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+# 多个LLM后端的JSON配置，为空时使用 MODEL_SERVICE / OPENAI_API_BASIC / OLLAMA_API_BASIC 生成单个后端
+LLM_BACKENDS = os.environ.get("LLM_BACKENDS", "")
+# 单个后端默认的最大并发请求数
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "64"))
+# 等待首个token的超时（秒），超时视为后端故障并切换到下一个后端
+LLM_FIRST_TOKEN_TIMEOUT = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT", "20"))
+# 连续失败多少次后熔断，以及熔断持续时间（秒）
+LLM_CIRCUIT_FAILURES = int(os.environ.get("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.environ.get("LLM_CIRCUIT_COOLDOWN", "30"))
+# 首token延迟EWMA的平滑系数
+LLM_EWMA_ALPHA = float(os.environ.get("LLM_EWMA_ALPHA", "0.3"))
+# 请求未指定或后端不支持时使用的逻辑模型名
+LLM_DEFAULT_MODEL = os.environ.get("LLM_DEFAULT_MODEL", "DeepSeek-V3")
+
+# 这些错误说明后端暂时不可用，可以换一个后端重试；其余错误（如参数错误）直接返回
+_FAILOVER_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class NoBackendAvailableError(Exception):
+    """没有可用的LLM后端"""
+
+
+class LLMBackend:
+    """一个OpenAI兼容的LLM服务端点及其运行状态"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        models: Dict[str, str],
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        weight: float = 1.0,
+        max_retries: int = 2,
+    ):
+        """
+        Args:
+            name (str): 后端名称
+            base_url (str): API地址
+            api_key (str): API密钥
+            models (Dict[str, str]): 逻辑模型名 -> 该后端的模型ID，"*" 表示其他所有模型都使用该ID
+            max_concurrency (int): 最大并发请求数
+            weight (float): 权重，越大分到的请求越多
+            max_retries (int): openai客户端在同一后端上的重试次数（多后端时由路由切换后端，默认不重试）
+        """
+        self.name = name
+        self.models = models
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+        self.client = AsyncOpenAI(
+            api_key=api_key or "EMPTY", base_url=base_url, max_retries=max_retries)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.in_flight = 0
+        self.ttft_ewma: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    def model_id(self, model: str) -> Optional[str]:
+        return self.models.get(model) or self.models.get("*")
+
+    @property
+    def circuit(self) -> str:
+        """熔断状态：closed 正常，open 熔断中，half_open 冷却结束等待试探"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < LLM_CIRCUIT_COOLDOWN:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        circuit = self.circuit
+        if circuit == "open":
+            return False
+        # 半开状态只放行一个试探请求
+        return circuit == "closed" or not self._probing
+
+    def acquire(self):
+        self.in_flight += 1
+        self.requests += 1
+        if self.circuit == "half_open":
+            self._probing = True
+
+    def release(self):
+        self.in_flight -= 1
+        # 试探请求被取消时允许下一个请求继续试探
+        self._probing = False
+
+    def record_success(self, ttft: Optional[float] = None):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+        if ttft is not None:
+            if self.ttft_ewma is None:
+                self.ttft_ewma = ttft
+            else:
+                self.ttft_ewma = LLM_EWMA_ALPHA * ttft + (1 - LLM_EWMA_ALPHA) * self.ttft_ewma
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.consecutive_failures >= LLM_CIRCUIT_FAILURES or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "circuit": self.circuit,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "ttft_ms_ewma": round(self.ttft_ewma * 1000, 1) if self.ttft_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class RoutedStream:
+    """
+    路由后的流式响应，接口与openai的AsyncStream一致（异步迭代和close）
+
+    首个chunk已经在选择后端时取到，迭代结束、出错或关闭时释放后端的并发名额。
+    """
+
+    def __init__(self, backend: LLMBackend, stream, first_chunk):
+        self.backend = backend
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._first_chunk = first_chunk
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self.backend.release()
+            self.backend.semaphore.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first_chunk is not None:
+            chunk, self._first_chunk = self._first_chunk, None
+            return chunk
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            # 包括StopAsyncIteration：流已结束
+            self._release()
+            raise
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+class LLMRouter:
+    """
+    多后端LLM路由
+
+    每个逻辑模型可以由多个OpenAI兼容端点（如多台Ollama和云端API）提供。
+    按 首token延迟EWMA ×（进行中请求数 + 1）/ 权重 选择后端，受单后端并发上限约束；
+    连续失败的后端会被熔断一段时间。流式请求在拿到首个token之前失败或超时会自动切换到下一个后端。
+    """
+
+    def __init__(self, backends: List[LLMBackend]):
+        if not backends:
+            raise ValueError("至少需要配置一个LLM后端")
+        self.backends = backends
+        self.failovers = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, model_map: Dict[str, str]) -> "LLMRouter":
+        """
+        从环境变量创建路由
+
+        LLM_BACKENDS 示例:
+        [{"name": "gpu-1", "base_url": "http://10.0.0.1:11434/v1", "models": {"*": "qwen2.5:7b"}, "max_concurrency": 4},
+         {"name": "cloud", "base_url": "https://api.siliconflow.cn/v1", "api_key": "sk-...", "models": {"DeepSeek-V3": "deepseek-ai/DeepSeek-V3"}}]
+        未配置时按原有的 MODEL_SERVICE 开关生成单个后端。
+        """
+        if LLM_BACKENDS:
+            configs = json.loads(LLM_BACKENDS)
+            return cls([
+                LLMBackend(
+                    name=config.get("name", f"backend-{i}"),
+                    base_url=config.get("base_url"),
+                    api_key=config.get("api_key"),
+                    models=config.get("models") or dict(model_map),
+                    max_concurrency=int(config.get("max_concurrency", LLM_MAX_CONCURRENCY)),
+                    weight=float(config.get("weight", 1.0)),
+                    max_retries=int(config.get("max_retries", 0 if len(configs) > 1 else 2)),
+                )
+                for i, config in enumerate(configs)
+            ])
+
+        if os.environ.get("MODEL_SERVICE") == "ollama":
+            backend = LLMBackend(
+                "ollama",
+                os.environ.get("OLLAMA_API_BASIC"),
+                os.environ.get("OLLAMA_API_KEY"),
+                {"*": os.environ.get("OLLAMA_MODEL_NAME")},
+            )
+        else:
+            backend = LLMBackend(
+                "openai",
+                os.environ.get("OPENAI_API_BASIC"),
+                os.environ.get("OPENAI_API_KEY"),
+                dict(model_map),
+            )
+        return cls([backend])
+
+    def _candidates(self, model: str) -> List[LLMBackend]:
+        """按预估延迟从低到高排列可用后端"""
+        serving = [b for b in self.backends if b.model_id(model)]
+        if not serving and model != LLM_DEFAULT_MODEL:
+            return self._candidates(LLM_DEFAULT_MODEL)
+        known = [b.ttft_ewma for b in serving if b.ttft_ewma is not None]
+        # 还没有延迟数据的后端按已知的最低延迟估计，保证新后端能分到流量
+        default_ttft = min(known) if known else 1.0
+
+        def score(backend: LLMBackend) -> float:
+            ttft = backend.ttft_ewma if backend.ttft_ewma is not None else default_ttft
+            # 随机扰动避免同分时总是选同一个
+            return ttft * (backend.in_flight + 1) / backend.weight * random.uniform(1.0, 1.05)
+
+        available = [b for b in serving if b.available()]
+        # 未满的后端优先，都满了则在最快的后端排队
+        available.sort(key=lambda b: (b.in_flight >= b.max_concurrency, score(b)))
+        return available
+
+    def resolve_model(self, model: str) -> str:
+        """返回实际使用的逻辑模型名（后端都不支持时使用默认模型）"""
+        if any(b.model_id(model) for b in self.backends):
+            return model
+        return LLM_DEFAULT_MODEL
+
+    async def _open_stream(self, backend: LLMBackend, model: str, messages: List[Dict[str, str]], **kwargs):
+        """在指定后端发起流式请求，返回 (流, 首个chunk, 首token延迟)"""
+        started = time.monotonic()
+        stream = await backend.client.chat.completions.create(
+            messages=messages, model=backend.model_id(model), stream=True, **kwargs
+        )
+        try:
+            first_chunk = await stream.__aiter__().__anext__()
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, first_chunk, time.monotonic() - started
+
+    async def stream_chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> RoutedStream:
+        """
+        发起流式对话，首个token到达前失败会切换到下一个后端
+
+        Returns:
+            RoutedStream: 与 AsyncStream 用法相同的流
+
+        Raises:
+            NoBackendAvailableError: 所有后端都不可用
+        """
+        last_error: Optional[BaseException] = None
+        for backend in self._candidates(model):
+            await backend.semaphore.acquire()
+            backend.acquire()
+            try:
+                stream, first_chunk, ttft = await asyncio.wait_for(
+                    self._open_stream(backend, model, messages, **kwargs),
+                    timeout=LLM_FIRST_TOKEN_TIMEOUT,
+                )
+            except _FAILOVER_ERRORS as e:
+                backend.release()
+                backend.semaphore.release()
+                backend.record_failure()
+                self.failovers += 1
+                last_error = e
+                logger.warning(f"LLM后端 {backend.name} 不可用({type(e).__name__}: {str(e)})，尝试下一个后端")
+                continue
+            except BaseException:
+                # 参数错误或请求被取消，不计入后端故障
+                backend.release()
+                backend.semaphore.release()
+                raise
+            backend.record_success(ttft)
+            return RoutedStream(backend, stream, first_chunk)
+
+        self.rejected += 1
+        raise NoBackendAvailableError(f"没有可用的LLM后端: {str(last_error) if last_error else '全部熔断'}")
+
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs):
+        """非流式对话，失败时切换到下一个后端"""
+        last_error: Optional[BaseException] = None
+        for backend in self._candidates(model):
+            async with backend.semaphore:
+                backend.acquire()
+                try:
+                    response = await backend.client.chat.completions.create(
+                        messages=messages, model=backend.model_id(model), **kwargs
+                    )
+                except _FAILOVER_ERRORS as e:
+                    backend.record_failure()
+                    self.failovers += 1
+                    last_error = e
+                    logger.warning(f"LLM后端 {backend.name} 不可用({type(e).__name__}: {str(e)})，尝试下一个后端")
+                    continue
+                finally:
+                    backend.release()
+            backend.record_success()
+            return response
+
+        self.rejected += 1
+        raise NoBackendAvailableError(f"没有可用的LLM后端: {str(last_error) if last_error else '全部熔断'}")
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "failovers": self.failovers,
+            "rejected": self.rejected,
+            "backends": [b.stats() for b in self.backends],
+        }
@@ -0,0 +1,40 @@
+import os
+import random
+import logging
+
+# 日志级别：DEBUG / INFO / WARNING / ERROR
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# INFO及以下级别日志的采样比例（0~1），高并发时降低日志量；WARNING及以上总是输出
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class SamplingFilter(logging.Filter):
+    """按比例丢弃INFO及以下级别的日志"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+def setup_logging(level: str = LOG_LEVEL, sample_rate: float = LOG_SAMPLE_RATE):
+    """配置根日志记录器，应在应用启动时调用一次"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(SamplingFilter(sample_rate))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, "_voicebot", False):
+            root.removeHandler(existing)
+    handler._voicebot = True
+    root.addHandler(handler)
+    root.setLevel(level)
+    # 第三方库的请求日志过于频繁，只保留警告
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
@@ -1,23 +1,38 @@
 import os
-from fastapi import FastAPI, UploadFile, File, Form
+import time
+import logging
+from fastapi import FastAPI, UploadFile, File, Form, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse, FileResponse
 from pydantic import BaseModel
-import edge_tts
 import asyncio
-import tempfile
-from openai import AsyncOpenAI
+import anyio
+from llm_router import LLMRouter
 from dotenv import load_dotenv
-import aiofiles
 import base64
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional, Union
 import json
 from sse_starlette.sse import EventSourceResponse
-from text2voice import TextToVoice, voice_map
-import shutil
-import wave
-import time
 from stt import STT  # 导入新的STT类
+from stt_executor import STTExecutor, STTQueueFullError
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+from http_client import close_http_client
+from tts_stream import IncrementalTTS
+from tts_providers import create_tts_provider, MEDIA_TYPES
+from audio_codec import negotiate_audio_format, transcode_audio, transcode_stream, codec_stats
+from tts_cache import TTSCache
+from audio_store import AudioStore, parse_range
+from voice_session import VoiceSession
+from batch_jobs import BatchJobManager, BatchUnavailable
+from speculation import SpeculationStats
+from audio_utils import decode_audio, sniff_audio_format
+from vad import VoiceActivityDetector
+from turns import Turn, TurnCancelled, TurnRegistry
+from session_store import SessionStore, SESSION_BACKEND, SESSION_SUMMARIZE
+from response_cache import ResponseCache, replay_chunks
+from sse_events import StreamEvent, coalesce_text, sse_frames
+from metrics import span, observe_stage, timed_events, gauge, render_prometheus, STAGE_ERRORS
+from logging_setup import setup_logging
 
 model_map = {
     "DeepSeek-V3": "deepseek-ai/DeepSeek-V3",
@@ -28,15 +43,34 @@ model_map = {
 }
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
 
-# 初始化STT模型，替换原来的whisper模型
-stt_model = STT()
+# 初始化STT执行器，识别任务在线程池/进程池中执行，不阻塞事件循环
+stt_executor = STTExecutor(STT, length_fn=STT.audio_duration)
+# 识别前的语音活动检测，去除静音并拒绝空录音
+vad = VoiceActivityDetector()
 # 全局配置
-# 可选值: "edge_tts" 或 "fish_speech"
+# 可选值: "edge_tts" 或 "cosyvoice"，也可以是通过 register_tts_provider 注册的服务
 TTS_SERVICE = os.environ.get("TTS_SERVICE", "edge_tts")
+# 流式接口默认是否按句子增量合成语音（请求中的streamAudio参数优先）
+TTS_STREAM_AUDIO = os.environ.get("TTS_STREAM_AUDIO", "false").lower() == "true"
+# 音频返回方式（请求中的audioDelivery参数优先）：
+# "base64" 在响应中直接返回base64音频（兼容模式）；"url" 只返回音频地址，二进制音频通过 /api/audio/{audio_id} 获取
+AUDIO_DELIVERY = os.environ.get("AUDIO_DELIVERY", "base64")
+# /api/audio 分块发送的大小
+AUDIO_CHUNK_SIZE = 64 * 1024
+# 音频以地址形式返回时，是否边合成边通过 /api/audio/{audio_id} 返回：
+# 地址在合成开始时就发给客户端，客户端收到第一批音频即可开始播放
+TTS_STREAM_PLAYBACK = os.environ.get("TTS_STREAM_PLAYBACK", "true").lower() == "true"
 
 app = FastAPI()
 
+# 准入控制：入口限流和请求数上限，以及识别/LLM/合成各阶段的并发预算。
+# 在CORS之前添加（位于CORS内层），被拒绝的响应也带有CORS头，浏览器可以读取429/503
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -46,22 +80,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化Whisper模型
-# model = whisper.load_model("base")
-
-# 初始化OpenAI客户端
-if os.environ.get("MODEL_SERVICE") == "ollama":
-    api_key = os.environ.get("OLLAMA_API_KEY")
-    base_url = os.environ.get("OLLAMA_API_BASIC")
-else:
-    api_key = os.environ.get("OPENAI_API_KEY")
-    base_url = os.environ.get("OPENAI_API_BASIC")
-client = AsyncOpenAI(
-    api_key=api_key,
-    base_url=base_url,
-)
+@app.exception_handler(STTQueueFullError)
+async def stt_queue_full_handler(request: Request, exc: STTQueueFullError):
+    """识别队列已满时返回503，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(BatchUnavailable)
+async def batch_unavailable_handler(request: Request, exc: BatchUnavailable):
+    """多进程部署时批量任务只在持有任务目录锁的进程中执行，其他进程返回503"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """阶段预算排队已满或超时时返回503，限流时返回429"""
+    return exc.to_response()
+
+
+@app.on_event("startup")
+async def startup_event():
+    # background模式下在后台加载本地识别模型，服务可以立即接受请求
+    stt_executor.start()
+    # 加载批量任务，上次未完成的任务从检查点继续
+    batch_jobs.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batch_jobs.shutdown()
+    stt_executor.shutdown()
+    for task in list(_audio_stream_tasks):
+        task.cancel()
+    await close_http_client()
+    await llm_router.close()
+
+# LLM路由：管理一个或多个OpenAI兼容后端（未配置LLM_BACKENDS时按MODEL_SERVICE生成单个后端）
+llm_router = LLMRouter.from_env(model_map)
+
+# 流式语音合成服务，音频数据块一边从合成服务到达一边转发；长文本自动切分后并行合成
+tts_provider = create_tts_provider(TTS_SERVICE)
+tts_cache = TTSCache()
+audio_store = AudioStore()
+# 边合成边写入音频暂存区的后台任务
+_audio_stream_tasks = set()
+# 进行中的回复轮次，用于取消和统计
+turns = TurnRegistry()
+# 推测执行（中间识别结果稳定后提前开始回复）的命中率和浪费统计
+speculation_stats = SpeculationStats()
+
+
+async def summarize_history(summary: str, messages: List[Dict[str, str]]) -> str:
+    """把早期对话合并进会话摘要"""
+    conversation = "\n".join(
+        f"{'用户' if m['role'] == 'user' else '助手'}: {m['content']}" for m in messages
+    )
+    prompt = (
+        "请把下面的对话内容合并进已有摘要，保留人物、事实、偏好和未完成的事项，"
+        "只输出新的摘要，不超过300字。\n\n"
+        f"已有摘要：\n{summary or '无'}\n\n对话：\n{conversation}"
+    )
+    response = await llm_router.chat(
+        [{"role": "user", "content": prompt}],
+        await get_model_name(os.environ.get("SESSION_SUMMARY_MODEL", "DeepSeek-V3")),
+    )
+    return response.choices[0].message.content
 
-text2voice = TextToVoice()
+
+# 重复提问的回复缓存
+response_cache = ResponseCache()
+# 服务端会话历史，客户端带上sessionId后只需发送新消息
+session_store = SessionStore(summarize=summarize_history if SESSION_SUMMARIZE else None)
 
 
 class TextInput(BaseModel):
@@ -71,6 +168,28 @@ class TextInput(BaseModel):
     voice: str = None
     model: str = "DeepSeek-V3"  # 默认使用DeepSeek-V3模型
     enableVoiceResponse: bool = True  # 添加语音回复启用状态参数
+    streamAudio: Optional[bool] = None  # 是否按句子增量返回音频
+    audioDelivery: Optional[str] = None  # 音频返回方式: "base64" 或 "url"
+    audioFormat: Optional[str] = None  # 回复音频格式: "mp3"、"opus"、"webm"，或按优先顺序逗号分隔的候选
+    sessionId: Optional[str] = None  # 服务端会话ID，提供时history仅在新会话时用于初始化
+
+
+class TTSInput(BaseModel):
+    text: str
+    voice: Optional[str] = None
+    audioFormat: Optional[str] = None
+
+
+class BatchTextItem(BaseModel):
+    text: str
+    id: Optional[str] = None  # 条目ID，也用作输出音频的文件名，默认为序号
+    voice: Optional[str] = None
+
+
+class BatchSynthesisInput(BaseModel):
+    items: List[Union[str, BatchTextItem]]
+    voice: Optional[str] = None  # 条目未指定音色时使用的音色
+    audioFormat: Optional[str] = None
 
 
 class ChatHistory(BaseModel):
@@ -78,55 +197,201 @@ class ChatHistory(BaseModel):
     systemPrompt: str = "你是一个友好的AI助手。"
 
 
-async def generate_voice(text: str, voice: str = None) -> str:
+async def synthesize_voice(text: str, api_voice: str = None) -> bytes:
     """
-    根据配置使用不同的语音服务生成语音
+    使用配置的语音服务合成完整的语音
+
+    Args:
+        text (str): 要转换的文本
+        api_voice (str, optional): 语音服务实际使用的音色（见tts_provider.resolve_voice）. Defaults to None.
+
+    Returns:
+        bytes: MP3音频数据
+    """
+    async with admission.slot("tts"):
+        with span("tts", service=TTS_SERVICE, chars=len(text)):
+            return await tts_provider.synthesize(text, api_voice)
+
+
+def reply_audio_format(audio_format: Optional[str] = None) -> str:
+    """按客户端请求的audioFormat和TTS_AUDIO_FORMAT确定回复音频格式（对已确定的格式再次调用结果不变）"""
+    return negotiate_audio_format(audio_format, tts_provider.format)
+
+
+async def synthesize_voice_as(text: str, api_voice: str, audio_format: str) -> bytes:
+    """合成完整的语音，需要时转码为Opus"""
+    audio_content = await synthesize_voice(text, api_voice)
+    if audio_format != tts_provider.format:
+        with span("audio_encode", format=audio_format):
+            audio_content = await asyncio.to_thread(
+                transcode_audio, audio_content, audio_format, tts_provider.format)
+    return audio_content
+
+
+async def generate_voice_bytes(text: str, voice: str = None, audio_format: str = None) -> bytes:
+    """
+    生成语音，相同文本和音色的结果会从缓存中返回
 
     Args:
         text (str): 要转换的文本
         voice (str, optional): 指定使用的音色. Defaults to None.
+        audio_format (str, optional): 回复音频格式（见reply_audio_format）. Defaults to None.
 
     Returns:
-        str: base64编码的音频数据
+        bytes: 音频数据
     """
     try:
-        if TTS_SERVICE == "cosyvoice":
-            # 使用 FishSpeech 服务
-            if voice:
-                # 从voice_map中获取实际的API音色值
-                api_voice = voice_map.get(voice)
-                if api_voice:
-                    print(f"使用指定音色: {voice} -> {api_voice}")
-                    return await text2voice.convert_async(text, api_voice)
-                else:
-                    print(f"未找到指定音色 {voice} 的映射，使用默认音色")
-                    return await text2voice.convert_async(text)
-            else:
-                print(f"未指定音色，使用默认音色")
-                return await text2voice.convert_async(text)
-        else:
-            # 使用 Edge TTS 服务
-            communicate = edge_tts.Communicate(text, "zh-CN-XiaoxiaoNeural")
-            with tempfile.NamedTemporaryFile(
-                delete=False, suffix=".mp3"
-            ) as temp_speech:
-                temp_speech_path = temp_speech.name
-                await communicate.save(temp_speech_path)
-
-                # 读取生成的语音文件并转换为Base64
-                async with aiofiles.open(temp_speech_path, mode="rb") as audio_file:
-                    audio_content = await audio_file.read()
-                    audio_base64 = base64.b64encode(audio_content).decode("utf-8")
-
-                # 清理临时文件
-                os.unlink(temp_speech_path)
-                return audio_base64
+        # 缓存key使用实际请求的音色，不同的显示名称映射到同一音色时可以共享缓存
+        api_voice = tts_provider.resolve_voice(voice)
+        audio_format = reply_audio_format(audio_format)
+        audio_content = await tts_cache.get_or_synthesize(
+            text,
+            api_voice,
+            TTS_SERVICE,
+            audio_format,
+            lambda: synthesize_voice_as(text, api_voice, audio_format),
+        )
+        return audio_content
 
     except Exception as e:
-        print(f"生成语音时出错: {str(e)}")
+        logger.error(f"生成语音时出错: {str(e)}")
         raise
 
 
+async def stream_voice(text: str, voice: str = None, audio_format: str = None) -> AsyncIterator[bytes]:
+    """
+    流式生成语音，音频数据块从合成服务到达后立即返回；命中缓存时一次返回整段音频
+
+    Args:
+        text (str): 要转换的文本
+        voice (str, optional): 指定使用的音色. Defaults to None.
+        audio_format (str, optional): 回复音频格式，Opus格式边合成边转码. Defaults to None.
+
+    Yields:
+        bytes: 音频数据块
+    """
+    api_voice = tts_provider.resolve_voice(voice)
+    audio_format = reply_audio_format(audio_format)
+
+    async def provider_stream():
+        # 异步生成器跨越多次yield，不使用span（trace上下文不能跨越挂起点），直接记录耗时
+        async with admission.slot("tts"):
+            started = time.perf_counter()
+            first_chunk = True
+            try:
+                async for chunk in tts_provider.stream(text, api_voice):
+                    if first_chunk:
+                        first_chunk = False
+                        observe_stage("tts_first_chunk", time.perf_counter() - started)
+                    yield chunk
+            except Exception:
+                STAGE_ERRORS.inc("tts")
+                raise
+            observe_stage("tts", time.perf_counter() - started)
+
+    def encoded_stream():
+        if audio_format == tts_provider.format:
+            return provider_stream()
+        return transcode_stream(provider_stream(), audio_format, tts_provider.format)
+
+    async for chunk in tts_cache.stream_through(
+        text, api_voice, TTS_SERVICE, audio_format, encoded_stream
+    ):
+        yield chunk
+
+
+async def _pump_audio_stream(audio_id: str, entry, text: str, voice: str = None, audio_format: str = None):
+    """把流式合成的音频写入暂存区，客户端可以同时通过 /api/audio/{audio_id} 读取"""
+    error = None
+    try:
+        async for chunk in stream_voice(text, voice, audio_format):
+            audio_store.append(audio_id, entry, chunk)
+    except asyncio.CancelledError:
+        error = "cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"流式生成语音时出错: {str(e)}")
+        error = str(e)
+    finally:
+        audio_store.finish(entry, error)
+
+
+def start_voice_stream(text: str, voice: str = None, audio_format: str = None) -> Dict:
+    """
+    开始在后台流式合成语音，立即返回音频地址
+
+    Returns:
+        Dict: {"url": ..., "audioId": ..., "format": ..., "streaming": True}
+    """
+    audio_format = reply_audio_format(audio_format)
+    audio_id, entry = audio_store.open(MEDIA_TYPES.get(audio_format, "application/octet-stream"))
+    task = asyncio.create_task(_pump_audio_stream(audio_id, entry, text, voice, audio_format))
+    _audio_stream_tasks.add(task)
+    task.add_done_callback(_audio_stream_tasks.discard)
+    return {
+        "url": f"/api/audio/{audio_id}",
+        "audioId": audio_id,
+        "format": audio_format,
+        "streaming": True,
+    }
+
+
+async def generate_voice(text: str, voice: str = None) -> str:
+    """
+    生成语音并返回base64编码的音频数据
+
+    Args:
+        text (str): 要转换的文本
+        voice (str, optional): 指定使用的音色. Defaults to None.
+
+    Returns:
+        str: base64编码的音频数据
+    """
+    audio_content = await generate_voice_bytes(text, voice)
+    return base64.b64encode(audio_content).decode("utf-8")
+
+
+def build_audio_payload(audio_content: bytes, audio_delivery: str = None, audio_format: str = None) -> Dict:
+    """
+    按返回方式构建音频字段
+
+    Args:
+        audio_content (bytes): 音频数据
+        audio_delivery (str, optional): "base64" 或 "url"，默认使用AUDIO_DELIVERY配置
+        audio_format (str, optional): 音频格式，默认为合成服务的输出格式
+
+    Returns:
+        Dict: base64模式为 {"content": ..., "format": ...}；url模式为 {"url": ..., "audioId": ..., "format": ...}
+    """
+    audio_format = audio_format or tts_provider.format
+    if (audio_delivery or AUDIO_DELIVERY) == "url":
+        audio_id = audio_store.put(audio_content, MEDIA_TYPES.get(audio_format, "application/octet-stream"))
+        return {"url": f"/api/audio/{audio_id}", "audioId": audio_id, "format": audio_format}
+    return {"content": base64.b64encode(audio_content).decode("utf-8"), "format": audio_format}
+
+
+async def generate_voice_payload(
+    text: str,
+    voice: str = None,
+    audio_delivery: str = None,
+    streaming: bool = False,
+    audio_format: str = None,
+) -> Dict:
+    """
+    生成语音并按返回方式构建音频字段
+
+    Args:
+        streaming (bool): url模式下是否边合成边返回（受TTS_STREAM_PLAYBACK控制），
+            为True时不等待合成完成，立即返回音频地址
+        audio_format (str, optional): 客户端请求的回复音频格式（见reply_audio_format）
+    """
+    audio_format = reply_audio_format(audio_format)
+    if streaming and TTS_STREAM_PLAYBACK and (audio_delivery or AUDIO_DELIVERY) == "url":
+        return start_voice_stream(text, voice, audio_format)
+    audio_content = await generate_voice_bytes(text, voice, audio_format)
+    return build_audio_payload(audio_content, audio_delivery, audio_format)
+
+
 # 添加辅助函数，构建并格式化消息内容
 def build_messages(text_input, history, system_prompt):
     """构建格式化的消息列表"""
@@ -136,14 +401,22 @@ def build_messages(text_input, history, system_prompt):
     return messages
 
 
-async def get_model_id(model_name):
-    """获取实际的模型ID"""
-    print(f"获取模型ID: {model_name}")
-    model_id = model_map.get(model_name, model_map["DeepSeek-V3"])
-    if os.environ.get("MODEL_SERVICE") == "ollama":
-        model_id = os.environ.get("OLLAMA_MODEL_NAME")
-    print(f"实际使用模型ID: {model_id}")
-    return model_id
+def _truncate(text: str, limit: int = 200) -> str:
+    """截断日志中的长文本"""
+    return text if len(text) <= limit else f"{text[:limit]}...({len(text)}字)"
+
+
+def _log_request(text_input, system_prompt, history, voice, model_name):
+    """记录请求概要，完整的提示词和历史只在DEBUG级别输出"""
+    logger.info(f"用户输入: {_truncate(text_input)} (历史{len(history)}条, 模型={model_name}, 音色={voice})")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"系统提示词: {_truncate(system_prompt)}")
+        logger.debug(f"历史消息: {_truncate(json.dumps(history, ensure_ascii=False), 1000)}")
+
+
+async def get_model_name(model_name):
+    """获取实际使用的模型名（后端都不支持时使用默认模型），各后端再映射到自己的模型ID"""
+    return llm_router.resolve_model(model_name)
 
 async def generate_response(
     text_input: str,
@@ -151,33 +424,42 @@ async def generate_response(
     system_prompt: str = "你是一个友好的AI助手。",
     voice: str = None,
     model: str = "DeepSeek-V3",
+    audio_delivery: str = None,
+    session_id: Optional[str] = None,
+    audio_format: Optional[str] = None,
 ):
     try:
+        session = None
+        if session_id:
+            session = await session_store.get_or_create(session_id, history)
+            history = session_store.history(session)
         messages = build_messages(text_input, history, system_prompt)
 
-        print(f"用户输入: {text_input}")
-        print(f"系统提示词: {system_prompt}")
-        print(f"历史消息: {history}")
-        if voice:
-            print(f"使用音色: {voice}")
-        print(f"使用模型: {model}")
-
         # 获取模型ID
-        model_id = await get_model_id(model)
+        model_name = await get_model_name(model)
+        _log_request(text_input, system_prompt, history, voice, model_name)
 
-        response = await client.chat.completions.create(
-            messages=messages,
-            model=model_id,
-        )
-        ai_response = response.choices[0].message.content
-        print(f"AI回复: {ai_response}")
+        cached, match, _ = response_cache.lookup(model_name, system_prompt, history, text_input)
+        if cached:
+            logger.info(f"命中回复缓存({match})")
+            ai_response = cached.content
+        else:
+            async with admission.slot("llm"):
+                with span("llm_total", model=model_name, stream=False):
+                    response = await llm_router.chat(messages, model_name)
+            ai_response = response.choices[0].message.content
+            response_cache.store(model_name, system_prompt, history, text_input, ai_response)
+        logger.debug(f"AI回复: {_truncate(ai_response)}")
+        if session:
+            await session_store.append_turn(session, text_input, ai_response)
 
         # 使用统一的语音生成函数，传递voice参数
-        audio_base64 = await generate_voice(ai_response, voice)
-        return ai_response, audio_base64
+        audio_payload = await generate_voice_payload(
+            ai_response, voice, audio_delivery, streaming=True, audio_format=audio_format)
+        return ai_response, audio_payload
 
     except Exception as e:
-        print(f"生成回复时出错: {str(e)}")
+        logger.error(f"生成回复时出错: {str(e)}")
         raise
 
 
@@ -188,32 +470,65 @@ async def generate_response_stream(
     voice: str = None,
     enableVoiceResponse: bool = True,
     model: str = "DeepSeek-V3",
+    streamAudio: Optional[bool] = None,
+    audioDelivery: Optional[str] = None,
+    turn: Optional[Turn] = None,
+    session_id: Optional[str] = None,
+    audio_format: Optional[str] = None,
 ):
+    # 每轮回复都有一个轮次ID，客户端可以通过 /api/chat/cancel/{turn_id} 中途取消
+    if turn is None:
+        turn = turns.start()
+    incremental_tts = None
+    stream = None
+    release_llm = None
+    stream_finished = False
+    completed = False
+    session = None
+    full_response = ""
     try:
+        yield StreamEvent.of("turn", turnId=turn.turn_id)
+        # 使用服务端会话时，历史由服务端按token预算截取
+        if session_id:
+            session = await session_store.get_or_create(session_id, history)
+            history = session_store.history(session)
         messages = build_messages(text_input, history, system_prompt)
 
-        print(f"用户输入: {text_input}")
-        print(f"系统提示词: {system_prompt}")
-        print(f"历史消息: {history}")
-        if enableVoiceResponse:
-            print(f"使用音色: {voice}")
-        else:
-            print("语音回复已禁用，不生成音频")
-        print(f"使用模型: {model}")
-
         # 获取模型ID
-        model_id = await get_model_id(model)
-
-        stream = await client.chat.completions.create(
-            messages=messages,
-            model=model_id,
-            stream=True,
-        )
+        model_name = await get_model_name(model)
+        _log_request(text_input, system_prompt, history, voice if enableVoiceResponse else None, model_name)
+
+        cached, match, similarity = response_cache.lookup(
+            model_name, system_prompt, history, text_input)
+        if cached:
+            # 命中缓存时不调用模型，按原有的增量格式直接回放
+            logger.info(f"命中回复缓存({match}, 相似度={similarity:.3f})")
+            yield StreamEvent.of("cached", match=match, similarity=round(similarity, 4))
+            chunks = replay_chunks(cached, model_name)
+        else:
+            # 在LLM并发预算内调用；路由到延迟最低的可用后端，首个token到达前失败会自动切换后端
+            release_llm = await turn.wait(admission.acquire("llm"))
+            llm_started = time.perf_counter()
+            stream = await turn.wait(llm_router.stream_chat(messages, model_name))
+            # stream_chat 在收到首个增量后才返回
+            observe_stage("llm_ttft", time.perf_counter() - llm_started)
+            chunks = stream
+
+        if streamAudio is None:
+            streamAudio = TTS_STREAM_AUDIO
+        # 增量模式下边接收文本边按句子合成语音，思考内容不会送入合成
+        if enableVoiceResponse and streamAudio:
+            incremental_tts = IncrementalTTS(
+                lambda sentence, sentence_voice: generate_voice_payload(
+                    sentence, sentence_voice, audioDelivery, audio_format=audio_format
+                ),
+                voice,
+            )
 
-        full_response = ""
+        reasoning_response = ""
         think_end = False
         think_start = False
-        async for chunk in stream:
+        async for chunk in turn.guard(chunks):
             # 检查是否有新的内容
             if chunk.choices:
                 choice = chunk.choices[0]
@@ -223,147 +538,188 @@ async def generate_response_stream(
                     and choice.delta.model_extra["reasoning_content"] != ""
                 ):
                     if think_start is False:
-                        print("<think>")
                         think_start = True
-                        print("```")
-                        yield {
-                            "event": "message",
-                            "data": json.dumps(
-                                {"type": "text", "content": "#### 思考中... \n"}
-                            ),
-                        }
-                    print(
-                        choice.delta.model_extra["reasoning_content"], end="")
-                    yield {
-                        "event": "message",
-                        "data": json.dumps(
-                            {
-                                "type": "text",
-                                "content": choice.delta.model_extra["reasoning_content"],
-                            }
-                        ),
-                    }
+                        yield StreamEvent.text("#### 思考中... \n")
+                    reasoning_response += choice.delta.model_extra["reasoning_content"]
+                    yield StreamEvent.text(choice.delta.model_extra["reasoning_content"])
                 if choice.delta.content:
                     if think_start is True and think_end is False:
-                        print("</think>")
                         think_end = True
-                        print("```")
-                        yield {
-                            "event": "message",
-                            "data": json.dumps(
-                                {
-                                    "type": "text",
-                                    "content": "\n #### 思考完成 \n *** \n",
-                                }
-                            ),
-                        }
+                        yield StreamEvent.text("\n #### 思考完成 \n *** \n")
                     # 打印当前块的内容
                     if choice.delta.content is not None:
                         full_response += choice.delta.content
-                        print(choice.delta.content, end="")
-                        yield {
-                            "event": "message",
-                            "data": json.dumps(
-                                {"type": "text", "content": choice.delta.content}
-                            ),
-                        }
-
-        print("")
+                        yield StreamEvent.text(choice.delta.content)
+                        if incremental_tts:
+                            incremental_tts.feed(choice.delta.content)
+                            for audio_event in incremental_tts.ready_chunks():
+                                yield StreamEvent(audio_event)
+
+        stream_finished = True
+        # 上游流结束即归还LLM并发额度，后续的语音合成和发送不占用LLM预算；
+        # 缓存回放时没有申请额度，finally中的释放只用于出错和取消
+        if release_llm is not None:
+            release_llm()
+            release_llm = None
+        if stream is not None:
+            observe_stage("llm_total", time.perf_counter() - llm_started)
+        logger.debug(f"AI回复: {_truncate(full_response)}")
+        if not cached:
+            response_cache.store(
+                model_name, system_prompt, history, text_input, full_response, reasoning_response
+            )
+        if incremental_tts:
+            # 提交最后一句，并按顺序发送剩余的音频片段
+            incremental_tts.finish()
+            async for audio_event in turn.guard(incremental_tts.drain()):
+                yield StreamEvent(audio_event)
+            yield StreamEvent.of("audio_done", count=incremental_tts.emitted)
         # 使用统一的语音生成函数，传递voice参数
         # 只有在voice不为None时才生成语音
-        if enableVoiceResponse:
-            audio_base64 = await generate_voice(full_response, voice)
+        elif enableVoiceResponse:
+            try:
+                audio_payload = await turn.wait(generate_voice_payload(
+                    full_response, voice, audioDelivery, streaming=True, audio_format=audio_format
+                ))
+            except TurnCancelled:
+                turns.record_saved(tts_chars_skipped=len(full_response))
+                raise
             # 发送音频数据
-            yield {
-                "event": "message",
-                "data": json.dumps({"type": "audio", "content": audio_base64}),
-            }
-        else:
-            print("语音回复已禁用，跳过语音生成")
+            yield StreamEvent.of("audio", **audio_payload)
+        completed = True
+
+    except TurnCancelled:
+        logger.info(f"轮次 {turn.turn_id} 已取消({turn.reason})")
+        yield StreamEvent.of("cancelled", turnId=turn.turn_id, reason=turn.reason)
+
+    except AdmissionRejected as e:
+        # 响应已经开始，无法再返回503，以错误事件告知原因和建议的重试时间
+        logger.warning(f"回复生成被准入控制拒绝({e.stage}, {e.reason})")
+        yield StreamEvent(
+            {"error": str(e), "reason": e.reason, "stage": e.stage, "retryAfter": e.retry_after},
+            event="error",
+        )
+        completed = True
 
     except Exception as e:
-        print(f"生成回复时出错: {str(e)}")
-        yield {"event": "error", "data": json.dumps({"error": str(e)})}
+        logger.error(f"生成回复时出错: {str(e)}")
+        yield StreamEvent.error(str(e))
+        completed = True
+
+    finally:
+        # 取消或客户端断开时关闭上游流并取消未完成的合成，避免继续消耗token和合成额度。
+        # 客户端断开时本协程处于取消状态，需要屏蔽取消才能完成关闭
+        with anyio.CancelScope(shield=True):
+            if stream is not None and not stream_finished:
+                await stream.close()
+                turns.record_saved(llm_streams_closed=1)
+            if release_llm is not None:
+                release_llm()
+            # 被打断的回复也记入会话，与客户端看到的内容保持一致
+            if session and full_response:
+                # 推测执行的回复只有在最终识别结果确认后才写入会话
+                confirmed_input = await turn.confirmed_input(text_input)
+                if confirmed_input is not None:
+                    await session_store.append_turn(session, confirmed_input, full_response)
+        if incremental_tts:
+            tasks, chars = incremental_tts.cancel()
+            turns.record_saved(tts_tasks_cancelled=tasks, tts_chars_skipped=chars)
+        turns.finish(turn, completed)
 
 
 # 添加辅助函数，用于处理上传的音频文件
-async def process_audio_file(audio: UploadFile) -> str:
+async def process_audio_file(audio: UploadFile) -> bytes:
     """
-    处理上传的音频文件，保存为临时文件并返回文件路径
+    读取上传的音频文件内容，整个处理过程都在内存中完成
 
     Args:
         audio (UploadFile): 上传的音频文件
 
     Returns:
-        str: 临时文件路径
+        bytes: 音频文件的原始字节
 
     Raises:
-        Exception: 如果文件处理失败
+        Exception: 如果文件为空
     """
-    try:
-        # 创建一个固定位置的临时目录，避免使用系统临时目录可能的权限问题
-        temp_dir = os.path.join(os.getcwd(), "temp_audio")
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # 生成唯一文件名
-        timestamp = int(time.time())
-        file_name = f"audio_{timestamp}.wav"
-        file_path = os.path.join(temp_dir, file_name)
-
-        # 读取上传的文件内容
+    with span("upload_read"):
         content = await audio.read()
-        if not content:
-            raise Exception("上传的音频文件为空")
+    if not content:
+        raise Exception("上传的音频文件为空")
 
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(content)
-            f.flush()
-            os.fsync(f.fileno())
+    # 浏览器声明的类型不可靠（MediaRecorder输出的WebM/Opus常被标为audio/wav），按文件头识别
+    logger.debug(
+        f"已读取音频文件: {audio.filename}, 声明类型: {audio.content_type}, "
+        f"实际格式: {sniff_audio_format(content) or '未知'}, 大小: {len(content)} 字节"
+    )
+    return content
 
-        # 验证文件
-        if not os.path.exists(file_path):
-            raise Exception("保存音频文件失败")
 
-        file_size = os.path.getsize(file_path)
-        if file_size == 0:
-            raise Exception("保存的音频文件为空")
+def _join_transcripts(texts: List[str]) -> str:
+    """拼接分段识别结果，英文单词之间补空格"""
+    joined = ""
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if joined and joined[-1].isascii() and joined[-1].isalnum() and text[0].isascii() and text[0].isalnum():
+            joined += " "
+        joined += text
+    return joined
 
-        print(f"已保存音频文件: {file_path}, 大小: {file_size} 字节")
 
-        # 检查是否是有效的WAV文件
-        try:
-            with wave.open(file_path, "rb") as wave_file:
-                frames = wave_file.getnframes()
-                rate = wave_file.getframerate()
-                print(f"WAV文件信息: 帧数={frames}, 采样率={rate}")
-        except:
-            print("不是标准WAV文件，但仍将继续处理")
+async def transcribe_audio(audio) -> Dict:
+    """
+    在识别并发预算内进行语音活动检测和识别
 
-        return file_path
+    Args:
+        audio: 音频字节或16kHz float32数组
 
-    except Exception as e:
-        print(f"处理音频文件时出错: {str(e)}")
-        # 如果文件存在但处理失败，尝试删除
-        if "file_path" in locals() and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-        raise
+    Returns:
+        Dict: 识别结果，未检测到语音时包含 "no_speech": True
+
+    Raises:
+        AdmissionRejected: 识别排队已满或等待超时
+    """
+    async with admission.slot("stt"):
+        return await _transcribe_audio(audio)
 
 
-# 添加清理函数
+async def _transcribe_audio(audio) -> Dict:
+    """
+    语音活动检测后进行识别
 
+    没有检测到语音时直接返回，不调用模型；过长的录音切分后各片段并行识别。
+    """
+    if not vad.enabled:
+        with span("stt"):
+            return await stt_executor.transcribe(audio)
 
-def cleanup_temp_file(file_path: str):
-    """安全删除临时文件"""
-    try:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"已删除临时文件: {file_path}")
-    except Exception as e:
-        print(f"删除临时文件失败: {str(e)}")
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        try:
+            with span("audio_decode"):
+                samples = await asyncio.to_thread(decode_audio, audio)
+        except Exception as e:
+            # 无法在本进程解码时交给识别引擎自行处理
+            logger.warning(f"语音活动检测前解码失败，跳过检测: {str(e)}")
+            with span("stt"):
+                return await stt_executor.transcribe(audio)
+    else:
+        samples = audio
+
+    with span("vad"):
+        segments = await asyncio.to_thread(vad.split, samples)
+    if not segments:
+        return {"text": "", "no_speech": True}
+    with span("stt", segments=len(segments)):
+        if len(segments) == 1:
+            return await stt_executor.transcribe(segments[0])
+        results = await asyncio.gather(
+            *[stt_executor.transcribe(segment) for segment in segments])
+    return {"text": _join_transcripts([r.get("text", "") for r in results if r])}
+
+
+# 批量识别/合成任务：复用识别和合成流程，以batch优先级在后台执行
+batch_jobs = BatchJobManager(transcribe_audio, generate_voice_bytes, reply_audio_format)
 
 
 # 辅助函数：处理音频请求流中的共用逻辑
@@ -375,16 +731,17 @@ async def process_audio_request(
     model: str = "DeepSeek-V3",
     enableVoiceResponse: str = "true"
 ):
-    temp_audio_path = None
     try:
-        # 打印收到的参数
-        print(f"收到音频请求参数: audio={audio.filename}, history长度={len(history)}, systemPrompt={systemPrompt}, voice={voice}, model={model}, enableVoiceResponse={enableVoiceResponse}")
+        logger.debug(f"收到音频请求参数: audio={audio.filename}, history长度={len(history)}, voice={voice}, model={model}, enableVoiceResponse={enableVoiceResponse}")
+
+        # 使用辅助函数读取音频内容
+        audio_content = await process_audio_file(audio)
 
-        # 使用辅助函数处理音频文件
-        temp_audio_path = await process_audio_file(audio)
+        # 在执行器中进行语音识别，避免阻塞事件循环
+        result = await transcribe_audio(audio_content)
 
-        # 使用新的STT类进行语音识别，替换原来的whisper直接调用
-        result = stt_model.transcribe(temp_audio_path)
+        if result and result.get("no_speech"):
+            return None, None, None, "未检测到语音，请重新录音"
 
         # 检查返回的结果
         if not result or "text" not in result:
@@ -398,10 +755,9 @@ async def process_audio_request(
             or "暂时不可用" in text_input
             or "技术问题" in text_input
         ):
-            print(f"语音识别可能出现问题: {text_input}")
+            logger.warning(f"语音识别可能出现问题: {text_input}")
 
-        print(f"语音识别结果: {text_input}")
-        print(f"语音回复启用状态: {enableVoiceResponse}")
+        logger.info(f"语音识别结果: {_truncate(text_input)}")
 
         # 解析历史记录
         chat_history = json.loads(history)
@@ -411,21 +767,23 @@ async def process_audio_request(
 
         return text_input, chat_history, enable_voice, None
 
+    except (STTQueueFullError, AdmissionRejected):
+        # 交给异常处理器返回503/429
+        raise
+
     except Exception as e:
-        print(f"处理语音请求时出错: {str(e)}")
+        logger.error(f"处理语音请求时出错: {str(e)}")
         return None, None, None, str(e)
 
-    finally:
-        # 清理临时文件
-        if temp_audio_path:
-            cleanup_temp_file(temp_audio_path)
-
 
 @app.post("/api/chat")
 async def chat(
     audio: UploadFile = File(...),
     history: str = Form("[]"),
     systemPrompt: str = Form("你是一个友好的AI助手。"),
+    audioDelivery: Optional[str] = Form(None),
+    sessionId: Optional[str] = Form(None),
+    audioFormat: Optional[str] = Form(None),
 ):
     result, chat_history, _, error = await process_audio_request(
         audio, history, systemPrompt
@@ -438,15 +796,22 @@ async def chat(
         return {"success": False, "error": chat_history}  # 这里chat_history是错误信息
 
     # 生成回复
-    ai_response, audio_base64 = await generate_response(
-        result, chat_history, systemPrompt
+    ai_response, audio_payload = await generate_response(
+        result,
+        chat_history,
+        systemPrompt,
+        audio_delivery=audioDelivery,
+        session_id=sessionId,
+        audio_format=audioFormat,
     )
 
     return {
         "success": True,
         "text_input": result,
         "ai_response": ai_response,
-        "audio_response": audio_base64,
+        "audio_response": audio_payload.get("content"),
+        "audio_url": audio_payload.get("url"),
+        "audio_format": audio_payload.get("format"),
     }
 
 
@@ -454,21 +819,28 @@ async def chat(
 async def chat_text(text_input: TextInput):
     try:
         # 生成回复
-        ai_response, audio_base64 = await generate_response(
+        ai_response, audio_payload = await generate_response(
             text_input.text,
             text_input.history,
             text_input.systemPrompt,
             text_input.voice,
             text_input.model,
+            text_input.audioDelivery,
+            text_input.sessionId,
+            text_input.audioFormat,
         )
 
         return {
             "success": True,
             "ai_response": ai_response,
-            "audio_response": audio_base64,
+            "audio_response": audio_payload.get("content"),
+            "audio_url": audio_payload.get("url"),
+            "audio_format": audio_payload.get("format"),
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        print(f"处理文本请求时出错: {str(e)}")
+        logger.error(f"处理文本请求时出错: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
@@ -478,19 +850,21 @@ async def chat_stream(text_input: TextInput):
         # 如果禁用了语音回复，将voice设置为None
         voice_param = text_input.voice if text_input.enableVoiceResponse else None
 
-        return EventSourceResponse(
-            generate_response_stream(
-                text_input.text,
-                text_input.history,
-                text_input.systemPrompt,
-                voice_param,
-                text_input.enableVoiceResponse,
-                text_input.model
-            )
-        )
+        return event_source_response(generate_response_stream(
+            text_input.text,
+            text_input.history,
+            text_input.systemPrompt,
+            voice_param,
+            text_input.enableVoiceResponse,
+            text_input.model,
+            text_input.streamAudio,
+            text_input.audioDelivery,
+            session_id=text_input.sessionId,
+            audio_format=text_input.audioFormat,
+        ))
     except Exception as e:
-        print(f"处理文本请求流时出错: {str(e)}")
-        return EventSourceResponse(_generate_error_stream(str(e)))
+        logger.error(f"处理文本请求流时出错: {str(e)}")
+        return event_source_response(_generate_error_stream(str(e)))
 
 
 @app.post("/api/chat/audio/stream")
@@ -501,58 +875,346 @@ async def chat_audio_stream(
     voice: str = Form(None),
     model: str = Form("DeepSeek-V3"),
     enableVoiceResponse: str = Form("true"),
+    streamAudio: Optional[bool] = Form(None),
+    audioDelivery: Optional[str] = Form(None),
+    sessionId: Optional[str] = Form(None),
+    audioFormat: Optional[str] = Form(None),
 ):
     text_input, chat_history, enable_voice, error = await process_audio_request(
         audio, history, systemPrompt, voice, model, enableVoiceResponse
     )
 
     if error:
-        return EventSourceResponse(_generate_error_stream(error))
+        return event_source_response(_generate_error_stream(error))
 
     if not text_input:
-        return EventSourceResponse(
+        return event_source_response(
             _generate_error_stream(chat_history)  # 这里chat_history是错误信息
         )
 
     # 创建一个生成器函数，先发送用户输入，然后发送AI响应
     async def combined_stream():
         # 先发送用户的语音识别结果
-        yield {
-            "event": "message",
-            "data": json.dumps({"type": "recognition", "content": text_input}),
-        }
+        yield StreamEvent.of("recognition", content=text_input)
 
         # 然后生成并发送AI的回复文本
-        full_response = ""
         async for event in generate_response_stream(
-            text_input, chat_history, systemPrompt, voice if enable_voice else None, enable_voice, model
+            text_input,
+            chat_history,
+            systemPrompt,
+            voice if enable_voice else None,
+            enable_voice,
+            model,
+            streamAudio,
+            audioDelivery,
+            session_id=sessionId,
+            audio_format=audioFormat,
         ):
             # 如果这是音频事件且语音回复被禁用，则跳过
-            event_data = json.loads(
-                event["data"]) if "data" in event else {}
-            if event_data.get("type") == "audio" and not enable_voice:
-                print("语音回复已禁用，跳过音频数据")
+            if event.type in ("audio", "audio_chunk") and not enable_voice:
                 continue
+            yield event
 
-            if event_data.get("type") == "text" and event_data.get("content"):
-                full_response += event_data.get("content", "")
+    return event_source_response(combined_stream())
 
-            yield event
 
-    return EventSourceResponse(combined_stream())
+@app.websocket("/ws/voice")
+async def voice_websocket(websocket: WebSocket):
+    """全双工语音会话：客户端持续发送音频帧，服务端返回中间/最终识别结果以及文本和音频回复"""
+    session = VoiceSession(
+        websocket, transcribe_audio, generate_response_stream, audio_store, turns, speculation_stats)
+    await session.run()
+
+
+@app.get("/api/audio/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    """以二进制形式返回生成的音频，支持Range请求"""
+    entry = audio_store.get(audio_id)
+    if entry is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "音频不存在或已过期"}
+        )
+
+    if not entry.complete:
+        # 音频仍在合成中：总长度未知，以分块传输的方式跟随合成进度返回，不支持Range
+        return StreamingResponse(
+            entry.iter_chunks(AUDIO_CHUNK_SIZE),
+            media_type=entry.media_type,
+            headers={"Cache-Control": "no-store"},
+        )
+
+    total = len(entry.data)
+    try:
+        byte_range = parse_range(request.headers.get("range"), total)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+
+    start, end = byte_range if byte_range else (0, total - 1)
+    view = memoryview(entry.data)[start:end + 1]
+
+    async def iter_chunks():
+        for offset in range(0, len(view), AUDIO_CHUNK_SIZE):
+            yield bytes(view[offset:offset + AUDIO_CHUNK_SIZE])
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(len(view)),
+        "Cache-Control": "private, max-age=300",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+    return StreamingResponse(
+        iter_chunks(),
+        status_code=206 if byte_range else 200,
+        media_type=entry.media_type,
+        headers=headers,
+    )
+
+
+@app.post("/api/tts/stream")
+async def tts_stream(tts_input: TTSInput):
+    """流式语音合成：音频数据块从合成服务到达后立即转发，客户端可以边接收边播放"""
+    text = tts_input.text.strip()
+    if not text:
+        return JSONResponse(status_code=400, content={"success": False, "error": "文本不能为空"})
+    audio_format = reply_audio_format(tts_input.audioFormat)
+    audio_stream = stream_voice(text, tts_input.voice, audio_format)
+    # 先取得第一块音频再开始响应：合成预算已满时可以直接返回503，而不是发送一个中断的音频流
+    try:
+        first_chunk = await audio_stream.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+
+    async def body():
+        yield first_chunk
+        async for chunk in audio_stream:
+            yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES.get(audio_format, "application/octet-stream"),
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.post("/api/batch/transcribe")
+async def batch_transcribe(
+    files: List[UploadFile] = File(None),
+    paths: str = Form(None),
+    folder: str = Form(None),
+    recursive: str = Form("true"),
+):
+    """
+    提交批量识别任务，立即返回任务ID
+
+    音频可以作为多个文件上传，也可以是服务器上 BATCH_INPUT_DIRS 中的文件路径列表（JSON数组）或目录。
+    """
+    try:
+        job = await batch_jobs.submit_transcription(
+            [(f.filename, f.file) for f in files or []],
+            json.loads(paths) if paths else [],
+            folder,
+            recursive.lower() == "true",
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
+    return {"success": True, **job.progress()}
+
+
+@app.post("/api/batch/synthesize")
+async def batch_synthesize(batch_input: BatchSynthesisInput):
+    """提交批量合成任务，立即返回任务ID；音频保存在任务目录中，结果见 /api/batch/jobs/{job_id}/results"""
+    items = [
+        {"text": item} if isinstance(item, str) else item.dict()
+        for item in batch_input.items
+    ]
+    try:
+        job = batch_jobs.submit_synthesis(items, batch_input.voice, batch_input.audioFormat)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
+    return {"success": True, **job.progress()}
+
+
+@app.get("/api/batch/jobs")
+async def list_batch_jobs():
+    """所有批量任务的进度"""
+    return {"success": True, "jobs": batch_jobs.list_jobs()}
+
+
+def _batch_job_not_found() -> JSONResponse:
+    return JSONResponse(status_code=404, content={"success": False, "error": "任务不存在"})
+
+
+@app.get("/api/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """查询批量任务进度，包含失败的条目"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return _batch_job_not_found()
+    return {"success": True, **job.progress(), "failures": job.failures()}
+
+
+@app.get("/api/batch/jobs/{job_id}/results")
+async def get_batch_results(job_id: str):
+    """已完成条目的结果（JSONL，每行一个条目），任务执行过程中也可以读取"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return _batch_job_not_found()
+    if not os.path.exists(job.results_path):
+        return Response(b"", media_type="application/x-ndjson")
+    return FileResponse(job.results_path, media_type="application/x-ndjson")
+
+
+@app.get("/api/batch/jobs/{job_id}/audio/{name}")
+async def get_batch_audio(job_id: str, name: str):
+    """批量合成任务输出的音频文件"""
+    path = batch_jobs.audio_path(job_id, name)
+    if path is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "音频不存在"})
+    fmt = os.path.splitext(name)[1].lstrip(".")
+    return FileResponse(path, media_type=MEDIA_TYPES.get(fmt, "application/octet-stream"))
+
+
+@app.post("/api/batch/jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    """取消批量任务，已完成的条目保留"""
+    if batch_jobs.get(job_id) is None:
+        return _batch_job_not_found()
+    if not batch_jobs.cancel(job_id):
+        return JSONResponse(status_code=409, content={"success": False, "error": "任务已结束"})
+    return {"success": True, "jobId": job_id}
+
+
+@app.post("/api/batch/jobs/{job_id}/resume")
+async def resume_batch_job(job_id: str):
+    """继续执行已取消或有失败条目的批量任务，跳过已完成的条目"""
+    if batch_jobs.get(job_id) is None:
+        return _batch_job_not_found()
+    if not batch_jobs.resume(job_id):
+        return JSONResponse(
+            status_code=409, content={"success": False, "error": "任务正在执行或所有条目均已完成"}
+        )
+    return {"success": True, "jobId": job_id}
+
+
+@app.delete("/api/batch/jobs/{job_id}")
+async def delete_batch_job(job_id: str):
+    """删除批量任务及其结果文件"""
+    if not await batch_jobs.delete(job_id):
+        return _batch_job_not_found()
+    return {"success": True}
+
+
+@app.post("/api/chat/cancel/{turn_id}")
+async def cancel_turn(turn_id: str):
+    """取消进行中的回复：关闭上游LLM流并取消未完成的语音合成"""
+    if not turns.cancel(turn_id, "api"):
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "轮次不存在或已结束"}
+        )
+    return {"success": True, "turnId": turn_id}
+
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """查看服务端保存的会话摘要和最近消息"""
+    session = await session_store.backend.get(session_id)
+    if session is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "会话不存在或已过期"}
+        )
+    return {"success": True, **session.to_dict()}
+
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """删除服务端会话（清空对话时调用）"""
+    await session_store.delete(session_id)
+    return {"success": True}
+
+
+@app.get("/api/ready")
+async def ready():
+    """就绪检查：本地识别模型加载完成前返回503"""
+    model = stt_executor.model_status()
+    if not stt_executor.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "stt": model},
+            headers={"Retry-After": "5"},
+        )
+    return {"ready": True, "stt": model}
+
+
+@app.get("/api/stats")
+async def stats():
+    """运行状态统计"""
+    return {
+        "stt": stt_executor.stats(),
+        "vad": vad.stats(),
+        "admission": admission.stats(),
+        "turns": turns.stats(),
+        "speculation": speculation_stats.stats(),
+        "sessions": session_store.stats(),
+        "response_cache": response_cache.stats(),
+        "llm": llm_router.stats(),
+        "tts": tts_provider.describe(),
+        "tts_cache": tts_cache.stats(),
+        "audio_codec": codec_stats(),
+        "batch": batch_jobs.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus指标：各阶段耗时直方图以及队列、轮次等运行状态"""
+    return PlainTextResponse(
+        render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+gauge("voicebot_stt_in_flight", "STT jobs queued or running", lambda: stt_executor.stats()["in_flight"])
+gauge("voicebot_tts_in_flight", "TTS provider requests in progress", lambda: tts_provider.in_flight)
+gauge(
+    "voicebot_admission_queued",
+    "Requests waiting for a stage budget",
+    lambda: sum(budget.queued for budget in admission.stages.values()),
+)
+gauge("voicebot_batch_items_pending", "Batch job items not yet processed", lambda: batch_jobs.pending_items)
+gauge("voicebot_turns_active", "Replies currently being generated", lambda: turns.stats()["active"])
+gauge("voicebot_sessions", "Server-side conversation sessions", lambda: session_store.stats()["sessions"])
+gauge("voicebot_audio_store_bytes", "Bytes held by the audio store", lambda: audio_store.size)
 
 
 # 辅助函数：生成错误流
+def event_source_response(events) -> EventSourceResponse:
+    """流式接口的SSE响应：按配置合并文本增量，每个事件只序列化一次，并记录每帧的发送耗时"""
+    return EventSourceResponse(timed_events(sse_frames(coalesce_text(events))))
+
+
 async def _generate_error_stream(error_message):
-    yield {"event": "error", "data": json.dumps({"error": error_message})}
-    yield {
-        "event": "message",
-        "data": json.dumps({"type": "text", "content": f"发生错误: {error_message}"}),
-    }
-    yield {"event": "done", "data": json.dumps({"content": ""})}
+    yield StreamEvent.error(error_message)
+    yield StreamEvent.text(f"发生错误: {error_message}")
+    yield StreamEvent({"content": ""}, event="done")
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # API进程数；多进程时建议同时设置 STT_EXECUTOR=remote 并运行 stt_server.py，避免每个进程各加载一份模型
+    api_workers = int(os.environ.get("API_WORKERS", "1"))
+    if api_workers > 1:
+        # 音频暂存区、进行中的轮次和内存会话都只在各自进程内，请求落到其他进程时会404或被忽略
+        problems = []
+        if SESSION_BACKEND == "memory":
+            problems.append("SESSION_BACKEND=memory（会话只保存在单个进程中）")
+        if AUDIO_DELIVERY == "url":
+            problems.append("AUDIO_DELIVERY=url（/api/audio 地址只在生成它的进程中有效）")
+        if problems:
+            logger.error(f"API_WORKERS={api_workers} 需要跨进程共享的后端，当前配置不支持: {'；'.join(problems)}")
+            raise SystemExit(1)
+        if stt_executor.mode != "remote" and getattr(stt_executor.stt, "needs_model", False):
+            logger.warning("API_WORKERS>1 且未使用 STT_EXECUTOR=remote，每个进程都会加载一份识别模型")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=api_workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,205 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+# 是否同时输出OpenTelemetry trace（需要安装opentelemetry-api，导出方式由OTel SDK的环境变量配置）
+OTEL_ENABLED = os.environ.get("OTEL_ENABLED", "false").lower() == "true"
+
+# 延迟直方图的分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("voice-chat-bot")
+    except ImportError:
+        _tracer = None
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """按标签分组的直方图，输出Prometheus格式"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # 标签值 -> [各分桶计数, 总和, 总数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[labelvalues] = series
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Counter:
+    """按标签分组的计数器"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """取值时调用回调函数的仪表，用于导出队列深度、缓存条目数等现有统计"""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_format_value(self.callback())}")
+        except Exception:
+            # 取值失败时只输出元数据，不影响其他指标
+            pass
+        return lines
+
+
+_metrics: List[Any] = []
+
+
+def histogram(name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, help_text, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+    metric = Gauge(name, help_text, callback)
+    _metrics.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    """以Prometheus文本格式输出所有指标"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# 一轮语音对话各阶段的耗时：upload_read / audio_decode / vad / stt / llm_ttft / llm_total / tts / sse_send
+STAGE_SECONDS = histogram(
+    "voicebot_stage_duration_seconds", "Duration of each voice turn stage", ("stage",)
+)
+STAGE_ERRORS = counter(
+    "voicebot_stage_errors_total", "Number of failed stage executions", ("stage",)
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """记录一个不便用span包裹的阶段耗时（如首token延迟）"""
+    STAGE_SECONDS.observe(seconds, stage)
+
+
+@contextmanager
+def span(stage: str, **attributes: Any):
+    """
+    记录代码块耗时到阶段直方图；启用OpenTelemetry时同时创建trace span
+
+    Args:
+        stage (str): 阶段名
+        attributes: 附加到trace span上的属性
+    """
+    otel_span = None
+    if _tracer is not None:
+        otel_span = _tracer.start_as_current_span(stage, attributes=attributes)
+        otel_span.__enter__()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            STAGE_ERRORS.inc(stage)
+        if otel_span is not None:
+            otel_span.__exit__(type(e), e, e.__traceback__)
+            otel_span = None
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+
+
+async def timed_events(events: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    转发SSE事件并记录每个事件的发送耗时
+
+    生成器在yield处挂起的时间就是服务端框架序列化并写出该事件所用的时间（含客户端背压）。
+    """
+    async for event in events:
+        started = time.perf_counter()
+        yield event
+        STAGE_SECONDS.observe(time.perf_counter() - started, "sse_send")
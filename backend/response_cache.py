@@ -0,0 +1,287 @@
+import os
+import time
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta
+
+from tts_cache import normalize_text
+
+# 是否启用LLM回复缓存（适合常见问题等重复提问较多的场景）
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+# 缓存有效期（秒）
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+# 缓存总大小上限（字节）
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# 近似匹配的相似度阈值（余弦相似度），设为1及以上时只做精确匹配。
+# 字符n-gram向量分不清"北京/南京""周六/周日"这类只差一个字的问题，阈值不宜低于0.97
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.97"))
+# 近似匹配使用的向量维度
+RESPONSE_CACHE_EMBED_DIM = int(os.environ.get("RESPONSE_CACHE_EMBED_DIM", "1024"))
+# 回放缓存时每个文本增量的字符数
+RESPONSE_CACHE_REPLAY_CHARS = int(os.environ.get("RESPONSE_CACHE_REPLAY_CHARS", "16"))
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w]+")
+# 阿拉伯数字和中文数字，近似匹配时要求两边完全一致
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?|[零〇一二两三四五六七八九十百千万亿]+")
+# 否定词，近似匹配时同样要求两边完全一致
+_NEGATION_PATTERN = re.compile(r"[不没别非无未]|\b(?:not|no|never|none|nothing)\b|n't\b")
+
+
+def normalize_query(text: str) -> str:
+    """规范化用户输入：统一全角/半角、转小写并去掉标点和空白，"在吗？"与"在吗"视为同一问题"""
+    return _PUNCTUATION_PATTERN.sub("", normalize_text(text).lower())
+
+
+def guard_tokens(text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    提取问题中的数字和否定词
+
+    "2+3等于几"与"2+5等于几"、"我想了解"与"我不想了解"字面相似但含义不同，
+    这些词不一致的问题不能互相近似命中。
+    """
+    text = normalize_text(text).lower()
+    return tuple(_NUMBER_PATTERN.findall(text)), tuple(_NEGATION_PATTERN.findall(text))
+
+
+def embed_text(text: str, dim: int = RESPONSE_CACHE_EMBED_DIM) -> np.ndarray:
+    """
+    本地文本向量：字符1~3元组哈希到固定维度后做L2归一化
+
+    不依赖模型，能容忍标点、语气词和少量字词差异，适合判断近似重复的提问。
+    """
+    text = normalize_query(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    for n in (1, 2, 3):
+        grams = [text[i:i + n] for i in range(len(text) - n + 1)]
+        if not grams:
+            continue
+        buckets = [
+            int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") % dim
+            for g in grams
+        ]
+        # 长元组更能区分语义，权重更高
+        np.add.at(vector, buckets, float(n))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class CachedResponse:
+    __slots__ = ("key", "index_key", "vector", "content", "reasoning", "created_at", "size")
+
+    def __init__(self, key: str, index_key: str, vector: Optional[np.ndarray], content: str, reasoning: str):
+        self.key = key
+        self.index_key = index_key
+        self.vector = vector
+        self.content = content
+        self.reasoning = reasoning
+        self.created_at = time.monotonic()
+        self.size = len(content.encode("utf-8")) + len(reasoning.encode("utf-8"))
+        if vector is not None:
+            self.size += vector.nbytes
+
+
+class _VectorIndex:
+    """同一上下文下的提问向量，查询时一次矩阵乘法求出全部相似度"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.vectors: List[np.ndarray] = []
+        self.guards: List[Tuple] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, key: str, vector: np.ndarray, guard: Tuple):
+        self.keys.append(key)
+        self.vectors.append(vector)
+        self.guards.append(guard)
+        self._matrix = None
+
+    def remove(self, key: str):
+        i = self.keys.index(key)
+        del self.keys[i]
+        del self.vectors[i]
+        del self.guards[i]
+        self._matrix = None
+
+    def search(self, vector: np.ndarray, guard: Tuple) -> Tuple[Optional[str], float]:
+        """只在数字和否定词完全相同的提问中找最相似的一个"""
+        candidates = [i for i, g in enumerate(self.guards) if g == guard]
+        if not candidates:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.stack(self.vectors)
+        scores = self._matrix[candidates] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[candidates[best]], float(scores[best])
+
+
+class ResponseCache:
+    """
+    LLM回复缓存
+
+    精确匹配：按模型分命名空间，以规范化后的 (系统提示词, 历史, 用户输入) 的哈希为key。
+    近似匹配：系统提示词和历史完全相同、问题中的数字和否定词一致时，用本地文本向量比较用户输入的相似度。
+    按TTL过期，超过总大小时按LRU淘汰。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self.size = 0
+        self._items: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._indexes: Dict[str, _VectorIndex] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity < 1
+
+    @staticmethod
+    def _keys(model: str, system_prompt: str, history: List[Dict[str, str]], text: str) -> Tuple[str, str]:
+        """返回 (精确匹配key, 近似匹配所在的索引key)"""
+        context = json.dumps(
+            [model, normalize_text(system_prompt)]
+            + [[m.get("role"), normalize_text(m.get("content") or "")] for m in history],
+            ensure_ascii=False,
+        )
+        index_key = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        key = hashlib.sha256(f"{index_key}\x1f{normalize_query(text)}".encode("utf-8")).hexdigest()
+        return key, index_key
+
+    def _remove(self, entry: CachedResponse):
+        self._items.pop(entry.key, None)
+        self.size -= entry.size
+        index = self._indexes.get(entry.index_key)
+        if index is not None and entry.vector is not None:
+            index.remove(entry.key)
+            if not index.keys:
+                del self._indexes[entry.index_key]
+
+    def _expired(self, entry: CachedResponse) -> bool:
+        """命中的条目可能因为最近访问过而不在淘汰队列前端，需要单独检查是否过期"""
+        if time.monotonic() - entry.created_at < self.ttl:
+            return False
+        self.expirations += 1
+        self._remove(entry)
+        return True
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._items:
+            entry = next(iter(self._items.values()))
+            if now - entry.created_at >= self.ttl:
+                self.expirations += 1
+            elif self.size > self.max_bytes:
+                self.evictions += 1
+            else:
+                break
+            self._remove(entry)
+
+    def lookup(
+        self, model: str, system_prompt: str, history: List[Dict[str, str]], text: str
+    ) -> Tuple[Optional[CachedResponse], Optional[str], float]:
+        """
+        查找缓存的回复
+
+        Returns:
+            Tuple: (缓存条目, 匹配方式 "exact"/"semantic", 相似度)，未命中时条目为None
+        """
+        if not self.enabled:
+            return None, None, 0.0
+        self._evict()
+        key, index_key = self._keys(model, system_prompt, history, text)
+        entry = self._items.get(key)
+        if entry is not None and self._expired(entry):
+            entry = None
+        if entry is not None:
+            self._items.move_to_end(key)
+            self.exact_hits += 1
+            return entry, "exact", 1.0
+
+        index = self._indexes.get(index_key)
+        if self.semantic and index is not None:
+            best_key, score = index.search(embed_text(text), guard_tokens(text))
+            if best_key is not None and score >= self.similarity and not self._expired(self._items[best_key]):
+                self._items.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._items[best_key], "semantic", score
+
+        self.misses += 1
+        return None, None, 0.0
+
+    def store(
+        self,
+        model: str,
+        system_prompt: str,
+        history: List[Dict[str, str]],
+        text: str,
+        content: str,
+        reasoning: str = "",
+    ):
+        """保存完整的回复（只应在回复正常结束时调用）"""
+        if not self.enabled or not content:
+            return
+        key, index_key = self._keys(model, system_prompt, history, text)
+        old = self._items.get(key)
+        if old is not None:
+            self._remove(old)
+        vector = embed_text(text) if self.semantic else None
+        entry = CachedResponse(key, index_key, vector, content, reasoning)
+        if entry.size > self.max_bytes:
+            return
+        self._items[key] = entry
+        self.size += entry.size
+        if vector is not None:
+            self._indexes.setdefault(index_key, _VectorIndex()).add(key, vector, guard_tokens(text))
+        self.stores += 1
+        self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "similarity": self.similarity,
+            "entries": len(self._items),
+            "bytes": self.size,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+async def replay_chunks(entry: CachedResponse, model: str) -> AsyncIterator[ChatCompletionChunk]:
+    """把缓存的回复切成与上游流式接口相同结构的增量，不加延迟地回放，供原有的流式处理逻辑直接使用"""
+    step = RESPONSE_CACHE_REPLAY_CHARS
+    for field, text in (("reasoning_content", entry.reasoning), ("content", entry.content)):
+        for i in range(0, len(text), step):
+            delta = {"content": None, "reasoning_content": None}
+            delta[field] = text[i:i + step]
+            yield ChatCompletionChunk(
+                id="cache",
+                choices=[Choice(index=0, delta=ChoiceDelta(**delta))],
+                created=int(time.time()),
+                model=model,
+                object="chat.completion.chunk",
+            )
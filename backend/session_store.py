@@ -0,0 +1,327 @@
+import logging
+import os
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 会话存储后端，默认为进程内存储；可通过 register_session_backend 注册其他实现
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+# 会话空闲多久后过期（秒）
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "3600"))
+# 最多保存的会话数
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+# 所有会话内容的总大小上限（字节）
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+# 每次请求携带的历史消息token预算（估算值）
+SESSION_HISTORY_TOKENS = int(os.environ.get("SESSION_HISTORY_TOKENS", "2000"))
+# 是否把超出预算的早期对话总结成摘要（会额外调用一次LLM）
+SESSION_SUMMARIZE = os.environ.get("SESSION_SUMMARIZE", "false").lower() == "true"
+
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按每字1个，其余字符按每4个1个"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """截取文本开头，使估算token数不超过给定值；被截断时以省略号结尾"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid] + "…") <= tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+class Session:
+    """一个会话的服务端状态：摘要和最近的消息"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.summary = ""
+        # 每条消息为 {"role", "content"}，tokens与之一一对应
+        self.messages: List[Dict[str, str]] = []
+        self.tokens: List[int] = []
+        # 已写入的全部历史（含被截断、总结的部分）的token数
+        self.total_tokens = 0
+        self.updated_at = time.time()
+
+    @property
+    def size(self) -> int:
+        return len(self.summary.encode("utf-8")) + sum(
+            len(m["content"].encode("utf-8")) for m in self.messages)
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        tokens = estimate_tokens(content)
+        self.tokens.append(tokens)
+        self.total_tokens += tokens
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sessionId": self.session_id,
+            "summary": self.summary,
+            "messages": self.messages,
+            "totalTokens": self.total_tokens,
+            "updatedAt": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Session":
+        session = cls(data["sessionId"])
+        session.summary = data.get("summary", "")
+        for message in data.get("messages", []):
+            session.append(message["role"], message["content"])
+        session.total_tokens = data.get("totalTokens", session.total_tokens)
+        session.updated_at = data.get("updatedAt", session.updated_at)
+        return session
+
+
+class MemorySessionBackend:
+    """进程内会话存储，按空闲时间过期，按会话数和总大小LRU淘汰"""
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def _evict(self):
+        now = time.time()
+        while self._items:
+            session_id, (session, size) = next(iter(self._items.items()))
+            if now - session.updated_at >= self.ttl:
+                self.expired += 1
+            elif len(self._items) > self.max_sessions or self.size > self.max_bytes:
+                self.evicted += 1
+            else:
+                break
+            self._items.popitem(last=False)
+            self.size -= size
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        self._evict()
+        item = self._items.get(session_id)
+        if item is None:
+            return None
+        self._items.move_to_end(session_id)
+        return item[0]
+
+    async def put(self, session: Session):
+        old = self._items.pop(session.session_id, None)
+        if old:
+            self.size -= old[1]
+        size = session.size
+        self._items[session.session_id] = (session, size)
+        self.size += size
+        self._evict()
+
+    async def delete(self, session_id: str):
+        old = self._items.pop(session_id, None)
+        if old:
+            self.size -= old[1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._items),
+            "bytes": self.size,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+_BACKENDS: Dict[str, Callable[[], Any]] = {
+    "memory": MemorySessionBackend,
+}
+
+
+def register_session_backend(name: str, factory: Callable[[], Any]):
+    """
+    注册会话存储后端（如Redis）
+
+    Args:
+        name (str): 后端名称，对应SESSION_BACKEND配置
+        factory: 创建后端的函数，返回的对象需提供异步的 get / put / delete 方法和 stats 方法，
+            需要序列化时可使用 Session.to_dict / Session.from_dict
+    """
+    _BACKENDS[name] = factory
+
+
+class SessionStore:
+    """
+    服务端会话存储
+
+    客户端只需发送会话ID和新消息，历史由服务端保存。每次请求只携带token预算内的
+    最近消息；超出预算的早期消息被丢弃，或在启用总结时合并进摘要。
+    """
+
+    def __init__(
+        self,
+        backend: str = SESSION_BACKEND,
+        history_tokens: int = SESSION_HISTORY_TOKENS,
+        summarize: Optional[Callable[[str, List[Dict[str, str]]], Awaitable[str]]] = None,
+    ):
+        """
+        Args:
+            backend (str): 存储后端名称
+            history_tokens (int): 每次请求携带的历史token预算
+            summarize: 总结函数，参数为(已有摘要, 要合并的消息)，返回新摘要；为None时直接丢弃超出预算的消息
+        """
+        self.backend = _BACKENDS[backend]()
+        self.history_tokens = history_tokens
+        self.summarize = summarize
+        self._summarizing: Dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+        self.messages_dropped = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    async def get_or_create(
+        self, session_id: str, seed_history: Optional[List[Dict[str, str]]] = None
+    ) -> Session:
+        """
+        获取会话，不存在时新建
+
+        Args:
+            session_id (str): 会话ID
+            seed_history (List[Dict[str, str]], optional): 会话不存在（新会话或已过期）时用客户端提供的历史初始化
+
+        Returns:
+            Session: 会话
+        """
+        session = await self.backend.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            for message in seed_history or []:
+                if message.get("role") in ("user", "assistant") and message.get("content"):
+                    session.append(message["role"], message["content"])
+            self._trim(session)
+            await self.backend.put(session)
+        return session
+
+    def _budget(self, session: Session) -> int:
+        return self.history_tokens - (estimate_tokens(session.summary) if session.summary else 0)
+
+    def _window_start(self, session: Session) -> int:
+        """
+        返回token预算内最早一条消息的下标
+
+        最近一条用户消息及其后的回复总是保留在窗口内，即使单独就超出预算（由history截断），
+        只有更早的对话会被丢弃或合并进摘要。
+        """
+        budget = self._budget(session)
+        used = 0
+        start = len(session.messages)
+        while start > 0 and used + session.tokens[start - 1] <= budget:
+            start -= 1
+            used += session.tokens[start]
+        # 从用户消息开始，避免窗口以半轮对话开头
+        while start < len(session.messages) and session.messages[start]["role"] != "user":
+            start += 1
+        for latest in range(len(session.messages) - 1, -1, -1):
+            if session.messages[latest]["role"] == "user":
+                return min(start, latest)
+        return start
+
+    def history(self, session: Session) -> List[Dict[str, str]]:
+        """
+        取出本次请求要携带的历史消息
+
+        Returns:
+            List[Dict[str, str]]: 摘要（如有）加上预算内的最近消息
+        """
+        start = self._window_start(session)
+        history = []
+        if session.summary:
+            history.append({"role": "system", "content": f"以下是之前对话的摘要：\n{session.summary}"})
+        # 窗口只剩最近一轮且仍超出预算时，从前往后截断消息内容直到放得下
+        over = sum(session.tokens[start:]) - max(self._budget(session), 0)
+        for message, tokens in zip(session.messages[start:], session.tokens[start:]):
+            if over > 0:
+                content = truncate_to_tokens(message["content"], max(tokens - over, 1))
+                over -= tokens - estimate_tokens(content)
+                message = {"role": message["role"], "content": content}
+            history.append(message)
+
+        sent = sum(estimate_tokens(m["content"]) for m in history)
+        self.requests += 1
+        self.tokens_sent += sent
+        self.tokens_saved += max(0, session.total_tokens - sent)
+        return history
+
+    def _trim(self, session: Session):
+        """把窗口外的消息移出会话；启用总结时先在后台合并进摘要"""
+        start = self._window_start(session)
+        if start == 0:
+            return
+        if self.summarize is None:
+            del session.messages[:start]
+            del session.tokens[:start]
+            self.messages_dropped += start
+        elif session.session_id not in self._summarizing:
+            self._summarizing[session.session_id] = asyncio.ensure_future(
+                self._summarize(session, start))
+
+    async def _summarize(self, session: Session, count: int):
+        try:
+            summary = await self.summarize(session.summary, session.messages[:count])
+            session.summary = summary.strip()
+            del session.messages[:count]
+            del session.tokens[:count]
+            self.summaries += 1
+            await self.backend.put(session)
+        except Exception as e:
+            # 总结失败时丢弃这些消息，保证会话大小有界
+            logger.warning(f"总结会话历史失败: {str(e)}")
+            self.summary_failures += 1
+            del session.messages[:count]
+            del session.tokens[:count]
+            self.messages_dropped += count
+        finally:
+            self._summarizing.pop(session.session_id, None)
+
+    async def append_turn(self, session: Session, user_text: str, assistant_text: str):
+        """记录一轮对话"""
+        session.append("user", user_text)
+        session.append("assistant", assistant_text)
+        self._trim(session)
+        await self.backend.put(session)
+
+    async def delete(self, session_id: str):
+        await self.backend.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.backend.stats(),
+            "history_tokens": self.history_tokens,
+            "summarize": self.summarize is not None,
+            "requests": self.requests,
+            "tokens_sent": self.tokens_sent,
+            # 与每次都发送完整历史相比节省的prompt token（估算）
+            "tokens_saved": self.tokens_saved,
+            "messages_dropped": self.messages_dropped,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+        }
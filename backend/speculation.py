@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import Counter, deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from metrics import counter
+from session_store import estimate_tokens
+from sse_events import StreamEvent
+
+logger = logging.getLogger(__name__)
+
+# 是否在中间识别结果稳定后提前开始生成回复（仅 /ws/voice 流式会话）
+SPECULATIVE_LLM = os.environ.get("SPECULATIVE_LLM", "false").lower() == "true"
+# 连续多少次中间识别结果相同（忽略标点和语气词）视为稳定
+SPECULATIVE_STABLE_PARTIALS = int(os.environ.get("SPECULATIVE_STABLE_PARTIALS", "2"))
+# 比较识别结果时忽略的语气词，逗号分隔
+SPECULATIVE_FILLERS = os.environ.get("SPECULATIVE_FILLERS", "嗯,啊,呃,额,哦,唔,um,uh,er,ah,hmm")
+
+SPECULATION_OUTCOMES = counter(
+    "voicebot_speculation_total", "Speculative LLM starts by outcome", ("outcome",))
+SPECULATION_WASTED_TOKENS = counter(
+    "voicebot_speculation_wasted_tokens_total", "Estimated output tokens discarded by missed speculation")
+
+
+def _filler_pattern(fillers: str) -> re.Pattern:
+    words = [w.strip().lower() for w in fillers.split(",") if w.strip()]
+    # 英文语气词只按整词匹配，避免误删单词中的字母
+    latin = [re.escape(w) for w in words if w.isascii()]
+    other = [re.escape(w) for w in words if not w.isascii()]
+    parts = []
+    if latin:
+        parts.append(r"\b(?:" + "|".join(latin) + r")\b")
+    if other:
+        parts.append("(?:" + "|".join(other) + ")")
+    return re.compile("|".join(parts) or r"(?!)")
+
+
+_FILLERS = _filler_pattern(SPECULATIVE_FILLERS)
+
+
+def normalize_transcript(text: str) -> str:
+    """
+    归一化识别结果，用于判断中间结果与最终结果是否一致
+
+    全角转半角、转小写，去掉语气词、标点和空白。
+
+    Args:
+        text (str): 识别文本
+
+    Returns:
+        str: 归一化后的文本
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _FILLERS.sub(" ", text)
+    return "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("P", "Z", "S", "C"))
+    )
+
+
+class Speculation:
+    """
+    一次推测执行：基于稳定的中间识别结果提前开始的回复
+
+    回复事件先缓冲起来不发送；最终识别结果一致时通过 replay 按顺序取出
+    已缓冲和之后到达的事件，不一致时取消轮次并丢弃缓冲。
+    """
+
+    def __init__(self, text: str, normalized: str, turn):
+        self.text = text
+        self.normalized = normalized
+        self.turn = turn
+        self.started_at = time.monotonic()
+        self.events: Deque[StreamEvent] = deque()
+        self.output_text = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def start(self, events: AsyncIterator[StreamEvent]):
+        self.task = asyncio.create_task(self._consume(events))
+
+    async def _consume(self, events: AsyncIterator[StreamEvent]):
+        try:
+            async for event in events:
+                if event.is_text:
+                    self.output_text.append(event.payload["content"])
+                self.events.append(event)
+                self._changed.set()
+        except Exception as e:
+            logger.debug(f"推测执行的回复出错: {str(e)}")
+            self.events.append(StreamEvent.error(str(e)))
+        finally:
+            self.done = True
+            self._changed.set()
+
+    async def replay(self) -> AsyncIterator[StreamEvent]:
+        """按顺序取出已缓冲和之后到达的事件，直到回复结束"""
+        while True:
+            while self.events:
+                yield self.events.popleft()
+            if self.done:
+                return
+            self._changed.clear()
+            if not self.events and not self.done:
+                await self._changed.wait()
+
+    def cancel(self, reason: str = "speculation"):
+        """
+        停止回复生成
+
+        通过轮次的取消信号停止，而不是直接取消任务：回复生成在结束时还要等待确认、
+        关闭上游流并结束轮次，直接取消任务会打断这些清理。
+        """
+        self.turn.cancel(reason)
+
+    @property
+    def wasted_tokens(self) -> int:
+        text = "".join(self.output_text)
+        return estimate_tokens(text) if text else 0
+
+
+class SpeculationStats:
+    """推测执行的命中率、浪费的token和提前量统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses: Counter = Counter()
+        self.wasted_tokens = 0
+        self.lead_seconds = 0.0
+
+    def record_start(self):
+        with self._lock:
+            self.started += 1
+
+    def record_hit(self, speculation: Speculation):
+        """最终识别结果一致，记录回复比正常流程提前开始了多久"""
+        lead = time.monotonic() - speculation.started_at
+        with self._lock:
+            self.hits += 1
+            self.lead_seconds += lead
+        SPECULATION_OUTCOMES.inc("hit")
+
+    def record_miss(self, speculation: Speculation, reason: str):
+        """
+        推测未命中，记录浪费的输出token（按已生成的文本估算）
+
+        Args:
+            speculation (Speculation): 被丢弃的推测执行
+            reason (str): diverged（后续中间结果变化）、mismatch（最终结果不一致）、
+                no_final（最终识别失败）、reset、disconnect
+        """
+        wasted = speculation.wasted_tokens
+        with self._lock:
+            self.misses[reason] += 1
+            self.wasted_tokens += wasted
+        SPECULATION_OUTCOMES.inc(reason)
+        if wasted:
+            SPECULATION_WASTED_TOKENS.inc(amount=wasted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            missed = sum(self.misses.values())
+            resolved = self.hits + missed
+            return {
+                "enabled": SPECULATIVE_LLM,
+                "started": self.started,
+                "hits": self.hits,
+                "misses": dict(self.misses),
+                "hit_rate": round(self.hits / resolved, 4) if resolved else None,
+                # 每次未命中都白白发出了一次LLM请求（输入token）以及已生成的输出token
+                "wasted_requests": missed,
+                "wasted_output_tokens": self.wasted_tokens,
+                "avg_lead_ms": round(self.lead_seconds / self.hits * 1000, 1) if self.hits else None,
+            }
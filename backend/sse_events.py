@@ -0,0 +1,181 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 文本增量合并的时间窗口（毫秒）：窗口内到达的连续文本增量合并成一个事件发送，0为不合并
+SSE_COALESCE_MS = float(os.environ.get("SSE_COALESCE_MS", "0"))
+# 合并的文本达到该字节数时不等时间窗口结束立即发送，0为不限制
+SSE_COALESCE_BYTES = int(os.environ.get("SSE_COALESCE_BYTES", "0"))
+
+# 与 sse_starlette 默认的行分隔符一致
+SSE_SEPARATOR = "\r\n"
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑的JSON，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class StreamEvent:
+    """
+    流式回复中的一个事件
+
+    生成回复的代码直接构造事件对象，下游（SSE接口、WebSocket会话）按 type 和 payload 处理，
+    不需要再解析JSON；data 和 SSE 帧只在第一次使用时序列化一次。
+    """
+
+    __slots__ = ("event", "payload", "_data", "_frame")
+
+    def __init__(self, payload: Dict[str, Any], event: str = "message"):
+        self.event = event
+        self.payload = payload
+        self._data: Optional[str] = None
+        self._frame: Optional[bytes] = None
+
+    @classmethod
+    def of(cls, event_type: str, **fields: Any) -> "StreamEvent":
+        """构造一个 {"type": event_type, ...} 消息事件"""
+        return cls({"type": event_type, **fields})
+
+    @classmethod
+    def text(cls, content: str) -> "StreamEvent":
+        return cls({"type": "text", "content": content})
+
+    @classmethod
+    def error(cls, message: str) -> "StreamEvent":
+        return cls({"error": message}, event="error")
+
+    @property
+    def type(self) -> Optional[str]:
+        return self.payload.get("type")
+
+    @property
+    def is_text(self) -> bool:
+        """是否为可以合并的纯文本增量"""
+        return self.event == "message" and self.type == "text" and len(self.payload) == 2
+
+    @property
+    def data(self) -> str:
+        if self._data is None:
+            self._data = dumps(self.payload)
+        return self._data
+
+    def encode(self) -> bytes:
+        """编码为完整的SSE帧（JSON中的换行已被转义，data只有一行）"""
+        if self._frame is None:
+            self._frame = (
+                f"event: {self.event}{SSE_SEPARATOR}data: {self.data}{SSE_SEPARATOR}{SSE_SEPARATOR}"
+            ).encode("utf-8")
+        return self._frame
+
+
+async def coalesce_text(
+    events: AsyncIterator[StreamEvent],
+    window_ms: float = SSE_COALESCE_MS,
+    max_bytes: int = SSE_COALESCE_BYTES,
+) -> AsyncIterator[StreamEvent]:
+    """
+    把连续的小文本增量合并成一个事件，减少每个token一帧的发送开销
+
+    文本在第一个增量到达后最多缓冲window_ms毫秒，或累计达到max_bytes字节时发送；
+    遇到其他类型的事件时先发送缓冲的文本，保证事件顺序不变。
+    上游在一个单独的任务中读取，读到的事件放入队列，下游按时间窗口取出。
+
+    Args:
+        events: 原始事件流
+        window_ms (float): 合并的时间窗口（毫秒），不大于0时不合并
+        max_bytes (int): 合并的最大字节数，0为不限制
+    """
+    if window_ms <= 0:
+        async for event in events:
+            yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: Deque[StreamEvent] = deque()
+    # 上游结束时为 (异常或None,)
+    finished: List[Optional[BaseException]] = []
+    waiter: Optional[asyncio.Future] = None
+
+    def wake(*_):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def pump():
+        try:
+            async for event in events:
+                queue.append(event)
+                wake()
+            finished.append(None)
+        except Exception as e:
+            finished.append(e)
+        finally:
+            wake()
+
+    pump_task = asyncio.ensure_future(pump())
+    buffer: List[str] = []
+    buffered_bytes = 0
+    deadline = 0.0
+    try:
+        while True:
+            while queue:
+                event = queue.popleft()
+                if event.is_text:
+                    if not buffer:
+                        deadline = loop.time() + window_ms / 1000
+                    content = event.payload["content"]
+                    buffer.append(content)
+                    buffered_bytes += len(content.encode("utf-8"))
+                    if max_bytes > 0 and buffered_bytes >= max_bytes:
+                        yield StreamEvent.text("".join(buffer))
+                        buffer, buffered_bytes = [], 0
+                    continue
+                if buffer:
+                    yield StreamEvent.text("".join(buffer))
+                    buffer, buffered_bytes = [], 0
+                yield event
+            if finished:
+                break
+            if buffer and loop.time() >= deadline:
+                yield StreamEvent.text("".join(buffer))
+                buffer, buffered_bytes = [], 0
+                continue
+            # 等待新事件到达或时间窗口结束
+            waiter = loop.create_future()
+            timer = loop.call_at(deadline, wake) if buffer else None
+            try:
+                await waiter
+            finally:
+                waiter = None
+                if timer is not None:
+                    timer.cancel()
+        if buffer:
+            yield StreamEvent.text("".join(buffer))
+        if finished[0] is not None:
+            raise finished[0]
+    finally:
+        # 下游提前结束（客户端断开）时取消上游，让上游执行自己的清理
+        if not pump_task.done():
+            pump_task.cancel()
+            try:
+                await pump_task
+            except asyncio.CancelledError:
+                pass
+
+
+async def sse_frames(events: AsyncIterator[StreamEvent]) -> AsyncIterator[bytes]:
+    """把事件流转换为 EventSourceResponse 可以直接发送的SSE帧"""
+    async for event in events:
+        yield event.encode()
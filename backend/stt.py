@@ -1,17 +1,39 @@
+import logging
 import requests
+import io
 import os
-import whisper
-from typing import Optional, Dict, Any
+import time
+import wave
+import threading
+import numpy as np
+from typing import Optional, Dict, Any, List, Union
 from dotenv import load_dotenv
 
+from audio_utils import SAMPLE_RATE, AUDIO_MIME_TYPES, decode_audio, encode_wav, sniff_audio_format
+from http_client import request_with_retry
+from stt_engines import LocalSTTEngine, create_engine, STT_ENGINE
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
+# 识别输入可以是文件路径、上传的原始字节或已解码的16kHz float32数组
+AudioInput = Union[str, bytes, bytearray, memoryview, np.ndarray]
+
+# 本地模型的加载方式：
+# "background" 服务启动后在后台加载，加载完成前 /api/ready 返回503（默认）
+# "eager" 启动时同步加载，加载完成后才开始接受请求
+# "lazy" 收到第一个识别请求时才加载
+STT_LOAD_MODE = os.environ.get("STT_LOAD_MODE", "background")
+# 模型加载后是否先用一段静音做一次推理预热，避免第一个真实请求变慢
+STT_WARMUP = os.environ.get("STT_WARMUP", "true").lower() == "true"
+
 
 class STT:
     """
     语音识别类，支持多种语音识别服务
     可通过环境变量STT_SERVICE配置使用的服务类型：
-    - "whisper": 使用本地Whisper模型（默认）
+    - "whisper": 使用本地Whisper模型（默认），推理引擎由STT_ENGINE选择
     - "siliconflow": 使用SiliconFlow API
     """
 
@@ -20,90 +42,285 @@ class STT:
         self.stt_service = os.environ.get("STT_SERVICE", "whisper")
 
         # SiliconFlow API配置
-        self.siliconflow_url = "https://api.siliconflow.cn/v1/audio/transcriptions"
+        siliconflow_api_base = os.environ.get(
+            "SILICONFLOW_API_BASE", "https://api.siliconflow.cn/v1")
+        self.siliconflow_url = f"{siliconflow_api_base}/audio/transcriptions"
         self.siliconflow_model = os.environ.get(
             "SILICONFLOW_MODEL", "FunAudioLLM/SenseVoiceSmall")
 
-        # 如果使用Whisper，加载模型
-        if self.stt_service == "whisper":
-            self.whisper_model_size = os.environ.get(
-                "WHISPER_MODEL_SIZE", "base")
-            print(f"正在加载Whisper模型: {self.whisper_model_size}")
-            self.whisper_model = whisper.load_model(self.whisper_model_size)
-            print("Whisper模型加载完成")
+        # 本地Whisper模型由 load() 加载，构造时不导入推理框架
+        self.engine: Optional[LocalSTTEngine] = None
+        self.engine_name = STT_ENGINE
+        self.whisper_model_size = os.environ.get("WHISPER_MODEL_SIZE", "base")
+        self._load_lock = threading.Lock()
+        self.model_state = "not_loaded" if self.needs_model else "loaded"
+        self.load_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    @property
+    def needs_model(self) -> bool:
+        """是否需要加载本地模型"""
+        return self.stt_service == "whisper"
+
+    @property
+    def ready(self) -> bool:
+        return self.model_state == "loaded"
+
+    def load(self, warmup: bool = False):
+        """
+        加载本地模型（线程安全，重复调用只加载一次）
+
+        Args:
+            warmup (bool): 加载后是否做一次预热推理
+
+        Raises:
+            Exception: 模型加载失败
+        """
+        if not self.needs_model or self.engine is not None:
+            return
+        with self._load_lock:
+            if self.engine is not None:
+                return
+            self.model_state = "loading"
+            started = time.perf_counter()
+            try:
+                logger.info(f"正在加载Whisper模型: {self.whisper_model_size}（引擎: {self.engine_name}）")
+                engine = create_engine(self.engine_name, self.whisper_model_size)
+                engine.load()
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                logger.info(f"Whisper模型加载完成，用时{self.load_seconds}秒")
+                if warmup:
+                    started = time.perf_counter()
+                    # 预热使用一秒静音，只为触发算子初始化和内存分配
+                    engine.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+                    self.warmup_seconds = round(time.perf_counter() - started, 3)
+                    logger.info(f"Whisper模型预热完成，用时{self.warmup_seconds}秒")
+            except Exception as e:
+                self.model_state = "failed"
+                self.load_error = str(e)
+                logger.error(f"Whisper模型加载失败: {str(e)}")
+                raise
+            self.engine = engine
+            self.model_state = "loaded"
+
+    def model_status(self) -> Dict[str, Any]:
+        """模型状态，用于就绪检查"""
+        status = {
+            "service": self.stt_service,
+            "state": self.model_state,
+            "model": self.whisper_model_size if self.needs_model else self.siliconflow_model,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.load_error,
+        }
+        if self.needs_model:
+            status.update(
+                self.engine.describe() if self.engine else {"engine": self.engine_name})
+        return status
 
-    def transcribe(self, audio_file_path: str) -> Dict[str, Any]:
+    def transcribe(self, audio: AudioInput) -> Dict[str, Any]:
         """
-        将音频文件转换为文本
+        将音频转换为文本
 
         Args:
-            audio_file_path (str): 音频文件路径
+            audio: 音频文件路径、音频文件的原始字节或16kHz float32数组
 
         Returns:
             Dict[str, Any]: 包含识别结果的字典，至少包含"text"键
         """
         # 检查文件是否存在
-        if not os.path.exists(audio_file_path):
+        if isinstance(audio, str) and not os.path.exists(audio):
             return {"text": "错误：音频文件不存在", "error": True}
 
         # 根据配置的服务类型调用不同的转录方法
         if self.stt_service == "whisper":
-            return self._transcribe_with_whisper(audio_file_path)
+            return self._transcribe_with_whisper(audio)
         elif self.stt_service == "siliconflow":
-            return self._transcribe_with_siliconflow(audio_file_path)
+            return self._transcribe_with_siliconflow(audio)
         else:
             return {"text": f"错误：不支持的语音识别服务 {self.stt_service}", "error": True}
 
-    def _transcribe_with_whisper(self, audio_file_path: str) -> Dict[str, Any]:
+    @property
+    def is_remote(self) -> bool:
+        """是否使用远程API识别（不占用本地算力，可以直接在事件循环中异步等待）"""
+        return self.stt_service == "siliconflow"
+
+    async def transcribe_async(self, audio: AudioInput) -> Dict[str, Any]:
+        """
+        异步语音识别，仅用于远程API服务，本地模型应通过STTExecutor在线程池中调用
+
+        Args:
+            audio: 音频文件路径、音频文件的原始字节或16kHz float32数组
+
+        Returns:
+            Dict[str, Any]: 包含识别结果的字典，至少包含"text"键
+        """
+        if isinstance(audio, str) and not os.path.exists(audio):
+            return {"text": "错误：音频文件不存在", "error": True}
+        if self.stt_service == "siliconflow":
+            return await self._transcribe_with_siliconflow_async(audio)
+        return {"text": f"错误：{self.stt_service} 不支持异步识别", "error": True}
+
+    @staticmethod
+    def _load_audio(audio: AudioInput) -> np.ndarray:
+        """把各种输入统一转换为识别引擎使用的16kHz float32数组"""
+        if isinstance(audio, np.ndarray):
+            return audio
+        if isinstance(audio, str):
+            with open(audio, "rb") as audio_file:
+                return decode_audio(audio_file.read())
+        return decode_audio(audio)
+
+    def _transcribe_with_whisper(self, audio: AudioInput) -> Dict[str, Any]:
         """使用Whisper模型进行语音识别"""
         try:
-            result = self.whisper_model.transcribe(audio_file_path)
-            return result
+            self.load()
+            return self.engine.transcribe(self._load_audio(audio))
         except Exception as e:
             error_msg = f"Whisper语音识别失败: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return {"text": error_msg, "error": True}
 
-    def _transcribe_with_siliconflow(self, audio_file_path: str) -> Dict[str, Any]:
+    def transcribe_batch(self, audios: List[AudioInput]) -> List[Dict[str, Any]]:
+        """
+        批量语音识别，whisper引擎会把多段短音频合并为一个batch进行一次编码和解码
+
+        Args:
+            audios (List[AudioInput]): 音频列表
+
+        Returns:
+            List[Dict[str, Any]]: 与输入顺序一致的识别结果列表
+        """
+        if self.stt_service != "whisper":
+            return [self.transcribe(audio) for audio in audios]
+
+        try:
+            self.load()
+        except Exception as e:
+            error_msg = f"Whisper模型加载失败: {str(e)}"
+            return [{"text": error_msg, "error": True} for _ in audios]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(audios)
+        batch = []
+        batch_indexes = []
+        for i, audio in enumerate(audios):
+            if isinstance(audio, str) and not os.path.exists(audio):
+                results[i] = {"text": "错误：音频文件不存在", "error": True}
+                continue
+            try:
+                batch.append(self._load_audio(audio))
+                batch_indexes.append(i)
+            except Exception as e:
+                error_msg = f"Whisper语音识别失败: {str(e)}"
+                logger.error(error_msg)
+                results[i] = {"text": error_msg, "error": True}
+
+        if batch:
+            try:
+                for i, result in zip(batch_indexes, self.engine.transcribe_batch(batch)):
+                    results[i] = result
+            except Exception as e:
+                error_msg = f"Whisper批量语音识别失败: {str(e)}"
+                logger.error(error_msg)
+                for i in batch_indexes:
+                    results[i] = {"text": error_msg, "error": True}
+
+        return results
+
+    @staticmethod
+    def audio_duration(audio: AudioInput) -> Optional[float]:
+        """获取音频时长（秒），WAV只读取文件头；无法快速获得时返回None"""
+        if isinstance(audio, np.ndarray):
+            return len(audio) / SAMPLE_RATE
+        try:
+            source = audio if isinstance(audio, str) else io.BytesIO(audio)
+            with wave.open(source, "rb") as wave_file:
+                return wave_file.getnframes() / float(wave_file.getframerate())
+        except Exception:
+            return None
+
+    def _siliconflow_request(self, audio: AudioInput):
+        """构建SiliconFlow识别请求的表单、文件和请求头"""
+        # 准备请求参数
+        payload = {'model': self.siliconflow_model}
+
+        # 准备文件内容，内存中的音频直接上传，不写临时文件
+        if isinstance(audio, str):
+            with open(audio, 'rb') as audio_file:
+                content = audio_file.read()
+            file_name = os.path.basename(audio)
+        elif isinstance(audio, np.ndarray):
+            content = encode_wav(audio)
+            file_name = "audio.wav"
+        else:
+            content = bytes(audio)
+            # 按文件头确定格式，浏览器录制的WebM/Opus不能当作WAV上传
+            file_name = f"audio.{sniff_audio_format(content) or 'wav'}"
+        audio_format = os.path.splitext(file_name)[1].lstrip(".").lower()
+        files = [
+            ('file', (file_name, content, AUDIO_MIME_TYPES.get(audio_format, 'application/octet-stream')))
+        ]
+
+        # 准备请求头
+        headers = {
+            'Authorization': f'Bearer {os.environ.get("OPENAI_API_KEY")}'
+        }
+        return payload, files, headers
+
+    @staticmethod
+    def _parse_siliconflow_response(status_code: int, result, text: str) -> Dict[str, Any]:
+        """把SiliconFlow的响应转换为与Whisper一致的格式"""
+        if status_code == 200:
+            # 确保返回的结果格式与Whisper一致
+            if isinstance(result, dict) and "text" in result:
+                return result
+            else:
+                # 转换为与Whisper一致的格式
+                return {"text": str(result)}
+        else:
+            error_msg = f"SiliconFlow API请求失败: {status_code} - {text}"
+            logger.error(error_msg)
+            return {"text": error_msg, "error": True}
+
+    def _transcribe_with_siliconflow(self, audio: AudioInput) -> Dict[str, Any]:
         """使用SiliconFlow API进行语音识别"""
         try:
-            # 准备请求参数
-            payload = {'model': self.siliconflow_model}
-
-            # 准备文件
-            with open(audio_file_path, 'rb') as audio_file:
-                files = [
-                    ('file', (os.path.basename(audio_file_path), audio_file, 'audio/wav'))
-                ]
-
-                # 准备请求头
-                headers = {
-                    'Authorization': f'Bearer {os.environ.get("OPENAI_API_KEY")}'
-                }
-
-                # 发送请求
-                response = requests.post(
-                    self.siliconflow_url,
-                    headers=headers,
-                    data=payload,
-                    files=files
-                )
-
-                # 检查响应
-                if response.status_code == 200:
-                    result = response.json()
-                    # 确保返回的结果格式与Whisper一致
-                    if isinstance(result, dict) and "text" in result:
-                        return result
-                    else:
-                        # 转换为与Whisper一致的格式
-                        return {"text": str(result)}
-                else:
-                    error_msg = f"SiliconFlow API请求失败: {response.status_code} - {response.text}"
-                    print(error_msg)
-                    return {"text": error_msg, "error": True}
+            payload, files, headers = self._siliconflow_request(audio)
+
+            # 发送请求
+            response = requests.post(
+                self.siliconflow_url,
+                headers=headers,
+                data=payload,
+                files=files
+            )
+            result = response.json() if response.status_code == 200 else None
+            return self._parse_siliconflow_response(
+                response.status_code, result, response.text)
+
+        except Exception as e:
+            error_msg = f"SiliconFlow语音识别失败: {str(e)}"
+            logger.error(error_msg)
+            return {"text": error_msg, "error": True}
+
+    async def _transcribe_with_siliconflow_async(self, audio: AudioInput) -> Dict[str, Any]:
+        """使用共享的异步HTTP客户端调用SiliconFlow API进行语音识别"""
+        try:
+            payload, files, headers = self._siliconflow_request(audio)
+
+            response = await request_with_retry(
+                "POST",
+                self.siliconflow_url,
+                headers=headers,
+                data=payload,
+                files=files,
+            )
+            result = response.json() if response.status_code == 200 else None
+            return self._parse_siliconflow_response(
+                response.status_code, result, response.text)
 
         except Exception as e:
             error_msg = f"SiliconFlow语音识别失败: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return {"text": error_msg, "error": True}
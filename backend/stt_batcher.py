@@ -0,0 +1,151 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 每个batch最多包含的音频数，1表示不启用批处理
+STT_BATCH_SIZE = int(os.environ.get("STT_BATCH_SIZE", "1"))
+# 第一个请求到达后最多等待多少毫秒凑batch
+STT_BATCH_WAIT_MS = float(os.environ.get("STT_BATCH_WAIT_MS", "20"))
+# 按音频时长（秒）分桶的边界，时长相近的音频放在同一个batch中，减少补齐和解码浪费
+STT_BATCH_BUCKETS = [
+    float(x) for x in os.environ.get("STT_BATCH_BUCKETS", "5,15,30").split(",") if x
+]
+
+# 无法获得时长的音频单独放在一个桶里
+_UNKNOWN_BUCKET = -1
+
+
+class _BatchItem:
+    __slots__ = ("audio", "submitted_at", "future")
+
+    def __init__(self, audio: Any, submitted_at: float, future: asyncio.Future):
+        self.audio = audio
+        self.submitted_at = submitted_at
+        self.future = future
+
+
+class STTBatcher:
+    """
+    语音识别动态批处理调度器
+
+    收集一段时间内（最多 max_wait_ms 毫秒或 max_batch_size 个）的识别请求，
+    按音频时长分桶后整批交给 run_batch 执行，再把每条结果交还给对应调用方的future。
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any], List[float]], Awaitable[List[Tuple[Dict, float, float]]]],
+        max_batch_size: int = STT_BATCH_SIZE,
+        max_wait_ms: float = STT_BATCH_WAIT_MS,
+        length_fn: Optional[Callable[[Any], Optional[float]]] = None,
+        on_release: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            run_batch: 执行一个batch的协程函数，参数为(音频列表, 提交时间列表)，
+                返回与输入顺序一致的 (结果, 等待秒数, 执行秒数) 列表
+            max_batch_size (int): 每个batch最多包含的音频数
+            max_wait_ms (float): 凑batch的最长等待时间（毫秒）
+            length_fn: 计算音频时长（秒）的函数，用于分桶
+            on_release: 每个请求处理完成或被丢弃时调用，用于释放排队名额
+        """
+        self._run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._length_fn = length_fn
+        self._on_release = on_release
+        self._buckets: Dict[int, List[_BatchItem]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self.batches = 0
+        self.batched_items = 0
+
+    def _bucket_of(self, audio: Any) -> int:
+        length = self._length_fn(audio) if self._length_fn else None
+        if length is None:
+            return _UNKNOWN_BUCKET
+        for i, boundary in enumerate(STT_BATCH_BUCKETS):
+            if length <= boundary:
+                return i
+        return len(STT_BATCH_BUCKETS)
+
+    def submit(self, audio: Any, submitted_at: float) -> asyncio.Future:
+        """
+        提交一个识别请求
+
+        Returns:
+            asyncio.Future: 结果为 (识别结果, 等待秒数, 执行秒数)。
+                在被调度前取消future会把请求从batch中移除
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        bucket = self._bucket_of(audio)
+        items = self._buckets.setdefault(bucket, [])
+        items.append(_BatchItem(audio, submitted_at, future))
+
+        if len(items) >= self.max_batch_size:
+            self._flush(bucket)
+        elif bucket not in self._timers:
+            self._timers[bucket] = loop.call_later(
+                self.max_wait, self._flush, bucket)
+        return future
+
+    def _release(self):
+        if self._on_release:
+            self._on_release()
+
+    def _flush(self, bucket: int):
+        timer = self._timers.pop(bucket, None)
+        if timer:
+            timer.cancel()
+        items = self._buckets.pop(bucket, [])
+
+        # 已经超时或取消的请求直接丢弃
+        active = []
+        for item in items:
+            if item.future.done():
+                self._release()
+            else:
+                active.append(item)
+        if active:
+            asyncio.ensure_future(self._execute(active))
+
+    async def _execute(self, items: List[_BatchItem]):
+        self.batches += 1
+        self.batched_items += len(items)
+        try:
+            outputs = await self._run_batch(
+                [item.audio for item in items],
+                [item.submitted_at for item in items],
+            )
+            for item, output in zip(items, outputs):
+                if not item.future.done():
+                    item.future.set_result(output)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            for _ in items:
+                self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_items / self.batches, 2)
+            if self.batches
+            else 0,
+        }
+
+
+def run_batch_with_timing(stt, audios: List[Any], submitted_ats: List[float]):
+    """在工作线程/进程中执行一个batch，返回每条的 (结果, 等待秒数, 执行秒数)"""
+    started_at = time.time()
+    results = stt.transcribe_batch(audios)
+    run_time = time.time() - started_at
+    return [
+        (result, started_at - submitted_at, run_time)
+        for result, submitted_at in zip(results, submitted_ats)
+    ]
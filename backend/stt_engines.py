@@ -0,0 +1,175 @@
+import os
+import logging
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 本地识别引擎: "whisper"（openai-whisper/PyTorch，参考实现）或 "faster_whisper"（CTranslate2，CPU上支持int8量化）
+STT_ENGINE = os.environ.get("STT_ENGINE", "whisper")
+# 计算精度: "default" 使用引擎默认值（whisper为float32，faster_whisper为int8）；
+# 也可指定 "int8" / "float16" / "float32" / "int8_float16" 等，whisper引擎的int8为PyTorch动态量化
+STT_COMPUTE_TYPE = os.environ.get("STT_COMPUTE_TYPE", "default")
+# 单个模型推理使用的CPU线程数，0表示使用库的默认值
+STT_THREADS = int(os.environ.get("STT_THREADS", "0"))
+# 解码的beam大小，1为贪心解码（与whisper参考实现的默认行为一致）
+STT_BEAM_SIZE = int(os.environ.get("STT_BEAM_SIZE", "1"))
+# 识别语言，为空时自动检测
+STT_LANGUAGE = os.environ.get("STT_LANGUAGE", "") or None
+
+
+class LocalSTTEngine:
+    """
+    本地识别引擎接口
+
+    输入统一为16kHz float32单声道数组，返回至少包含 "text" 的字典。
+    """
+
+    name = "base"
+
+    def __init__(self, model_size: str, compute_type: str = STT_COMPUTE_TYPE, threads: int = STT_THREADS):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.threads = threads
+
+    def load(self):
+        """加载模型（在工作线程/进程中调用）"""
+        raise NotImplementedError
+
+    def transcribe(self, samples: np.ndarray) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def transcribe_batch(self, batch: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """批量识别，默认逐条执行；支持批量推理的引擎可以重写"""
+        return [self.transcribe(samples) for samples in batch]
+
+    def describe(self) -> Dict[str, Any]:
+        return {"engine": self.name, "compute_type": self.compute_type, "threads": self.threads}
+
+
+class WhisperEngine(LocalSTTEngine):
+    """openai-whisper 参考实现，短音频可以合并为一个batch推理"""
+
+    name = "whisper"
+
+    def __init__(self, model_size: str, compute_type: str = STT_COMPUTE_TYPE, threads: int = STT_THREADS):
+        super().__init__(model_size, "float32" if compute_type == "default" else compute_type, threads)
+        self.model = None
+
+    def load(self):
+        import torch
+        import whisper
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        model = whisper.load_model(self.model_size)
+        if self.compute_type == "int8":
+            if model.device.type != "cpu":
+                raise ValueError("whisper引擎的int8只支持CPU")
+            # 线性层动态量化为int8，卷积和注意力的其他部分保持float32
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self.compute_type == "float16" and model.device.type == "cpu":
+            raise ValueError("whisper引擎在CPU上不支持float16")
+        self.model = model
+
+    @property
+    def _fp16(self) -> bool:
+        return self.model.device.type == "cuda" and self.compute_type != "float32"
+
+    def transcribe(self, samples: np.ndarray) -> Dict[str, Any]:
+        return self.model.transcribe(
+            samples, fp16=self._fp16, language=STT_LANGUAGE, beam_size=STT_BEAM_SIZE if STT_BEAM_SIZE > 1 else None
+        )
+
+    def transcribe_batch(self, batch: List[np.ndarray]) -> List[Dict[str, Any]]:
+        import torch
+        import whisper
+
+        results: List[Any] = [None] * len(batch)
+        mels = []
+        batch_indexes = []
+        for i, samples in enumerate(batch):
+            if len(samples) > whisper.audio.N_SAMPLES:
+                # 超过30秒的音频需要滑动窗口，单独走完整的transcribe流程
+                results[i] = self.transcribe(samples)
+                continue
+            # 短音频统一补齐到30秒窗口，可以在一个batch里编码
+            mel = whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(samples), n_mels=self.model.dims.n_mels
+            )
+            mels.append(mel.to(self.model.device))
+            batch_indexes.append(i)
+
+        if mels:
+            options = whisper.DecodingOptions(
+                fp16=self._fp16,
+                language=STT_LANGUAGE,
+                beam_size=STT_BEAM_SIZE if STT_BEAM_SIZE > 1 else None,
+            )
+            decoded = whisper.decode(self.model, torch.stack(mels), options)
+            for i, item in zip(batch_indexes, decoded):
+                results[i] = {"text": item.text, "language": item.language}
+        return results
+
+
+class FasterWhisperEngine(LocalSTTEngine):
+    """faster-whisper（CTranslate2）引擎，CPU上默认使用int8量化"""
+
+    name = "faster_whisper"
+
+    def __init__(self, model_size: str, compute_type: str = STT_COMPUTE_TYPE, threads: int = STT_THREADS):
+        super().__init__(model_size, "int8" if compute_type == "default" else compute_type, threads)
+        self.model = None
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(
+            self.model_size,
+            device=os.environ.get("STT_DEVICE", "auto"),
+            compute_type=self.compute_type,
+            cpu_threads=self.threads,
+        )
+
+    def transcribe(self, samples: np.ndarray) -> Dict[str, Any]:
+        segments, info = self.model.transcribe(
+            samples, beam_size=STT_BEAM_SIZE, language=STT_LANGUAGE
+        )
+        # segments是惰性生成器，遍历时才真正解码
+        text = "".join(segment.text for segment in segments)
+        return {"text": text.strip(), "language": info.language}
+
+
+_ENGINES: Dict[str, Callable[..., LocalSTTEngine]] = {
+    "whisper": WhisperEngine,
+    "faster_whisper": FasterWhisperEngine,
+}
+
+
+def register_stt_engine(name: str, factory: Callable[..., LocalSTTEngine]):
+    """
+    注册新的本地识别引擎
+
+    Args:
+        name (str): 引擎名称，对应STT_ENGINE配置
+        factory: 参数为 (model_size, compute_type, threads) 的构造函数，返回 LocalSTTEngine
+    """
+    _ENGINES[name] = factory
+
+
+def create_engine(
+    name: str = STT_ENGINE,
+    model_size: str = "base",
+    compute_type: str = STT_COMPUTE_TYPE,
+    threads: int = STT_THREADS,
+) -> LocalSTTEngine:
+    """
+    创建（但不加载）识别引擎
+
+    Raises:
+        ValueError: 未知的引擎名称
+    """
+    if name not in _ENGINES:
+        raise ValueError(f"不支持的识别引擎: {name}（可选: {', '.join(_ENGINES)}）")
+    return _ENGINES[name](model_size, compute_type, threads)
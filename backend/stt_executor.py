@@ -0,0 +1,396 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from stt import STT_LOAD_MODE, STT_WARMUP
+from stt_batcher import STTBatcher, STT_BATCH_SIZE, run_batch_with_timing
+
+logger = logging.getLogger(__name__)
+
+# 执行方式: "thread" 线程池（共享同一个模型实例）、"process" 进程池（每个进程各自加载模型）
+# 或 "remote" 发送到独立的模型服务进程（stt_server.py），多个API进程共用一份模型
+STT_EXECUTOR = os.environ.get("STT_EXECUTOR", "thread")
+# 工作线程/进程数，Whisper推理本身会使用多核，一般按 CPU核数 / 每个推理占用的线程数 设置
+STT_WORKERS = int(os.environ.get("STT_WORKERS", "1"))
+# 除正在执行的任务外最多允许排队的任务数，超过后直接返回503
+STT_QUEUE_SIZE = int(os.environ.get("STT_QUEUE_SIZE", "8"))
+# 单个识别任务的超时时间（秒），包含排队时间
+STT_TIMEOUT = float(os.environ.get("STT_TIMEOUT", "60"))
+# 队列已满时建议客户端的重试等待时间（秒）
+STT_RETRY_AFTER = int(os.environ.get("STT_RETRY_AFTER", "2"))
+
+# remote模式下刷新模型服务状态的间隔（秒）
+STT_SERVER_STATUS_INTERVAL = float(os.environ.get("STT_SERVER_STATUS_INTERVAL", "5"))
+
+# 统计等待/执行耗时分位数时保留的最近样本数
+_METRIC_WINDOW = 1000
+
+
+class STTQueueFullError(Exception):
+    """识别队列已满，调用方应返回503并带上Retry-After"""
+
+    def __init__(self, retry_after: int = STT_RETRY_AFTER):
+        super().__init__("语音识别服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+
+class STTTimeoutError(Exception):
+    """识别任务超时"""
+
+
+# 进程池模式下，每个工作进程持有自己的STT实例
+_worker_stt = None
+
+
+def _init_worker(stt_factory: Callable[[], Any], preload: bool = False, warmup: bool = False):
+    global _worker_stt
+    _worker_stt = stt_factory()
+    if preload:
+        try:
+            _worker_stt.load(warmup)
+        except Exception:
+            # 初始化函数抛出异常会使整个进程池不可用，失败状态记录在实例中，识别时会重试加载
+            pass
+
+
+def _worker_model_status() -> Dict[str, Any]:
+    """在工作进程中返回模型状态，提交这个任务也会促使进程池创建工作进程并加载模型"""
+    return _worker_stt.model_status()
+
+
+def _run_in_worker(audio: Any, submitted_at: float):
+    """在工作进程中执行识别，返回(结果, 排队等待秒数, 执行秒数)"""
+    started_at = time.time()
+    result = _worker_stt.transcribe(audio)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _run_batch_in_worker(audios: List[Any], submitted_ats: List[float]):
+    """在工作进程中执行一个batch"""
+    return run_batch_with_timing(_worker_stt, audios, submitted_ats)
+
+
+def _run_with_instance(stt, audio: Any, submitted_at: float):
+    """在工作线程中使用共享的STT实例执行识别"""
+    started_at = time.time()
+    result = stt.transcribe(audio)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _percentile(samples, percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[index]
+
+
+class STTExecutor:
+    """
+    语音识别执行器
+
+    把同步的 STT.transcribe 放到线程池或进程池中执行，避免阻塞事件循环。
+    排队任务数有上限，超过时抛出 STTQueueFullError；每个任务有超时时间。
+    """
+
+    def __init__(
+        self,
+        stt_factory: Callable[[], Any],
+        mode: str = STT_EXECUTOR,
+        workers: int = STT_WORKERS,
+        queue_size: int = STT_QUEUE_SIZE,
+        timeout: float = STT_TIMEOUT,
+        batch_size: int = STT_BATCH_SIZE,
+        length_fn: Optional[Callable[[Any], Optional[float]]] = None,
+        load_mode: str = STT_LOAD_MODE,
+        warmup: bool = STT_WARMUP,
+    ):
+        """
+        Args:
+            stt_factory: 创建STT实例的函数（进程池模式下需可被pickle，例如STT类本身）
+            mode (str): "thread"、"process" 或 "remote"
+            workers (int): 工作线程/进程数（remote模式下由模型服务配置）
+            queue_size (int): 最大排队任务数（remote模式下由模型服务限制）
+            timeout (float): 单个任务超时时间（秒）
+            batch_size (int): 动态批处理的最大batch大小，大于1时启用批处理
+            length_fn: 计算音频时长的函数，批处理时用于按时长分桶
+            load_mode (str): 本地模型加载方式 "background" / "eager" / "lazy"
+            warmup (bool): 模型加载后是否预热
+        """
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.load_mode = load_mode
+        self.warmup = warmup
+        self.stt = None
+        self._pool = None
+        self._client = None
+        self._load_future: Optional[asyncio.Future] = None
+        # 进程池模式下由工作进程返回、remote模式下由模型服务返回的模型状态
+        self._worker_status: Optional[Dict[str, Any]] = None
+
+        if mode == "remote":
+            from stt_server import STTClient
+
+            self._client = STTClient()
+        elif mode == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(stt_factory, load_mode != "lazy", warmup),
+            )
+            if load_mode == "eager":
+                futures = [self._pool.submit(_worker_model_status) for _ in range(workers)]
+                self._worker_status = futures[-1].result()
+        else:
+            self.stt = stt_factory()
+            self._pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="stt"
+            )
+            if load_mode == "eager":
+                self.stt.load(warmup)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._cancelled = 0
+        self._wait_times = deque(maxlen=_METRIC_WINDOW)
+        self._run_times = deque(maxlen=_METRIC_WINDOW)
+
+        self.batcher = None
+        # remote模式下由模型服务进行批处理
+        if batch_size > 1 and mode != "remote":
+            self.batcher = STTBatcher(
+                self._run_batch,
+                max_batch_size=batch_size,
+                length_fn=length_fn,
+                on_release=self._release,
+            )
+
+    def start(self):
+        """
+        在后台加载模型（background模式，应在事件循环启动后调用）
+
+        线程池模式下加载任务占用一个工作线程，此时到达的请求会排队等待加载完成，而不是失败。
+        """
+        if self.mode == "remote":
+            if self._load_future is None:
+                self._load_future = asyncio.ensure_future(self._poll_server_status())
+            return
+        if self.load_mode != "background" or self._load_future is not None:
+            return
+        if self.mode == "process":
+            futures = [self._pool.submit(_worker_model_status) for _ in range(self.workers)]
+            self._load_future = asyncio.ensure_future(
+                asyncio.gather(*[asyncio.wrap_future(f) for f in futures]))
+            self._load_future.add_done_callback(self._on_workers_loaded)
+        elif self.stt is not None and getattr(self.stt, "needs_model", False):
+            self._load_future = asyncio.wrap_future(
+                self._pool.submit(self.stt.load, self.warmup))
+            self._load_future.add_done_callback(self._on_loaded)
+
+    @staticmethod
+    def _on_loaded(future: asyncio.Future):
+        # 取出异常避免未处理异常的警告；错误已记录在模型状态中，识别请求到达时会重试加载
+        if not future.cancelled():
+            future.exception()
+
+    def _on_workers_loaded(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"识别工作进程启动失败: {str(future.exception())}")
+            self._worker_status = {"state": "failed", "error": str(future.exception())}
+            return
+        statuses = future.result()
+        failed = [s for s in statuses if s.get("state") != "loaded"]
+        self._worker_status = failed[0] if failed else statuses[0]
+
+    async def _poll_server_status(self):
+        """定期从模型服务获取模型状态，供就绪检查使用"""
+        while True:
+            try:
+                status = await self._client.status()
+                self._worker_status = {**status.get("model", {}), "server_ready": status.get("ready")}
+            except Exception as e:
+                self._worker_status = {"state": "unavailable", "error": str(e)}
+            await asyncio.sleep(STT_SERVER_STATUS_INTERVAL)
+
+    def model_status(self) -> Dict[str, Any]:
+        """模型加载状态"""
+        if self.stt is not None:
+            status = self.stt.model_status()
+        elif self._worker_status is not None:
+            status = dict(self._worker_status)
+        elif self._load_future is not None:
+            status = {"state": "loading"}
+        else:
+            status = {"state": "not_loaded"}
+        if self.mode != "remote":
+            status["load_mode"] = self.load_mode
+        return status
+
+    @property
+    def ready(self) -> bool:
+        """是否可以处理识别请求：模型已加载；lazy模式下只要没有加载失败就视为就绪"""
+        status = self.model_status()
+        state = status["state"]
+        if self.mode == "remote":
+            return bool(status.get("server_ready"))
+        if self.load_mode == "lazy":
+            return state != "failed"
+        return state == "loaded"
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _on_done(self, _future):
+        self._release()
+
+    async def _run_batch(self, audios: List[Any], submitted_ats: List[float]):
+        if self.mode == "process":
+            future = self._pool.submit(
+                _run_batch_in_worker, audios, submitted_ats)
+        else:
+            future = self._pool.submit(
+                run_batch_with_timing, self.stt, audios, submitted_ats
+            )
+        return await asyncio.wrap_future(future)
+
+    async def _transcribe_via_server(self, audio: Any, submitted_at: float):
+        started_at = time.time()
+        result = await self._client.transcribe(audio)
+        return result, started_at - submitted_at, time.time() - started_at
+
+    async def _transcribe_remote(self, audio: Any, submitted_at: float):
+        started_at = time.time()
+        result = await self.stt.transcribe_async(audio)
+        return result, started_at - submitted_at, time.time() - started_at
+
+    async def transcribe(self, audio: Any) -> Dict[str, Any]:
+        """
+        异步执行语音识别
+
+        Args:
+            audio: 音频文件路径、上传的原始字节或已解码的音频数组
+
+        Returns:
+            Dict[str, Any]: 与 STT.transcribe 相同格式的结果
+
+        Raises:
+            STTQueueFullError: 排队任务已满
+            STTTimeoutError: 任务超时
+        """
+        with self._lock:
+            # remote模式下排队上限由模型服务统一控制
+            if self.mode != "remote" and self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise STTQueueFullError()
+            self._pending += 1
+            self._submitted += 1
+
+        submitted_at = time.time()
+        if self._client is not None:
+            waiter = asyncio.ensure_future(
+                self._transcribe_via_server(audio, submitted_at))
+            waiter.add_done_callback(self._on_done)
+        elif self.stt is not None and getattr(self.stt, "is_remote", False):
+            # 远程API识别只是等待网络IO，直接在事件循环中异步执行，不占用工作线程
+            waiter = asyncio.ensure_future(
+                self._transcribe_remote(audio, submitted_at))
+            waiter.add_done_callback(self._on_done)
+        elif self.batcher:
+            # 批处理模式下由batcher在请求完成或被丢弃时释放名额
+            waiter = self.batcher.submit(audio, submitted_at)
+        else:
+            if self.mode == "process":
+                future = self._pool.submit(
+                    _run_in_worker, audio, submitted_at)
+            else:
+                future = self._pool.submit(
+                    _run_with_instance, self.stt, audio, submitted_at
+                )
+            future.add_done_callback(self._on_done)
+            waiter = asyncio.wrap_future(future)
+
+        try:
+            result, wait_time, run_time = await asyncio.wait_for(
+                waiter, timeout=self.timeout
+            )
+        except asyncio.CancelledError:
+            # 调用方已放弃（客户端断开或被打断），排队中的任务随之取消并释放名额
+            with self._lock:
+                self._cancelled += 1
+            raise
+        except STTQueueFullError:
+            # 模型服务排队已满
+            with self._lock:
+                self._rejected += 1
+            raise
+        except STTTimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise
+        except asyncio.TimeoutError:
+            # 仍在排队的任务会被取消并释放名额，已开始执行的任务无法中断，会继续占用工作线程直到完成
+            with self._lock:
+                self._timeouts += 1
+            raise STTTimeoutError(f"语音识别超时（超过{self.timeout}秒）")
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+
+        with self._lock:
+            self._completed += 1
+            self._wait_times.append(wait_time)
+            self._run_times.append(run_time)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列深度和耗时统计，用于按核数调整工作线程/进程数"""
+        with self._lock:
+            pending = self._pending
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            return {
+                "mode": self.mode,
+                "model": self.model_status(),
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "cpu_count": os.cpu_count(),
+                "in_flight": pending,
+                "queue_depth": max(0, pending - self.workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "cancelled": self._cancelled,
+                "wait_ms_p50": round(_percentile(wait_times, 50) * 1000, 1),
+                "wait_ms_p95": round(_percentile(wait_times, 95) * 1000, 1),
+                "wait_ms_max": round(max(wait_times, default=0) * 1000, 1),
+                "run_ms_p50": round(_percentile(run_times, 50) * 1000, 1),
+                "run_ms_p95": round(_percentile(run_times, 95) * 1000, 1),
+                "batching": self.batcher.stats() if self.batcher else None,
+            }
+
+    def shutdown(self):
+        """关闭线程池/进程池（或与模型服务的连接），取消尚未开始的任务"""
+        if self._client is not None:
+            if self._load_future is not None:
+                self._load_future.cancel()
+            self._client.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
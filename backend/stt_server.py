@@ -0,0 +1,281 @@
+"""
+独立的语音识别模型服务
+
+模型只在这个进程中加载一份，API进程（uvicorn --workers N）设置 STT_EXECUTOR=remote 后
+通过本地Unix socket把识别任务发送过来，扩展API进程数不会成倍增加模型内存。
+
+用法（在 backend 目录下运行）:
+    python stt_server.py
+    STT_EXECUTOR=remote uvicorn main:app --workers 4
+
+协议：每一帧为 4字节大端JSON长度 + JSON头 + 二进制负载（长度由JSON头中的size给出）。
+一个连接上可以同时有多个请求，按id对应响应。
+- 请求 {"id", "op": "transcribe", "kind": "f32" | "bytes" | "path"} + 音频负载
+- 请求 {"id", "op": "cancel", "target"}: 取消尚未完成的识别（调用方已放弃）
+- 请求 {"id", "op": "status"}: 返回模型状态和队列统计
+- 响应 {"id", "result"} 或 {"id", "error", "type": "queue_full" | "timeout" | "error", "retry_after"}
+"""
+import os
+import json
+import signal
+import struct
+import asyncio
+import logging
+import itertools
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 模型服务监听的Unix socket路径
+STT_SERVER_SOCKET = os.environ.get("STT_SERVER_SOCKET", "/tmp/voice-chat-bot-stt.sock")
+# 模型服务内部的执行方式（"thread" 或 "process"），与API进程的 STT_EXECUTOR=remote 区分
+STT_SERVER_EXECUTOR = os.environ.get("STT_SERVER_EXECUTOR", "thread")
+# 连接模型服务的超时时间（秒）
+STT_SERVER_CONNECT_TIMEOUT = float(os.environ.get("STT_SERVER_CONNECT_TIMEOUT", "5"))
+
+_LENGTH = struct.Struct(">I")
+
+
+def encode_audio(audio: Any) -> Tuple[str, bytes]:
+    """把识别输入编码为 (类型, 负载)；已解码的音频以float32原始字节传输，服务端无需再次解码"""
+    if isinstance(audio, np.ndarray):
+        return "f32", np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+    if isinstance(audio, str):
+        return "path", audio.encode("utf-8")
+    return "bytes", bytes(audio)
+
+
+def decode_audio_payload(kind: str, payload: bytes) -> Any:
+    if kind == "f32":
+        return np.frombuffer(payload, dtype=np.float32).copy()
+    if kind == "path":
+        return payload.decode("utf-8")
+    return payload
+
+
+def write_frame(writer: asyncio.StreamWriter, header: Dict[str, Any], payload: bytes = b""):
+    """
+    写入一帧（不等待drain）
+
+    两次write之间没有await，同一连接上并发的请求/响应不会交错。
+    """
+    data = json.dumps({**header, "size": len(payload)}, ensure_ascii=False).encode("utf-8")
+    writer.write(_LENGTH.pack(len(data)) + data)
+    if payload:
+        writer.write(payload)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = json.loads(await reader.readexactly(length))
+    size = header.get("size", 0)
+    payload = await reader.readexactly(size) if size else b""
+    return header, payload
+
+
+class STTServer:
+    """在Unix socket上提供识别服务，内部使用 STTExecutor（线程池/进程池、动态批处理、排队上限）"""
+
+    def __init__(self, executor, socket_path: str = STT_SERVER_SOCKET):
+        self.executor = executor
+        self.socket_path = socket_path
+        self.connections = 0
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self.executor.start()
+        logger.info(f"语音识别模型服务已启动: {self.socket_path}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        async with server:
+            await stop.wait()
+        logger.info("语音识别模型服务已停止")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        tasks: Dict[Any, asyncio.Task] = {}
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                if header.get("op") == "cancel":
+                    task = tasks.get(header.get("target"))
+                    if task:
+                        task.cancel()
+                    continue
+                request_id = header.get("id")
+                task = asyncio.create_task(self._dispatch(header, payload, writer))
+                tasks[request_id] = task
+                task.add_done_callback(lambda _, rid=request_id: tasks.pop(rid, None))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # 连接断开或服务停止
+            pass
+        finally:
+            # API进程断开时，它排队中的任务也不再需要
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+            self.connections -= 1
+
+    async def _dispatch(self, header: Dict[str, Any], payload: bytes, writer: asyncio.StreamWriter):
+        from stt_executor import STTQueueFullError, STTTimeoutError
+
+        response: Dict[str, Any] = {"id": header.get("id")}
+        op = header.get("op")
+        try:
+            if op == "transcribe":
+                audio = decode_audio_payload(header.get("kind", "bytes"), payload)
+                response["result"] = await self.executor.transcribe(audio)
+            elif op == "status":
+                response["result"] = {
+                    "ready": self.executor.ready,
+                    "model": self.executor.model_status(),
+                    "stats": self.executor.stats(),
+                    "connections": self.connections,
+                }
+            else:
+                response.update(error=f"未知的操作: {op}", type="error")
+        except STTQueueFullError as e:
+            response.update(error=str(e), type="queue_full", retry_after=e.retry_after)
+        except STTTimeoutError as e:
+            response.update(error=str(e), type="timeout")
+        except Exception as e:
+            logger.error(f"识别请求处理失败: {str(e)}")
+            response.update(error=str(e), type="error")
+        if writer.is_closing():
+            return
+        write_frame(writer, response)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+class STTClient:
+    """
+    模型服务客户端（API进程中使用）
+
+    复用一个连接，多个识别请求可以同时进行；连接断开后下一个请求会自动重连。
+    """
+
+    def __init__(self, socket_path: str = STT_SERVER_SOCKET, connect_timeout: float = STT_SERVER_CONNECT_TIMEOUT):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(self.socket_path), timeout=self.connect_timeout
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise ConnectionError(f"语音识别模型服务不可用({self.socket_path}): {str(e)}") from e
+            self._read_task = asyncio.create_task(self._read_loop(self._reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                header, _ = await read_frame(reader)
+                future = self._pending.pop(header.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(header)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self._reader is reader:
+                self._writer = None
+                self._reader = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("与语音识别模型服务的连接已断开"))
+
+    async def request(self, op: str, payload: bytes = b"", **fields) -> Dict[str, Any]:
+        await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        writer = self._writer
+        write_frame(writer, {"id": request_id, "op": op, **fields}, payload)
+        try:
+            await writer.drain()
+            return await future
+        except asyncio.CancelledError:
+            # 调用方放弃（超时、被打断或客户端断开）时通知服务端取消排队中的任务
+            self._pending.pop(request_id, None)
+            if self.connected:
+                write_frame(self._writer, {"id": next(self._ids), "op": "cancel", "target": request_id})
+            raise
+
+    async def transcribe(self, audio: Any) -> Dict[str, Any]:
+        """
+        发送识别请求
+
+        Raises:
+            STTQueueFullError: 模型服务排队已满
+            STTTimeoutError: 模型服务端超时
+            ConnectionError: 模型服务不可用
+        """
+        from stt_executor import STTQueueFullError, STTTimeoutError
+
+        kind, payload = encode_audio(audio)
+        response = await self.request("transcribe", payload, kind=kind)
+        error_type = response.get("type")
+        if error_type == "queue_full":
+            raise STTQueueFullError(response.get("retry_after", 2))
+        if error_type == "timeout":
+            raise STTTimeoutError(response.get("error"))
+        if error_type:
+            raise RuntimeError(response.get("error"))
+        return response["result"]
+
+    async def status(self) -> Dict[str, Any]:
+        return (await self.request("status")).get("result", {})
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            self._read_task.cancel()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from logging_setup import setup_logging
+    from stt import STT
+    from stt_executor import STTExecutor
+
+    setup_logging()
+    executor = STTExecutor(STT, mode=STT_SERVER_EXECUTOR, length_fn=STT.audio_duration)
+    try:
+        asyncio.run(STTServer(executor).serve())
+    finally:
+        executor.shutdown()
+        if os.path.exists(STT_SERVER_SOCKET):
+            os.unlink(STT_SERVER_SOCKET)
+
+
+if __name__ == "__main__":
+    main()
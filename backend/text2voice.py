@@ -1,15 +1,15 @@
+import logging
 import os
 import requests
 import base64
-import httpx
 
-voice_map = {
-    "默认音色": "FunAudioLLM/CosyVoice2-0.5B:anna",
-    "妖娆女声": "speech:zh_7:cm03s5czm00m4d2xjtvw24a1z:ipzlwiaetyssioaftrpl",
-    "马斯克": "speech:elon_musk:cm03s5czm00m4d2xjtvw24a1z:lztzzdlgyxuvrmmlnpvv",
-    "可爱女声": "speech:cute_girl_2:cm03s5czm00m4d2xjtvw24a1z:aueuxmukjlhnyjdamduq",
-}
+from http_client import request_with_retry
 
+logger = logging.getLogger(__name__)
+
+# SiliconFlow API地址，可指向兼容的自建服务或本地测试桩
+SILICONFLOW_API_BASE = os.environ.get(
+    "SILICONFLOW_API_BASE", "https://api.siliconflow.cn/v1")
 
 class TextToVoice:
     def __init__(self):
@@ -17,7 +17,7 @@ class TextToVoice:
         if not self.api_key:
             raise ValueError("环境变量 OPENAI_API_KEY 未设置")
 
-        self.url = "https://api.siliconflow.cn/v1/audio/speech"
+        self.url = f"{SILICONFLOW_API_BASE}/audio/speech"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -56,7 +56,7 @@ class TextToVoice:
 
             return self._process_response(response.content)
         except Exception as e:
-            print(f"文字转语音过程出错: {str(e)}")
+            logger.error(f"文字转语音过程出错: {str(e)}")
             raise
 
     async def convert_async(self, text, voice="FunAudioLLM/CosyVoice2-0.5B:anna"):
@@ -70,18 +70,60 @@ class TextToVoice:
         Returns:
             str: base64编码的音频数据
         """
+        return self._process_response(await self.synthesize_async(text, voice))
+
+    async def synthesize_async(self, text, voice="FunAudioLLM/CosyVoice2-0.5B:anna"):
+        """
+        异步方式将文本转换为语音，返回原始音频数据
+
+        Args:
+            text (str): 要转换的文本
+            voice (str): 语音模型
+
+        Returns:
+            bytes: MP3音频数据
+        """
         try:
             payload = self._get_payload(text, voice)
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.url, json=payload, headers=self.headers
-                )
+            # 使用共享的连接池，复用已有连接
+            response = await request_with_retry(
+                "POST", self.url, json=payload, headers=self.headers
+            )
 
             if response.status_code != 200:
                 raise Exception(f"语音生成失败，状态码：{response.status_code}")
 
-            return self._process_response(response.content)
+            return response.content
+        except Exception as e:
+            logger.error(f"文字转语音过程出错: {str(e)}")
+            raise
+
+    async def stream_async(self, text, voice="FunAudioLLM/CosyVoice2-0.5B:anna"):
+        """
+        异步方式将文本转换为语音，音频数据一边到达一边返回
+
+        Args:
+            text (str): 要转换的文本
+            voice (str): 语音模型
+
+        Yields:
+            bytes: MP3音频数据块
+        """
+        payload = self._get_payload(text, voice)
+        # 只在收到响应头之前重试，开始返回音频后不能再重新请求
+        response = await request_with_retry(
+            "POST", self.url, stream=True, json=payload, headers=self.headers
+        )
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"语音生成失败，状态码：{response.status_code}")
+            async for chunk in response.aiter_bytes():
+                if chunk:
+                    yield chunk
         except Exception as e:
-            print(f"文字转语音过程出错: {str(e)}")
+            logger.error(f"文字转语音过程出错: {str(e)}")
             raise
+        finally:
+            await response.aclose()
@@ -0,0 +1,395 @@
+import logging
+import os
+import re
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 是否启用语音合成缓存
+TTS_CACHE_ENABLED = os.environ.get("TTS_CACHE_ENABLED", "true").lower() == "true"
+# 内存缓存的容量上限（字节）
+TTS_CACHE_MEMORY_BYTES = int(os.environ.get("TTS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+# 磁盘缓存目录，为空时不启用磁盘缓存
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "")
+# 磁盘缓存的容量上限（字节）
+TTS_CACHE_DISK_BYTES = int(os.environ.get("TTS_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一全角/半角字符，合并空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+class _MemoryTier:
+    """按字节数限制容量的LRU内存缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._items.get(key)
+        if data is not None:
+            self._items.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes) -> int:
+        """写入缓存，返回因此淘汰的条目数"""
+        if len(data) > self.max_bytes:
+            return 0
+        if key in self._items:
+            self.size -= len(self._items.pop(key))
+        self._items[key] = data
+        self.size += len(data)
+        evicted = 0
+        while self.size > self.max_bytes:
+            _, old = self._items.popitem(last=False)
+            self.size -= len(old)
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _DiskTier:
+    """
+    分片存储的磁盘缓存，文件按key的前两位分目录存放
+
+    启动时扫描目录重建索引，因此重启后缓存仍然有效；超过容量时按最近访问时间淘汰。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        # key -> (文件路径, 大小)，按访问时间从旧到新排列
+        self._index: "OrderedDict[str, tuple]" = OrderedDict()
+        self._load_index()
+
+    def _path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(shard_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name.split(".")[0], path, stat.st_size))
+        for _, key, path, size in sorted(entries):
+            self._index[key] = (path, size)
+            self.size += size
+        logger.info(f"已加载磁盘语音缓存: {len(self._index)} 条, {self.size} 字节")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            self._index.move_to_end(key)
+        path = entry[0]
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新修改时间，重启后仍能按访问顺序淘汰
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                if self._index.pop(key, None):
+                    self.size -= entry[1]
+            return None
+
+    def put(self, key: str, data: bytes, fmt: str) -> int:
+        """写入缓存（先写临时文件再重命名），返回淘汰的条目数"""
+        if len(data) > self.max_bytes:
+            return 0
+        path = self._path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        evicted_paths = []
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old:
+                self.size -= old[1]
+            self._index[key] = (path, len(data))
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (old_path, old_size) = self._index.popitem(last=False)
+                self.size -= old_size
+                evicted_paths.append(old_path)
+        for old_path in evicted_paths:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return len(evicted_paths)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class _Inflight:
+    """
+    进行中的一次合成
+
+    合成任务把音频写入共享缓冲区，相同内容的请求（流式或非流式）都从缓冲区按顺序读取，
+    流式请求可以在合成过程中就拿到已经到达的数据块。
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: bytes):
+        self.buffer.extend(chunk)
+        self._changed.set()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def read(self) -> AsyncIterator[bytes]:
+        """从头读取音频，合成完成前等待新数据到达"""
+        offset = 0
+        while True:
+            if offset < len(self.buffer):
+                chunk = bytes(self.buffer[offset:])
+                offset += len(chunk)
+                yield chunk
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class TTSCache:
+    """
+    语音合成结果缓存
+
+    以 (规范化文本, 音色, 语音服务, 音频格式) 为key，内存LRU + 可选的磁盘缓存两级存储。
+    相同key的并发请求只会触发一次合成。
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_dir: str = TTS_CACHE_DIR,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+        enabled: bool = TTS_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self._memory = _MemoryTier(memory_bytes)
+        self._disk = _DiskTier(disk_dir, disk_bytes) if enabled and disk_dir else None
+        # key -> 进行中的合成
+        self._inflight: Dict[str, _Inflight] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def make_key(text: str, voice: Optional[str], service: str, fmt: str) -> str:
+        raw = "\x1f".join([normalize_text(text), voice or "", service, fmt])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self.memory_hits += 1
+            return data
+        if self._disk is not None:
+            data = await asyncio.to_thread(self._disk.get, key)
+            if data is not None:
+                self.disk_hits += 1
+                self.memory_evictions += self._memory.put(key, data)
+                return data
+        return None
+
+    async def put(self, key: str, data: bytes, fmt: str):
+        self.memory_evictions += self._memory.put(key, data)
+        if self._disk is not None:
+            try:
+                self.disk_evictions += await asyncio.to_thread(
+                    self._disk.put, key, data, fmt)
+            except OSError as e:
+                logger.warning(f"写入磁盘语音缓存失败: {str(e)}")
+
+    async def get_or_synthesize(
+        self,
+        text: str,
+        voice: Optional[str],
+        service: str,
+        fmt: str,
+        synthesize: Callable[[], Awaitable[bytes]],
+    ) -> bytes:
+        """
+        从缓存获取音频，未命中时调用synthesize合成并写入缓存
+
+        Args:
+            text (str): 要合成的文本
+            voice (str): 实际使用的音色
+            service (str): 语音合成服务
+            fmt (str): 音频格式
+            synthesize: 未命中时执行合成的协程函数，返回音频字节
+
+        Returns:
+            bytes: 音频数据
+        """
+        if not self.enabled:
+            return await synthesize()
+
+        key = self.make_key(text, voice, service, fmt)
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        entry = self._join(key, fmt, lambda: self._single(synthesize))
+        reader = self._read(key, entry)
+        try:
+            return b"".join([chunk async for chunk in reader])
+        finally:
+            await reader.aclose()
+
+    async def stream_through(
+        self,
+        text: str,
+        voice: Optional[str],
+        service: str,
+        fmt: str,
+        stream: Callable[[], AsyncIterator[bytes]],
+    ) -> AsyncIterator[bytes]:
+        """
+        流式获取音频：命中缓存时一次返回整段音频，未命中时边合成边返回，完整合成后写入缓存
+
+        相同内容正在合成时（无论流式还是非流式）加入该次合成，从共享缓冲区读取已经到达和之后到达的数据块，
+        不会重复请求合成服务。
+
+        Args:
+            text (str): 要合成的文本
+            voice (str): 实际使用的音色
+            service (str): 语音合成服务
+            fmt (str): 音频格式
+            stream: 未命中时执行流式合成的函数，返回音频数据块的异步迭代器
+        """
+        if not self.enabled:
+            async for chunk in stream():
+                yield chunk
+            return
+
+        key = self.make_key(text, voice, service, fmt)
+        data = await self.get(key)
+        if data is not None:
+            yield data
+            return
+
+        entry = self._join(key, fmt, stream)
+        # 显式关闭读取器：请求中途放弃时立即减少读取者计数，而不是等到垃圾回收
+        reader = self._read(key, entry)
+        try:
+            async for chunk in reader:
+                yield chunk
+        finally:
+            await reader.aclose()
+
+    @staticmethod
+    async def _single(synthesize: Callable[[], Awaitable[bytes]]) -> AsyncIterator[bytes]:
+        yield await synthesize()
+
+    def _join(self, key: str, fmt: str, stream: Callable[[], AsyncIterator[bytes]]) -> _Inflight:
+        """加入相同内容进行中的合成，没有时开始一次新的合成"""
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = _Inflight()
+            self._inflight[key] = entry
+            entry.task = asyncio.ensure_future(self._fill(key, fmt, entry, stream))
+        else:
+            self.coalesced += 1
+        return entry
+
+    async def _read(self, key: str, entry: _Inflight) -> AsyncIterator[bytes]:
+        """
+        读取进行中合成的音频
+
+        某个请求中途放弃（客户端断开、回复被打断）不影响其他请求；所有请求都放弃后才取消合成，
+        被取消的合成立即从进行中移除，之后的相同请求会重新合成。
+        """
+        entry.readers += 1
+        try:
+            async for chunk in entry.read():
+                yield chunk
+        finally:
+            entry.readers -= 1
+            if entry.readers == 0 and not entry.task.done():
+                entry.task.cancel()
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+    async def _fill(
+        self, key: str, fmt: str, entry: _Inflight, stream: Callable[[], AsyncIterator[bytes]]
+    ):
+        """执行合成并写入共享缓冲区，完整合成后写入缓存；合成中途被中断的音频不会写入缓存"""
+        try:
+            async for chunk in stream():
+                entry.append(chunk)
+        except asyncio.CancelledError as e:
+            entry.finish(e)
+            raise
+        except Exception as e:
+            # 错误交给读取的请求处理
+            entry.finish(e)
+        else:
+            entry.finish()
+            await self.put(key, bytes(entry.buffer), fmt)
+        finally:
+            if self._inflight.get(key) is entry:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.size,
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+            "disk_bytes": self._disk.size if self._disk is not None else 0,
+        }
@@ -0,0 +1,298 @@
+import os
+import re
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import edge_tts
+
+from tts_stream import split_text
+
+logger = logging.getLogger(__name__)
+
+# 单次合成请求的最大字符数，0表示使用各语音服务声明的默认值；更长的文本会切分后并行合成
+TTS_CHUNK_CHARS = int(os.environ.get("TTS_CHUNK_CHARS", "0"))
+# 每个语音服务同时进行的合成请求数，0表示使用各语音服务声明的默认值
+TTS_PROVIDER_CONCURRENCY = int(os.environ.get("TTS_PROVIDER_CONCURRENCY", "0"))
+# Edge TTS 的默认音色
+EDGE_TTS_VOICE = os.environ.get("EDGE_TTS_VOICE", "zh-CN-XiaoxiaoNeural")
+
+MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "webm": "audio/webm",
+    "wav": "audio/wav",
+    "pcm": "audio/L16",
+}
+
+# edge-tts 的音色短名称，如 zh-CN-XiaoxiaoNeural、zh-CN-liaoning-XiaobeiNeural
+_EDGE_VOICE_PATTERN = re.compile(r"^[a-z]{2,3}-[A-Za-z]{2,4}(-[A-Za-z]+)?-\w+Neural$")
+
+
+def _id3_size(header: bytes) -> int:
+    """MP3开头ID3v2标签的总长度，没有标签时返回0"""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    # 带页脚的标签多10字节
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+async def _strip_id3(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """去掉音频流开头的ID3标签，后续片段拼接到前一段之后时使用"""
+    head = b""
+    remaining = None
+    async for data in stream:
+        if remaining is None:
+            head += data
+            if len(head) < 10:
+                continue
+            remaining = _id3_size(head)
+            data, head = head, b""
+        if remaining:
+            skipped = min(remaining, len(data))
+            data = data[skipped:]
+            remaining -= skipped
+        if data:
+            yield data
+    if remaining is None and head:
+        yield head
+
+
+class StreamingTTSProvider:
+    """
+    流式语音合成服务
+
+    每个服务声明自己支持的音色、音频格式、单次请求的最大字符数和并发上限。
+    stream 在合成服务返回音频的同时逐块产出音频数据；超过最大字符数的文本按句子切分，
+    在并发上限内并行合成，各段音频按顺序直接拼接（MP3帧可以直接拼接，不需要重新编码）。
+    """
+
+    name = "base"
+    # 音色显示名称 -> 合成服务使用的音色
+    voices: Dict[str, str] = {}
+    default_voice: Optional[str] = None
+    # 支持的音频格式，第一个为输出格式
+    formats: Tuple[str, ...] = ("mp3",)
+    max_chars = 300
+    max_concurrency = 4
+
+    def __init__(self, max_chars: int = TTS_CHUNK_CHARS, max_concurrency: int = TTS_PROVIDER_CONCURRENCY):
+        """
+        Args:
+            max_chars (int): 单次合成请求的最大字符数，不大于0时使用服务声明的默认值
+            max_concurrency (int): 同时进行的合成请求数，不大于0时使用服务声明的默认值
+        """
+        if max_chars > 0:
+            self.max_chars = max_chars
+        if max_concurrency > 0:
+            self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.split_texts = 0
+
+    @property
+    def format(self) -> str:
+        return self.formats[0]
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES.get(self.format, "application/octet-stream")
+
+    def accepts_voice(self, voice: str) -> bool:
+        """是否可以直接使用未在voices中声明的音色（如服务的原始音色ID）"""
+        return False
+
+    def resolve_voice(self, voice: Optional[str] = None) -> Optional[str]:
+        """
+        把请求中的音色映射为合成服务使用的音色
+
+        Args:
+            voice (str, optional): 音色显示名称或服务的原始音色
+
+        Returns:
+            Optional[str]: 服务使用的音色，不支持的音色会回退到默认音色
+        """
+        if not voice:
+            return self.default_voice
+        if voice in self.voices:
+            return self.voices[voice]
+        if voice in self.voices.values() or self.accepts_voice(voice):
+            return voice
+        logger.warning(f"语音服务 {self.name} 不支持音色 {voice}，使用默认音色")
+        return self.default_voice
+
+    def _stream_request(self, text: str, voice: Optional[str]) -> AsyncIterator[bytes]:
+        """执行一次合成请求（文本不超过max_chars），逐块返回音频"""
+        raise NotImplementedError
+
+    async def _stream_limited(self, text: str, voice: Optional[str]) -> AsyncIterator[bytes]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                async for data in self._stream_request(text, voice):
+                    yield data
+            finally:
+                self.in_flight -= 1
+
+    async def stream(self, text: str, voice: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        合成语音并逐块返回
+
+        Args:
+            text (str): 要转换的文本
+            voice (str, optional): 合成服务使用的音色（见resolve_voice），为空时使用默认音色
+
+        Yields:
+            bytes: 音频数据块
+        """
+        voice = voice or self.default_voice
+        pieces = split_text(text, self.max_chars)
+        # 只有标点或空白时没有可朗读的内容，不请求合成服务
+        if not pieces:
+            return
+        if len(pieces) == 1:
+            async for data in self._stream_limited(pieces[0], voice):
+                yield data
+            return
+
+        # 各段同时开始合成（受并发上限约束），按顺序输出：第一段边合成边输出，后面的段先缓冲
+        self.split_texts += 1
+        queues = [asyncio.Queue() for _ in pieces]
+
+        async def fill(index: int, piece: str, queue: asyncio.Queue):
+            try:
+                stream = self._stream_limited(piece, voice)
+                if index > 0:
+                    stream = _strip_id3(stream)
+                async for data in stream:
+                    queue.put_nowait(data)
+                queue.put_nowait(None)
+            except Exception as e:
+                queue.put_nowait(e)
+
+        tasks = [
+            asyncio.create_task(fill(index, piece, queue))
+            for index, (piece, queue) in enumerate(zip(pieces, queues))
+        ]
+        try:
+            for queue in queues:
+                while True:
+                    data = await queue.get()
+                    if data is None:
+                        break
+                    if isinstance(data, Exception):
+                        raise data
+                    yield data
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def synthesize(self, text: str, voice: Optional[str] = None) -> bytes:
+        """合成完整的音频"""
+        audio_buffer = bytearray()
+        async for data in self.stream(text, voice):
+            audio_buffer.extend(data)
+        return bytes(audio_buffer)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "voices": list(self.voices),
+            "default_voice": self.default_voice,
+            "formats": list(self.formats),
+            "max_chars": self.max_chars,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "split_texts": self.split_texts,
+        }
+
+
+class EdgeTTSProvider(StreamingTTSProvider):
+    """edge-tts，音频通过 Communicate.stream() 增量返回；也可以直接使用任意edge-tts音色短名称"""
+
+    name = "edge_tts"
+    voices = {
+        "默认音色": EDGE_TTS_VOICE,
+        "晓晓": "zh-CN-XiaoxiaoNeural",
+        "晓伊": "zh-CN-XiaoyiNeural",
+        "云希": "zh-CN-YunxiNeural",
+        "云健": "zh-CN-YunjianNeural",
+        "云扬": "zh-CN-YunyangNeural",
+    }
+    default_voice = EDGE_TTS_VOICE
+    max_chars = 300
+    max_concurrency = 4
+
+    def accepts_voice(self, voice: str) -> bool:
+        return bool(_EDGE_VOICE_PATTERN.match(voice))
+
+    async def _stream_request(self, text: str, voice: Optional[str]) -> AsyncIterator[bytes]:
+        communicate = edge_tts.Communicate(text, voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+
+class SiliconFlowTTSProvider(StreamingTTSProvider):
+    """SiliconFlow /audio/speech（CosyVoice），以流式方式读取响应体"""
+
+    name = "cosyvoice"
+    voices = {
+        "默认音色": "FunAudioLLM/CosyVoice2-0.5B:anna",
+        "妖娆女声": "speech:zh_7:cm03s5czm00m4d2xjtvw24a1z:ipzlwiaetyssioaftrpl",
+        "马斯克": "speech:elon_musk:cm03s5czm00m4d2xjtvw24a1z:lztzzdlgyxuvrmmlnpvv",
+        "可爱女声": "speech:cute_girl_2:cm03s5czm00m4d2xjtvw24a1z:aueuxmukjlhnyjdamduq",
+    }
+    default_voice = "FunAudioLLM/CosyVoice2-0.5B:anna"
+    formats = ("mp3", "opus", "wav", "pcm")
+    max_chars = 200
+    max_concurrency = 3
+
+    def __init__(self, text2voice=None, **kwargs):
+        super().__init__(**kwargs)
+        if text2voice is None:
+            from text2voice import TextToVoice
+
+            text2voice = TextToVoice()
+        self.text2voice = text2voice
+
+    async def _stream_request(self, text: str, voice: Optional[str]) -> AsyncIterator[bytes]:
+        async for data in self.text2voice.stream_async(text, voice):
+            yield data
+
+
+_PROVIDERS: Dict[str, Callable[..., StreamingTTSProvider]] = {
+    "edge_tts": EdgeTTSProvider,
+    "cosyvoice": SiliconFlowTTSProvider,
+}
+
+
+def register_tts_provider(name: str, factory: Callable[..., StreamingTTSProvider]):
+    """
+    注册新的语音合成服务（如本地合成引擎）
+
+    Args:
+        name (str): 服务名称，对应TTS_SERVICE配置
+        factory: 无必需参数的构造函数，返回 StreamingTTSProvider
+    """
+    _PROVIDERS[name] = factory
+
+
+def create_tts_provider(name: str, **kwargs) -> StreamingTTSProvider:
+    """
+    按TTS_SERVICE配置创建语音合成服务
+
+    Raises:
+        ValueError: 未知的服务名称
+    """
+    if name not in _PROVIDERS:
+        raise ValueError(f"不支持的语音合成服务: {name}（可选: {', '.join(_PROVIDERS)}）")
+    return _PROVIDERS[name](**kwargs)
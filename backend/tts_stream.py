@@ -0,0 +1,259 @@
+import logging
+import os
+import re
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 句末标点（中英文），遇到即可切分
+SENTENCE_END_CHARS = "。！？；…!?;\n"
+# 句中停顿标点，仅在缓冲区过长时作为切分点
+SOFT_BREAK_CHARS = "，、：,:"
+
+# 过短的句子会与后续句子合并，避免生成大量零碎音频
+SENTENCE_MIN_CHARS = int(os.environ.get("TTS_STREAM_MIN_CHARS", "6"))
+# 缓冲区超过该长度时在停顿标点处强制切分，降低首段音频延迟
+SENTENCE_MAX_CHARS = int(os.environ.get("TTS_STREAM_MAX_CHARS", "80"))
+# 同时进行的分句合成任务数
+TTS_STREAM_CONCURRENCY = int(os.environ.get("TTS_STREAM_CONCURRENCY", "3"))
+
+_SPEAKABLE_PATTERN = re.compile(r"\w")
+
+
+def _is_speakable(text: str) -> bool:
+    """判断文本是否包含可朗读的字符（过滤纯标点、markdown分隔线等）"""
+    return bool(_SPEAKABLE_PATTERN.search(text))
+
+
+def _last_break(text: str, end: int, min_pos: int, chars: str, period: bool = False) -> int:
+    """
+    在text[min_pos:end]中寻找最后一个切分点
+
+    Returns:
+        int: 切分点（标点之后的位置），没有则返回-1
+    """
+    for i in range(end - 1, min_pos - 1, -1):
+        char = text[i]
+        if char in chars:
+            return i + 1
+        # 英文句号后面跟着空白才算句末
+        if period and char == "." and i + 1 < len(text) and text[i + 1].isspace():
+            return i + 1
+    return -1
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    把完整的长文本切分为不超过max_chars的片段，用于分段并行合成
+
+    优先在句末标点处切分，其次是停顿标点和空白，都没有时直接按长度切分。
+    切分点不早于max_chars的1/3，避免产生过短的片段。
+
+    Args:
+        text (str): 要切分的文本
+        max_chars (int): 每个片段的最大字符数，不大于0时不切分
+
+    Returns:
+        List[str]: 可朗读的文本片段
+    """
+    text = text.strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text] if _is_speakable(text) else []
+    pieces = []
+    min_pos = max(1, max_chars // 3)
+    while len(text) > max_chars:
+        end = _last_break(text, max_chars, min_pos, SENTENCE_END_CHARS, period=True)
+        if end == -1:
+            end = _last_break(text, max_chars, min_pos, SOFT_BREAK_CHARS + " ")
+        if end == -1:
+            end = max_chars
+        pieces.append(text[:end].strip())
+        text = text[end:].strip()
+    pieces.append(text)
+    return [piece for piece in pieces if _is_speakable(piece)]
+
+
+class SentenceSplitter:
+    """
+    将流式到达的文本按句子边界切分
+
+    中文标点直接作为句末；英文句号只有在后面跟着空白时才算句末，
+    以免把小数、网址、缩写等切断。
+    """
+
+    def __init__(
+        self,
+        min_chars: int = SENTENCE_MIN_CHARS,
+        max_chars: int = SENTENCE_MAX_CHARS,
+    ):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def _find_boundary(self, start: int) -> int:
+        """返回从start开始第一个句子边界之后的位置，没有则返回-1"""
+        for i in range(start, len(self.buffer)):
+            char = self.buffer[i]
+            if char in SENTENCE_END_CHARS:
+                # 连续的结束标点（如"？！"、"……"）归入同一句
+                end = i + 1
+                while end < len(self.buffer) and self.buffer[end] in SENTENCE_END_CHARS:
+                    end += 1
+                return end
+            if char == ".":
+                # 英文句号需要看到后一个字符才能判断
+                if i + 1 < len(self.buffer) and self.buffer[i + 1].isspace():
+                    return i + 1
+        return -1
+
+    def _find_soft_break(self) -> int:
+        """在缓冲区内寻找最后一个停顿标点"""
+        for i in range(len(self.buffer) - 1, self.min_chars - 1, -1):
+            if self.buffer[i] in SOFT_BREAK_CHARS:
+                return i + 1
+        return -1
+
+    def feed(self, text: str) -> List[str]:
+        """
+        追加一段文本，返回已经完整的句子列表
+
+        Args:
+            text (str): 新到达的文本片段
+
+        Returns:
+            List[str]: 可以送去合成的句子
+        """
+        self.buffer += text
+        sentences = []
+        search_from = 0
+        while True:
+            end = self._find_boundary(search_from)
+            if end == -1:
+                break
+            if len(self.buffer[:end].strip()) < self.min_chars:
+                # 句子太短，继续向后找下一个边界与之合并
+                search_from = end
+                continue
+            sentences.append(self.buffer[:end].strip())
+            self.buffer = self.buffer[end:]
+            search_from = 0
+
+        if len(self.buffer) >= self.max_chars:
+            end = self._find_soft_break()
+            if end == -1:
+                end = len(self.buffer)
+            sentences.append(self.buffer[:end].strip())
+            self.buffer = self.buffer[end:]
+
+        return [s for s in sentences if _is_speakable(s)]
+
+    def flush(self) -> Optional[str]:
+        """取出缓冲区中剩余的文本（流结束时调用）"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        if rest and _is_speakable(rest):
+            return rest
+        return None
+
+
+class IncrementalTTS:
+    """
+    分句增量语音合成
+
+    文本一边到达一边切分成句子，每个句子立即提交合成任务并发执行，
+    结果按句子顺序以带序号的 audio_chunk 事件输出。
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str, Optional[str]], Awaitable[Dict]],
+        voice: str = None,
+        max_concurrency: int = TTS_STREAM_CONCURRENCY,
+    ):
+        """
+        Args:
+            synthesize: 语音合成函数，参数为(文本, 音色)，返回音频字段（如 {"content": base64音频}）
+            voice (str, optional): 音色
+            max_concurrency (int): 同时进行的合成任务数
+        """
+        self._synthesize = synthesize
+        self.voice = voice
+        self._splitter = SentenceSplitter()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: Deque[Tuple[int, str, asyncio.Task]] = deque()
+        self._next_seq = 0
+        self.emitted = 0
+
+    async def _run(self, sentence: str) -> Dict:
+        async with self._semaphore:
+            return await self._synthesize(sentence, self.voice)
+
+    def _schedule(self, sentence: str):
+        task = asyncio.create_task(self._run(sentence))
+        self._pending.append((self._next_seq, sentence, task))
+        self._next_seq += 1
+
+    def feed(self, text: str):
+        """送入新的回复文本（不能包含思考内容）"""
+        for sentence in self._splitter.feed(text):
+            self._schedule(sentence)
+
+    def finish(self):
+        """文本流结束，把剩余文本作为最后一句提交"""
+        rest = self._splitter.flush()
+        if rest:
+            self._schedule(rest)
+
+    def _build_event(self, seq: int, sentence: str, task: asyncio.Task) -> Optional[Dict]:
+        try:
+            audio_payload = task.result()
+        except Exception as e:
+            logger.warning(f"分句语音合成失败(seq={seq}): {str(e)}")
+            return None
+        self.emitted += 1
+        return {
+            "type": "audio_chunk",
+            "seq": seq,
+            "text": sentence,
+            **audio_payload,
+        }
+
+    def ready_chunks(self) -> List[Dict]:
+        """非阻塞地取出队首已经完成的音频片段，保证顺序"""
+        events = []
+        while self._pending and self._pending[0][2].done():
+            seq, sentence, task = self._pending.popleft()
+            event = self._build_event(seq, sentence, task)
+            if event:
+                events.append(event)
+        return events
+
+    async def drain(self):
+        """按顺序等待所有剩余的合成任务并逐个输出"""
+        while self._pending:
+            seq, sentence, task = self._pending[0]
+            await asyncio.wait({task})
+            self._pending.popleft()
+            event = self._build_event(seq, sentence, task)
+            if event:
+                yield event
+
+    def cancel(self) -> Tuple[int, int]:
+        """
+        取消所有尚未完成的合成任务
+
+        Returns:
+            Tuple[int, int]: (被取消的合成任务数, 因此没有合成的字符数，包括尚未成句的缓冲文本)
+        """
+        cancelled_tasks = 0
+        skipped_chars = len(self._splitter.buffer.strip())
+        self._splitter.buffer = ""
+        while self._pending:
+            _, sentence, task = self._pending.popleft()
+            if not task.done():
+                task.cancel()
+                cancelled_tasks += 1
+                skipped_chars += len(sentence)
+        return cancelled_tasks, skipped_chars
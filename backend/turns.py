@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+
+class TurnCancelled(Exception):
+    """当前轮次已被取消"""
+
+
+class Turn:
+    """
+    一轮对话（一次回复生成）
+
+    持有取消信号；LLM流和语音合成通过 guard / wait 等待，取消时直接取消正在等待的任务，
+    立即停止等待，不必等到下一个token或合成结果到达。
+    """
+
+    def __init__(self, turn_id: str):
+        self.turn_id = turn_id
+        self.created_at = time.monotonic()
+        self.reason: Optional[str] = None
+        self._event = asyncio.Event()
+        # 正在 wait / guard 中等待的任务，以及被本轮次取消的任务
+        self._waiting: Set[asyncio.Task] = set()
+        self._interrupted: Set[asyncio.Task] = set()
+        # 推测执行的轮次：用户输入在最终识别结果确认后才生效
+        self._confirmation: Optional[asyncio.Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "api") -> bool:
+        """发出取消信号，返回是否是首次取消"""
+        if self._event.is_set():
+            return False
+        self.reason = reason
+        self._event.set()
+        # 直接取消正在等待LLM增量或语音合成的任务，不必等到下一个token到达
+        for task in self._waiting:
+            if task not in self._interrupted:
+                self._interrupted.add(task)
+                task.cancel()
+        if self._confirmation is not None and not self._confirmation.done():
+            self._confirmation.set_result(None)
+        return True
+
+    def speculate(self):
+        """标记为推测执行：回复基于中间识别结果提前开始，需要 confirm 后才写入会话历史"""
+        self._confirmation = asyncio.get_running_loop().create_future()
+
+    @property
+    def speculative(self) -> bool:
+        return self._confirmation is not None
+
+    def confirm(self, text: str):
+        """推测命中，以最终识别文本作为本轮的用户输入"""
+        if self._confirmation is not None and not self._confirmation.done():
+            self._confirmation.set_result(text)
+
+    async def confirmed_input(self, text: str) -> Optional[str]:
+        """
+        本轮最终生效的用户输入
+
+        普通轮次直接返回text；推测执行的轮次等待确认，未命中（轮次被取消）时返回None
+        """
+        if self._confirmation is None:
+            return text
+        return await self._confirmation
+
+    async def wait(self, awaitable: Awaitable[T]) -> T:
+        """
+        等待awaitable完成，期间如果轮次被取消则取消它并抛出TurnCancelled
+
+        直接在当前任务中等待，不额外创建任务：cancel 会直接取消正在这里等待的任务，
+        取消异常在这里转换为TurnCancelled，调用方的清理代码照常执行。
+
+        Raises:
+            TurnCancelled: 轮次已被取消
+        """
+        if self.cancelled:
+            close = getattr(awaitable, "close", None)
+            if close:
+                close()
+            raise TurnCancelled()
+        task = asyncio.current_task()
+        self._waiting.add(task)
+        try:
+            result = await awaitable
+        except asyncio.CancelledError:
+            if task not in self._interrupted:
+                raise
+            self._interrupted.discard(task)
+            # 撤销本轮次发出的取消；任务同时被外部取消（客户端断开）时仍按取消处理
+            if task.uncancel() > 0:
+                raise
+            raise TurnCancelled() from None
+        finally:
+            self._waiting.discard(task)
+        if task in self._interrupted:
+            # 等待的对象自行处理了取消并正常返回
+            self._interrupted.discard(task)
+            task.uncancel()
+            raise TurnCancelled()
+        return result
+
+    async def guard(self, iterable: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        逐项转发异步迭代器，轮次被取消时立即结束
+
+        每项之间只检查取消标志，不为每一项创建等待任务。
+
+        Raises:
+            TurnCancelled: 轮次已被取消
+        """
+        iterator = iterable.__aiter__()
+        while True:
+            try:
+                item = await self.wait(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+
+
+class TurnRegistry:
+    """
+    进行中轮次的注册表
+
+    通过轮次ID取消回复生成，并统计取消原因和节省下来的工作量。
+    """
+
+    def __init__(self):
+        self._turns: Dict[str, Turn] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled: Counter = Counter()
+        self.saved: Counter = Counter()
+
+    def start(self) -> Turn:
+        turn = Turn(uuid.uuid4().hex)
+        self._turns[turn.turn_id] = turn
+        with self._lock:
+            self.started += 1
+        return turn
+
+    def get(self, turn_id: str) -> Optional[Turn]:
+        return self._turns.get(turn_id)
+
+    def cancel(self, turn_id: str, reason: str = "api") -> bool:
+        """取消指定轮次，轮次不存在或已结束时返回False"""
+        turn = self._turns.get(turn_id)
+        if turn is None:
+            return False
+        return turn.cancel(reason)
+
+    def finish(self, turn: Turn, completed: bool):
+        """
+        轮次结束
+
+        Args:
+            turn (Turn): 结束的轮次
+            completed (bool): 是否正常完成；未完成且没有收到取消信号的视为客户端断开
+        """
+        if self._turns.pop(turn.turn_id, None) is None:
+            # 已经结束过
+            return
+        with self._lock:
+            # 生成完毕但随后被取消的轮次（如未命中的推测执行）按取消统计
+            if completed and not turn.cancelled:
+                self.completed += 1
+            else:
+                self.cancelled[turn.reason or "disconnect"] += 1
+
+    def record_saved(self, **counts: int):
+        """记录因取消而节省的工作量，如关闭的上游流、取消的合成任务和少合成的字符数"""
+        with self._lock:
+            for name, count in counts.items():
+                if count:
+                    self.saved[name] += count
+
+    def __len__(self):
+        return len(self._turns)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": len(self._turns),
+                "started": self.started,
+                "completed": self.completed,
+                "cancelled": dict(self.cancelled),
+                "saved": dict(self.saved),
+            }
@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from audio_utils import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# 是否在语音识别前进行语音活动检测
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "true").lower() == "true"
+# 检测后端: "energy"（能量+过零率，纯NumPy）或 "webrtc"（需安装webrtcvad）
+VAD_BACKEND = os.environ.get("VAD_BACKEND", "energy")
+# 分帧长度（毫秒）
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", "30"))
+# 语音帧能量需高出噪声底多少dB
+VAD_ENERGY_MARGIN_DB = float(os.environ.get("VAD_ENERGY_MARGIN_DB", "10"))
+# 能量阈值的上下限（dBFS）；能量低于下限的帧一定视为静音
+VAD_MIN_THRESHOLD_DB = float(os.environ.get("VAD_MIN_THRESHOLD_DB", "-55"))
+VAD_MAX_THRESHOLD_DB = float(os.environ.get("VAD_MAX_THRESHOLD_DB", "-35"))
+# 过零率高于该值的中等能量帧视为清辅音
+VAD_ZCR_THRESHOLD = float(os.environ.get("VAD_ZCR_THRESHOLD", "0.3"))
+# 语音段前后保留的静音（毫秒）
+VAD_PADDING_MS = int(os.environ.get("VAD_PADDING_MS", "200"))
+# 总语音时长低于该值（毫秒）视为空录音
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", "250"))
+# 单个识别片段的最长时长（秒），超过时在最安静处切分，各片段可以并行识别
+VAD_MAX_SEGMENT_S = float(os.environ.get("VAD_MAX_SEGMENT_S", "30"))
+
+Segment = Tuple[int, int]
+
+
+def frame_signal(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """把音频切成不重叠的帧，返回形状为 (帧数, 帧长) 的视图"""
+    count = len(samples) // frame_length
+    return samples[: count * frame_length].reshape(count, frame_length)
+
+
+def frame_energy_db(frames: np.ndarray) -> np.ndarray:
+    return 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+
+class EnergyVAD:
+    """基于短时能量和过零率的语音活动检测，全部为向量化计算"""
+
+    def __init__(self, frame_ms: int = VAD_FRAME_MS):
+        self.frame_length = SAMPLE_RATE * frame_ms // 1000
+
+    def speech_frames(self, samples: np.ndarray) -> np.ndarray:
+        frames = frame_signal(samples, self.frame_length)
+        if len(frames) == 0:
+            return np.zeros(0, dtype=bool)
+        energy = frame_energy_db(frames)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        # 以能量最低的10%帧估计噪声底，阈值随录音环境自适应
+        noise_floor, loud = np.percentile(energy, [10, 90])
+        if loud - noise_floor < VAD_ENERGY_MARGIN_DB:
+            # 能量分布很窄（几乎没有静音，或全程静音）：估计的"噪声底"可能就是语音本身，
+            # 不做自适应，只按绝对下限判断，避免把全程小声说话的录音当成空录音
+            threshold = VAD_MIN_THRESHOLD_DB
+        else:
+            threshold = np.clip(
+                noise_floor + VAD_ENERGY_MARGIN_DB, VAD_MIN_THRESHOLD_DB, VAD_MAX_THRESHOLD_DB
+            )
+        voiced = energy > threshold
+        unvoiced = (energy > threshold - 6) & (zcr > VAD_ZCR_THRESHOLD)
+        return voiced | unvoiced
+
+
+class WebRTCVAD:
+    """基于webrtcvad的语音活动检测（可选依赖）"""
+
+    def __init__(self, frame_ms: int = VAD_FRAME_MS, mode: int = 2):
+        import webrtcvad
+
+        if frame_ms not in (10, 20, 30):
+            frame_ms = 30
+        self.frame_length = SAMPLE_RATE * frame_ms // 1000
+        self._vad = webrtcvad.Vad(mode)
+        self._lock = threading.Lock()
+
+    def speech_frames(self, samples: np.ndarray) -> np.ndarray:
+        frames = frame_signal(samples, self.frame_length)
+        pcm = (np.clip(frames, -1, 1) * 32767).astype(np.int16)
+        with self._lock:
+            return np.array(
+                [self._vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm],
+                dtype=bool,
+            )
+
+
+_BACKENDS: Dict[str, Callable[[], Any]] = {
+    "energy": EnergyVAD,
+    "webrtc": WebRTCVAD,
+}
+
+
+def register_vad_backend(name: str, factory: Callable[[], Any]):
+    """
+    注册新的检测后端
+
+    Args:
+        name (str): 后端名称，对应VAD_BACKEND配置
+        factory: 创建后端的函数，返回的对象需提供 frame_length 属性和
+            speech_frames(samples) -> np.ndarray[bool] 方法
+    """
+    _BACKENDS[name] = factory
+
+
+class VoiceActivityDetector:
+    """
+    识别前的语音活动检测
+
+    去掉首尾静音，拒绝没有语音的录音，并把过长的录音切分成可以并行识别的片段。
+    """
+
+    def __init__(self, backend: str = VAD_BACKEND, enabled: bool = VAD_ENABLED):
+        self.enabled = enabled
+        self.backend_name = backend
+        self._backend = None
+        if enabled:
+            try:
+                self._backend = _BACKENDS[backend]()
+            except (KeyError, ImportError) as e:
+                logger.warning(f"语音活动检测后端 {backend} 不可用({str(e)})，使用energy后端")
+                self.backend_name = "energy"
+                self._backend = EnergyVAD()
+
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.rejected_empty = 0
+        self.input_seconds = 0.0
+        self.kept_seconds = 0.0
+        self.segments = 0
+
+    def _speech_regions(self, speech: np.ndarray) -> List[Segment]:
+        """把逐帧结果转换为带前后缓冲的语音区间（单位：帧）"""
+        padding = max(1, VAD_PADDING_MS // VAD_FRAME_MS)
+        # 用卷积把每个语音帧向两侧扩展padding帧，同时填平短暂的停顿
+        padded = np.convolve(speech.astype(np.int32), np.ones(2 * padding + 1, dtype=np.int32), "same") > 0
+        edges = np.diff(np.concatenate(([0], padded.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def _split_long(self, samples: np.ndarray, start: int, end: int, frame_length: int) -> List[Segment]:
+        """按最长时长切分，切分点选在窗口后段能量最低的帧"""
+        max_length = int(VAD_MAX_SEGMENT_S * SAMPLE_RATE)
+        pieces = []
+        while end - start > max_length:
+            search_from = start + max_length * 2 // 3
+            window = samples[search_from:start + max_length]
+            frames = frame_signal(window, frame_length)
+            if len(frames):
+                cut = search_from + int(np.argmin(frame_energy_db(frames))) * frame_length
+            else:
+                cut = start + max_length
+            pieces.append((start, cut))
+            start = cut
+        pieces.append((start, end))
+        return pieces
+
+    def split(self, samples: np.ndarray) -> List[np.ndarray]:
+        """
+        检测语音并返回需要识别的片段
+
+        Args:
+            samples (np.ndarray): 16kHz float32音频
+
+        Returns:
+            List[np.ndarray]: 去除首尾静音后的语音片段；没有语音时返回空列表
+        """
+        if not self.enabled:
+            return [samples]
+
+        frame_length = self._backend.frame_length
+        speech = self._backend.speech_frames(samples)
+        min_frames = VAD_MIN_SPEECH_MS * SAMPLE_RATE // 1000 // frame_length
+        regions = self._speech_regions(speech) if speech.sum() >= max(1, min_frames) else []
+
+        # 相邻区间在不超过最长时长的前提下合并，保留上下文，减少片段数
+        max_length = int(VAD_MAX_SEGMENT_S * SAMPLE_RATE)
+        merged: List[Segment] = []
+        for start_frame, end_frame in regions:
+            start = start_frame * frame_length
+            end = min(len(samples), end_frame * frame_length)
+            if merged and end - merged[-1][0] <= max_length:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+
+        segments: List[Segment] = []
+        for start, end in merged:
+            segments.extend(self._split_long(samples, start, end, frame_length))
+
+        kept = sum(end - start for start, end in segments)
+        with self._lock:
+            self.processed += 1
+            self.input_seconds += len(samples) / SAMPLE_RATE
+            self.kept_seconds += kept / SAMPLE_RATE
+            self.segments += len(segments)
+            if not segments:
+                self.rejected_empty += 1
+        return [samples[start:end] for start, end in segments]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend_name,
+                "processed": self.processed,
+                "rejected_empty": self.rejected_empty,
+                "segments": self.segments,
+                "input_seconds": round(self.input_seconds, 2),
+                "kept_seconds": round(self.kept_seconds, 2),
+                # 没有送入模型的音频时长，即节省的解码时长
+                "trimmed_seconds": round(self.input_seconds - self.kept_seconds, 2),
+            }
@@ -0,0 +1,430 @@
+import logging
+import os
+import json
+import uuid
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+
+from audio_utils import SAMPLE_RATE, decode_audio, resample
+from sse_events import StreamEvent, coalesce_text
+from speculation import (
+    Speculation,
+    SPECULATIVE_LLM,
+    SPECULATIVE_STABLE_PARTIALS,
+    normalize_transcript,
+)
+
+logger = logging.getLogger(__name__)
+
+# 两次中间识别之间至少新增多少毫秒的音频
+WS_PARTIAL_INTERVAL_MS = float(os.environ.get("WS_PARTIAL_INTERVAL_MS", "800"))
+# 中间识别使用的滚动窗口长度（秒），只识别最近这段音频
+WS_PARTIAL_WINDOW_S = float(os.environ.get("WS_PARTIAL_WINDOW_S", "15"))
+# 检测到说话后，持续静音多少毫秒视为一句话结束（0表示只由客户端发送end）
+WS_ENDPOINT_SILENCE_MS = float(os.environ.get("WS_ENDPOINT_SILENCE_MS", "0"))
+# 静音判定的能量阈值（RMS）
+WS_SILENCE_RMS = float(os.environ.get("WS_SILENCE_RMS", "0.01"))
+# 单句话最长时长（秒），超过后自动结束
+WS_MAX_UTTERANCE_S = float(os.environ.get("WS_MAX_UTTERANCE_S", "60"))
+# 压缩音频（format为encoded）按此码率（kbps）把单句最长时长换算为缓冲字节上限
+WS_MAX_ENCODED_KBPS = float(os.environ.get("WS_MAX_ENCODED_KBPS", "128"))
+# 用户在回复过程中说出新的一句话时，是否打断并取消当前回复
+WS_BARGE_IN = os.environ.get("WS_BARGE_IN", "true").lower() == "true"
+
+
+class VoiceSession:
+    """
+    全双工语音会话
+
+    客户端协议（文本消息为JSON，音频为二进制消息）：
+    - {"type": "start", ...配置}: 设置采样率、音频格式、会话ID、历史、提示词、音色、模型等，可随时更新
+    - 二进制消息: "pcm16" 格式为16bit小端单声道PCM；"encoded" 格式为WebM/Opus等容器数据
+    - {"type": "end"}: 一句话结束，开始最终识别和回复
+    - {"type": "reset"}: 丢弃当前已接收的音频
+    - {"type": "cancel"}: 取消正在进行的回复
+
+    服务端消息：
+    - {"type": "ready"} / {"type": "partial", "text"} / {"type": "final", "text"}
+    - 与 /api/chat/stream 相同的 turn / text / cancelled 事件
+    - {"type": "audio" | "audio_chunk", "format", "size", ...} 之后紧跟一条包含音频字节的二进制消息
+    - {"type": "done"} / {"type": "error", "error"}
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        transcribe: Callable[[np.ndarray], Awaitable[Dict[str, Any]]],
+        respond: Callable[..., AsyncIterator[StreamEvent]],
+        audio_store,
+        turns,
+        speculation_stats=None,
+    ):
+        """
+        Args:
+            websocket (WebSocket): 已建立的连接
+            transcribe: 语音识别函数（含语音活动检测），参数为16kHz float32音频
+            respond: 生成回复事件流的函数，与 generate_response_stream 参数一致
+            audio_store: 音频暂存区，用于取出回复音频的二进制数据
+            turns: 轮次注册表，新的一句话打断回复时用于取消上一轮
+            speculation_stats: 推测执行统计（SpeculationStats），为空时不启用推测执行
+        """
+        self.websocket = websocket
+        self.transcribe = transcribe
+        self.respond = respond
+        self.audio_store = audio_store
+        self.turns = turns
+        self.speculation_stats = speculation_stats
+
+        self.config: Dict[str, Any] = {
+            "sampleRate": SAMPLE_RATE,
+            "format": "pcm16",
+            # 对话历史保存在服务端会话中，history只在会话不存在时用于初始化
+            "sessionId": uuid.uuid4().hex,
+            "history": [],
+            "systemPrompt": "你是一个友好的AI助手。",
+            "voice": None,
+            "model": "DeepSeek-V3",
+            "enableVoiceResponse": True,
+            "streamAudio": True,
+            # 回复音频格式（"mp3"、"opus"、"webm" 或候选列表），为空时使用服务端默认
+            "audioFormat": None,
+        }
+
+        self._send_lock = asyncio.Lock()
+        self._pcm_chunks: List[np.ndarray] = []
+        self._encoded = bytearray()
+        self._samples = 0
+        # 压缩音频最近一次解码得到的采样数
+        self._decoded_samples = 0
+        self._samples_at_last_partial = 0
+        self._partial_task: Optional[asyncio.Task] = None
+        self._turn_task: Optional[asyncio.Task] = None
+        self._turn = None
+        self._heard_speech = False
+        self._silence_samples = 0
+        # 推测执行：连续相同的中间识别结果（归一化后）及其次数
+        self._speculation: Optional[Speculation] = None
+        self._last_partial = ""
+        self._stable_partials = 0
+
+    async def _send_json(self, message: Dict[str, Any]):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message, ensure_ascii=False))
+
+    async def _send_event(self, event: StreamEvent):
+        """发送回复事件，直接使用事件已经序列化好的JSON"""
+        async with self._send_lock:
+            await self.websocket.send_text(event.data)
+
+    async def _send_audio(self, header: Dict[str, Any], audio_content: bytes):
+        """发送音频描述和紧随其后的二进制音频，保证两条消息之间不会插入其他消息"""
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(header, ensure_ascii=False))
+            await self.websocket.send_bytes(audio_content)
+
+    async def _current_audio(self, window_s: Optional[float] = None) -> np.ndarray:
+        """取出当前缓冲的音频（16kHz float32），可以只取最近window_s秒"""
+        if self.config["format"] == "encoded":
+            if not self._encoded:
+                return np.zeros(0, dtype=np.float32)
+            samples = await asyncio.to_thread(decode_audio, bytes(self._encoded))
+            self._decoded_samples = len(samples)
+        else:
+            if not self._pcm_chunks:
+                return np.zeros(0, dtype=np.float32)
+            if len(self._pcm_chunks) > 1:
+                self._pcm_chunks = [np.concatenate(self._pcm_chunks)]
+            samples = self._pcm_chunks[0]
+        if window_s:
+            samples = samples[-int(window_s * SAMPLE_RATE):]
+        return samples
+
+    def _reset_audio(self):
+        self._pcm_chunks = []
+        self._encoded = bytearray()
+        self._samples = 0
+        self._decoded_samples = 0
+        self._samples_at_last_partial = 0
+        self._heard_speech = False
+        self._silence_samples = 0
+        self._last_partial = ""
+        self._stable_partials = 0
+
+    def _append_audio(self, data: bytes) -> bool:
+        """追加一帧音频，返回是否检测到一句话结束"""
+        if self.config["format"] == "encoded":
+            self._encoded.extend(data)
+            # 压缩音频无法逐帧计算能量，只按接收次数推进中间识别
+            self._samples += int(SAMPLE_RATE * WS_PARTIAL_INTERVAL_MS / 1000)
+            # 同样限制单句长度：按字节数和最近一次解码出的实际时长判断，
+            # 否则缓冲无限增长，每次中间识别重新解码整段音频的开销也越来越大
+            return (
+                len(self._encoded) > WS_MAX_UTTERANCE_S * WS_MAX_ENCODED_KBPS * 125
+                or self._decoded_samples > WS_MAX_UTTERANCE_S * SAMPLE_RATE
+            )
+
+        frame = np.frombuffer(data[: len(data) // 2 * 2], np.int16).astype(np.float32) / 32768.0
+        frame = resample(frame, int(self.config["sampleRate"]))
+        self._pcm_chunks.append(frame)
+        self._samples += len(frame)
+
+        if self._samples > WS_MAX_UTTERANCE_S * SAMPLE_RATE:
+            return True
+        if len(frame) == 0:
+            return False
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        if rms >= WS_SILENCE_RMS:
+            if not self._heard_speech:
+                self._on_speech_onset()
+            self._heard_speech = True
+            self._silence_samples = 0
+        elif self._heard_speech:
+            self._silence_samples += len(frame)
+        if WS_ENDPOINT_SILENCE_MS <= 0:
+            return False
+        return self._heard_speech and (
+            self._silence_samples >= WS_ENDPOINT_SILENCE_MS * SAMPLE_RATE / 1000
+        )
+
+    def _on_speech_onset(self):
+        """用户开始说话：打断正在播放的回复，而不是等到这句话说完、识别完成之后"""
+        if WS_BARGE_IN:
+            self._cancel_turn("barge_in")
+
+    async def _run_partial(self):
+        """对最近的音频做一次中间识别"""
+        try:
+            samples = await self._current_audio(WS_PARTIAL_WINDOW_S)
+            if len(samples) == 0:
+                return
+            result = await self.transcribe(samples)
+            if result and not result.get("error") and result.get("text"):
+                text = result["text"].strip()
+                # 压缩音频无法逐帧检测说话开始，以第一个中间识别结果作为说话开始
+                self._on_speech_onset()
+                await self._send_json({"type": "partial", "text": text})
+                # 只有滚动窗口覆盖整句话时，中间结果才可能与最终结果一致
+                if len(samples) < WS_PARTIAL_WINDOW_S * SAMPLE_RATE:
+                    self._observe_partial(text)
+        except Exception as e:
+            # 中间结果只是提示性的，识别繁忙或失败时直接跳过
+            logger.debug(f"中间识别跳过: {str(e)}")
+
+    def _observe_partial(self, text: str):
+        """根据新的中间识别结果开始或放弃推测执行"""
+        if not SPECULATIVE_LLM or self.speculation_stats is None:
+            return
+        normalized = normalize_transcript(text)
+        if self._speculation is not None:
+            if normalized != self._speculation.normalized:
+                # 用户还在继续说，推测所用的输入已经过时
+                self._discard_speculation("diverged")
+            else:
+                return
+        if normalized and normalized == self._last_partial:
+            self._stable_partials += 1
+        else:
+            self._last_partial = normalized
+            self._stable_partials = 1 if normalized else 0
+        if self._stable_partials < SPECULATIVE_STABLE_PARTIALS:
+            return
+        if self._turn_task and not self._turn_task.done():
+            # 上一轮回复还在进行，不提前开始
+            return
+        self._start_speculation(text, normalized)
+
+    def _start_speculation(self, text: str, normalized: str):
+        """以中间识别结果提前开始生成回复，事件缓冲到最终识别结果确认"""
+        turn = self.turns.start()
+        turn.speculate()
+        speculation = Speculation(text, normalized, turn)
+        speculation.start(coalesce_text(self._respond(text, turn)))
+        self._speculation = speculation
+        self.speculation_stats.record_start()
+        logger.debug(f"推测执行开始: {text}")
+
+    def _discard_speculation(self, reason: str):
+        """放弃推测执行：取消回复生成，释放已缓冲的音频"""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return
+        speculation.cancel()
+        for event in speculation.events:
+            if event.type in ("audio", "audio_chunk") and event.payload.get("audioId"):
+                self.audio_store.pop(event.payload["audioId"])
+        speculation.events.clear()
+        self.speculation_stats.record_miss(speculation, reason)
+        logger.debug(f"推测执行未命中({reason}): {speculation.text}")
+
+    def _maybe_start_partial(self):
+        new_samples = self._samples - self._samples_at_last_partial
+        if new_samples < WS_PARTIAL_INTERVAL_MS * SAMPLE_RATE / 1000:
+            return
+        if self._partial_task and not self._partial_task.done():
+            return
+        self._samples_at_last_partial = self._samples
+        self._partial_task = asyncio.create_task(self._run_partial())
+
+    async def _finish_utterance(self):
+        """一句话结束：最终识别，然后立即开始回复"""
+        if self._partial_task and not self._partial_task.done():
+            self._partial_task.cancel()
+        samples = await self._current_audio()
+        self._reset_audio()
+        if len(samples) == 0:
+            self._discard_speculation("no_final")
+            return
+
+        try:
+            result = await self.transcribe(samples)
+        except Exception as e:
+            # 识别繁忙或超时时通知客户端重说，会话保持
+            self._discard_speculation("no_final")
+            await self._send_json({"type": "error", "error": str(e)})
+            return
+        if result and result.get("no_speech"):
+            self._discard_speculation("no_final")
+            await self._send_json({"type": "error", "error": "未检测到语音"})
+            return
+        if not result or result.get("error") or not result.get("text", "").strip():
+            self._discard_speculation("no_final")
+            await self._send_json({"type": "error", "error": (result or {}).get("text", "语音识别失败")})
+            return
+        text_input = result["text"].strip()
+        await self._send_json({"type": "final", "text": text_input})
+
+        # 最终结果与推测所用的中间结果一致（只差标点或语气词）时沿用已经开始的回复
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None:
+            if normalize_transcript(text_input) == speculation.normalized and not speculation.turn.cancelled:
+                speculation.turn.confirm(text_input)
+                self.speculation_stats.record_hit(speculation)
+            else:
+                self._speculation = speculation
+                self._discard_speculation("mismatch")
+                speculation = None
+
+        if WS_BARGE_IN:
+            # 通常在说话开始时已经打断；没有检测到说话开始时（如压缩音频且没有中间结果）在这里打断
+            self._cancel_turn("barge_in")
+        self._turn = speculation.turn if speculation else self.turns.start()
+        self._turn_task = asyncio.create_task(
+            self._run_turn(text_input, self._turn, self._turn_task, speculation))
+
+    def _cancel_turn(self, reason: str):
+        """取消正在进行的回复（上游LLM流和未完成的语音合成会随之停止）"""
+        if self._turn_task and not self._turn_task.done() and self._turn is not None:
+            self._turn.cancel(reason)
+
+    def _respond(self, text_input: str, turn) -> AsyncIterator[StreamEvent]:
+        config = self.config
+        enable_voice = bool(config["enableVoiceResponse"])
+        return self.respond(
+            text_input,
+            config["history"],
+            config["systemPrompt"],
+            config["voice"] if enable_voice else None,
+            enable_voice,
+            config["model"],
+            config["streamAudio"],
+            "url",
+            turn=turn,
+            session_id=config["sessionId"],
+            audio_format=config["audioFormat"],
+        )
+
+    async def _run_turn(
+        self,
+        text_input: str,
+        turn,
+        previous: Optional[asyncio.Task] = None,
+        speculation: Optional[Speculation] = None,
+    ):
+        """调用LLM和TTS，把文本增量和音频推送回客户端；推测命中时发送已经提前生成的事件"""
+        try:
+            if previous and not previous.done():
+                # 上一轮回复还在进行（或正在取消），等它结束后再开始，保证历史顺序
+                await asyncio.wait({previous})
+            if speculation is not None:
+                events = speculation.replay()
+            else:
+                events = coalesce_text(self._respond(text_input, turn))
+            async for event in events:
+                data = event.payload
+                if event.event == "error":
+                    await self._send_json({"type": "error", **data})
+                    continue
+                if event.type in ("audio", "audio_chunk") and data.get("audioId"):
+                    entry = self.audio_store.pop(data["audioId"])
+                    if entry is None:
+                        continue
+                    # 边合成边写入的音频，等待合成完成后整段发送
+                    await entry.wait_complete()
+                    if entry.error:
+                        continue
+                    header = {k: v for k, v in data.items() if k not in ("url", "audioId", "streaming")}
+                    header["size"] = len(entry.data)
+                    await self._send_audio(header, bytes(entry.data))
+                    continue
+                await self._send_event(event)
+        finally:
+            # 回复还没开始就被取消时由这里结束轮次
+            if speculation is not None and not speculation.done:
+                speculation.cancel("disconnect")
+            self.turns.finish(turn, False)
+        await self._send_json({"type": "done"})
+
+    async def _handle_control(self, message: Dict[str, Any]):
+        message_type = message.get("type")
+        if message_type == "start":
+            for key in self.config:
+                if key in message:
+                    self.config[key] = message[key]
+            await self._send_json({"type": "ready"})
+        elif message_type == "end":
+            await self._finish_utterance()
+        elif message_type == "reset":
+            self._reset_audio()
+            self._discard_speculation("reset")
+        elif message_type == "cancel":
+            self._cancel_turn("api")
+        else:
+            await self._send_json({"type": "error", "error": f"未知的消息类型: {message_type}"})
+
+    async def run(self):
+        """会话主循环，直到客户端断开"""
+        await self.websocket.accept()
+        await self._send_json({"type": "ready"})
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    if self._append_audio(message["bytes"]):
+                        await self._finish_utterance()
+                    else:
+                        self._maybe_start_partial()
+                elif message.get("text") is not None:
+                    try:
+                        control = json.loads(message["text"])
+                    except json.JSONDecodeError:
+                        await self._send_json({"type": "error", "error": "无效的JSON消息"})
+                        continue
+                    await self._handle_control(control)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.exception(f"语音会话出错: {str(e)}")
+            try:
+                await self._send_json({"type": "error", "error": str(e)})
+            except Exception:
+                pass
+        finally:
+            self._discard_speculation("disconnect")
+            for task in (self._partial_task, self._turn_task):
+                if task and not task.done():
+                    task.cancel()
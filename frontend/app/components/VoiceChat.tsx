@@ -9,6 +9,7 @@ interface Message {
     content: string;
     timestamp: Date;
     audioData?: string; // 添加音频Base64数据字段
+    audioFormat?: string; // 音频数据的格式（mp3/opus/webm）
 }
 
 interface ChatMessage {
@@ -29,6 +30,41 @@ interface Conversation {
     updatedAt: Date;
 }
 
+// 回复音频格式对应的MIME类型
+const AUDIO_MIME_TYPES: Record<string, string> = {
+    mp3: 'audio/mpeg',
+    opus: 'audio/ogg',
+    webm: 'audio/webm',
+    wav: 'audio/wav',
+};
+
+// 录音格式：优先使用Opus编码，上传体积远小于WAV
+const RECORDING_MIME_TYPES = ['audio/webm;codecs=opus', 'audio/ogg;codecs=opus', 'audio/webm', 'audio/mp4'];
+
+const pickRecordingMimeType = (): string | undefined => {
+    if (typeof MediaRecorder === 'undefined' || !MediaRecorder.isTypeSupported) {
+        return undefined;
+    }
+    return RECORDING_MIME_TYPES.find(type => MediaRecorder.isTypeSupported(type));
+};
+
+// 按浏览器的播放能力协商回复音频格式，服务端按顺序选择第一个可用的格式
+const getPreferredAudioFormats = (): string => {
+    if (typeof document === 'undefined') {
+        return 'mp3';
+    }
+    const audio = document.createElement('audio');
+    const formats: string[] = [];
+    if (audio.canPlayType('audio/ogg; codecs="opus"')) {
+        formats.push('opus');
+    }
+    if (audio.canPlayType('audio/webm; codecs="opus"')) {
+        formats.push('webm');
+    }
+    formats.push('mp3');
+    return formats.join(',');
+};
+
 // 添加提示组件
 const HttpsWarning = ({ visible, onClose }: { visible: boolean, onClose: () => void }) => {
     if (!visible) return null;
@@ -81,6 +117,10 @@ export default function VoiceChat() {
     const [mobileHttpsWarning, setMobileHttpsWarning] = useState(false);
     // 添加输入框引用
     const inputRef = useRef<HTMLInputElement>(null);
+    // 正在进行的回复轮次ID，用于在用户打断时取消服务端的生成
+    const currentTurnId = useRef<string | null>(null);
+    // 本次页面加载中已经在服务端建立过的会话，之后的请求只需发送新消息
+    const syncedSessions = useRef<Set<string>>(new Set());
 
     // 添加对话管理状态
     const [conversations, setConversations] = useState<Conversation[]>([]);
@@ -295,9 +335,17 @@ export default function VoiceChat() {
         }
     };
 
+    // 删除服务端保存的会话历史
+    const dropServerSession = (conversationId: string) => {
+        syncedSessions.current.delete(conversationId);
+        fetch(`${getApiBaseUrl()}/api/sessions/${conversationId}`, { method: 'DELETE' })
+            .catch(error => console.warn('删除服务端会话失败:', error));
+    };
+
     // 删除对话
     const deleteConversation = (conversationId: string, e: React.MouseEvent) => {
         e.stopPropagation(); // 防止触发父元素的点击事件
+        dropServerSession(conversationId);
 
         const updatedConversations = conversations.filter(conv => conv.id !== conversationId);
         setConversations(updatedConversations);
@@ -316,6 +364,9 @@ export default function VoiceChat() {
     // 修改原有的清空历史记录函数
     const clearHistory = () => {
         setMessages([]);
+        if (activeConversationId) {
+            dropServerSession(activeConversationId);
+        }
         // 更新当前对话为空
         const updatedConversations = conversations.map(conv =>
             conv.id === activeConversationId
@@ -372,7 +423,17 @@ export default function VoiceChat() {
         };
     }, []);
 
+    // 取消正在进行的回复（用户开始新的输入时调用）
+    const cancelCurrentTurn = () => {
+        const turnId = currentTurnId.current;
+        if (!turnId) return;
+        currentTurnId.current = null;
+        fetch(`${getApiBaseUrl()}/api/chat/cancel/${turnId}`, { method: 'POST' })
+            .catch(error => console.warn('取消回复失败:', error));
+    };
+
     const startRecording = async () => {
+        cancelCurrentTurn();
         try {
             // 检查浏览器是否支持媒体设备
             if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
@@ -414,7 +475,10 @@ export default function VoiceChat() {
                     audio: audioConstraints
                 });
 
-                mediaRecorder.current = new MediaRecorder(stream);
+                const recordingMimeType = pickRecordingMimeType();
+                mediaRecorder.current = recordingMimeType
+                    ? new MediaRecorder(stream, { mimeType: recordingMimeType })
+                    : new MediaRecorder(stream);
                 audioChunks.current = [];
 
                 mediaRecorder.current.ondataavailable = (event) => {
@@ -425,7 +489,10 @@ export default function VoiceChat() {
 
                 mediaRecorder.current.onstop = async () => {
                     if (audioChunks.current.length > 0) {
-                        const audioBlob = new Blob(audioChunks.current, { type: 'audio/wav' });
+                        // 使用录音的真实格式（通常是WebM/Opus），服务端按此解码
+                        const audioBlob = new Blob(audioChunks.current, {
+                            type: mediaRecorder.current?.mimeType || audioChunks.current[0].type || 'audio/webm'
+                        });
                         await sendAudioToServer(audioBlob);
                     }
                 };
@@ -557,7 +624,7 @@ export default function VoiceChat() {
         }
     };
 
-    const playAudioResponse = async (audioBase64: string) => {
+    const playAudioResponse = async (audioBase64: string, audioFormat: string = 'mp3') => {
         try {
             // 如果用户禁用了语音回复，则不处理音频
             if (!enableVoiceResponse) {
@@ -574,7 +641,7 @@ export default function VoiceChat() {
             }
 
             // 创建音频Blob并添加到队列
-            const audioBlob = new Blob([uint8Array], { type: 'audio/mp3' });
+            const audioBlob = new Blob([uint8Array], { type: AUDIO_MIME_TYPES[audioFormat] || 'audio/mpeg' });
             const audioUrl = URL.createObjectURL(audioBlob);
 
             // 将音频添加到播放队列
@@ -591,6 +658,21 @@ export default function VoiceChat() {
         }
     };
 
+    // 音频以地址形式返回时（audioDelivery=url），直接把地址加入播放队列
+    const playAudioUrl = (audioUrl: string) => {
+        if (!enableVoiceResponse) {
+            console.log('语音回复已关闭，跳过音频播放');
+            return;
+        }
+        const fullUrl = audioUrl.startsWith('http') ? audioUrl : `${getApiBaseUrl()}${audioUrl}`;
+        setPendingAudios(prev => [...prev, fullUrl]);
+        if (document.body.hasAttribute('data-user-interacted') && !isAudioPlaying && pendingAudios.length === 0) {
+            setTimeout(() => {
+                playNextAudio();
+            }, 0);
+        }
+    };
+
     // 记录用户交互状态
     useEffect(() => {
         const markUserInteraction = () => {
@@ -614,14 +696,27 @@ export default function VoiceChat() {
         };
     }, []);
 
+    // 服务端会话参数：首次请求携带完整历史用于初始化会话，之后历史由服务端保存
+    const buildSessionParams = () => {
+        if (!activeConversationId) {
+            return { history: formatMessagesForAPI(messages) };
+        }
+        if (syncedSessions.current.has(activeConversationId)) {
+            return { sessionId: activeConversationId, history: [] };
+        }
+        syncedSessions.current.add(activeConversationId);
+        return { sessionId: activeConversationId, history: formatMessagesForAPI(messages) };
+    };
+
     // 创建公共的API请求参数构建函数
     const buildRequestParams = (text: string, voice?: string) => {
         const params: any = {
             text: text,
-            history: formatMessagesForAPI(messages),
+            ...buildSessionParams(),
             systemPrompt: systemPrompt,
             model: selectedModel,
-            enableVoiceResponse: enableVoiceResponse
+            enableVoiceResponse: enableVoiceResponse,
+            audioFormat: getPreferredAudioFormats()
         };
 
         // 如果启用了语音回复并选择了音色，添加音色参数
@@ -636,11 +731,18 @@ export default function VoiceChat() {
     // 创建公共的FormData构建函数
     const buildFormData = (audioBlob: Blob) => {
         const formData = new FormData();
-        formData.append('audio', audioBlob);
-        formData.append('history', JSON.stringify(formatMessagesForAPI(messages)));
+        // 文件扩展名与录音的真实格式一致，如 recording.webm
+        const extension = (audioBlob.type.split(';')[0].split('/')[1] || 'webm').replace('x-', '');
+        formData.append('audio', audioBlob, `recording.${extension}`);
+        const sessionParams = buildSessionParams();
+        formData.append('history', JSON.stringify(sessionParams.history));
+        if (sessionParams.sessionId) {
+            formData.append('sessionId', sessionParams.sessionId);
+        }
         formData.append('systemPrompt', systemPrompt);
         formData.append('model', selectedModel);
         formData.append('enableVoiceResponse', enableVoiceResponse.toString());
+        formData.append('audioFormat', getPreferredAudioFormats());
 
         // 添加音色参数
         if (selectedVoice) {
@@ -669,7 +771,9 @@ export default function VoiceChat() {
 
         console.log('收到SSE数据:', data);
 
-        if (data.type === 'recognition' && updateUserMessage) {
+        if (data.type === 'turn') {
+            currentTurnId.current = data.turnId;
+        } else if (data.type === 'recognition' && updateUserMessage) {
             console.log('收到用户语音识别结果:', data.content);
             // 更新用户消息
             setMessages(prev => {
@@ -697,18 +801,28 @@ export default function VoiceChat() {
                     return newMessages;
                 });
             }
+        } else if (data.type === 'audio' && data.url) {
+            playAudioUrl(data.url);
         } else if (data.type === 'audio') {
             // 处理音频回复
-            playAudioResponse(data.content);
+            playAudioResponse(data.content, data.format);
 
             // 保存音频数据到最近的助手消息中
             setMessages(prev => {
                 const newMessages = [...prev];
                 if (newMessages.length > 0 && newMessages[newMessages.length - 1].type === 'assistant') {
                     newMessages[newMessages.length - 1].audioData = data.content;
+                    newMessages[newMessages.length - 1].audioFormat = data.format;
                 }
                 return newMessages;
             });
+        } else if (data.type === 'audio_chunk') {
+            // 分句增量音频，按序号顺序到达，直接加入播放队列
+            if (data.url) {
+                playAudioUrl(data.url);
+            } else {
+                playAudioResponse(data.content, data.format);
+            }
         }
 
         return {
@@ -720,6 +834,7 @@ export default function VoiceChat() {
 
     // 使用上面的公共函数，优化handleStreamResponse
     const handleStreamResponse = async (url: string, body: any) => {
+        cancelCurrentTurn();
         try {
             setIsLoading(true);
             // 标记这是文本输入而非语音输入
@@ -924,7 +1039,9 @@ export default function VoiceChat() {
                             const data = JSON.parse(line.slice(6));
                             console.log('收到SSE数据:', data); // 调试日志
 
-                            if (data.type === 'text') {
+                            if (data.type === 'turn') {
+                                currentTurnId.current = data.turnId;
+                            } else if (data.type === 'text') {
                                 // 检查是否包含角色信息
                                 if (data.role === 'user') {
                                     console.log('收到用户语音识别结果:', data.content);
@@ -997,18 +1114,28 @@ export default function VoiceChat() {
                                 hasAddedAssistantMessage = true;
 
                                 scrollToBottom();
+                            } else if (data.type === 'audio' && data.url) {
+                                playAudioUrl(data.url);
                             } else if (data.type === 'audio') {
                                 console.log('收到音频数据，长度:', data.content.length);
-                                await playAudioResponse(data.content);
+                                await playAudioResponse(data.content, data.format);
 
                                 // 保存音频数据到最近的助手消息中
                                 setMessages(prev => {
                                     const newMessages = [...prev];
                                     if (newMessages.length > 0 && newMessages[newMessages.length - 1].type === 'assistant') {
                                         newMessages[newMessages.length - 1].audioData = data.content;
+                                        newMessages[newMessages.length - 1].audioFormat = data.format;
                                     }
                                     return newMessages;
                                 });
+                            } else if (data.type === 'audio_chunk') {
+                                // 分句增量音频，按序号顺序到达，直接加入播放队列
+                                if (data.url) {
+                                    playAudioUrl(data.url);
+                                } else {
+                                    await playAudioResponse(data.content, data.format);
+                                }
                             }
                         } catch (error) {
                             console.error('解析SSE数据时出错:', error, '原始数据:', line);
@@ -1291,7 +1418,7 @@ export default function VoiceChat() {
                                                         onClick={() => {
                                                             // 直接播放存储的音频数据
                                                             if (message.audioData) {
-                                                                playAudioResponse(message.audioData);
+                                                                playAudioResponse(message.audioData, message.audioFormat);
                                                             } else {
                                                                 // 如果消息没有存储音频数据（兼容旧消息），则重新生成
                                                                 const assistantIndex = messages.findIndex(m => m === message);